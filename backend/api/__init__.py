@@ -3,12 +3,14 @@ from .auth import router as auth_router
 from .playlist import router as playlist_router
 from .search import router as search_router
 from .brands import router as brands_router
+from .catalog import router as catalog_router
 
 # Export the routers
 auth = auth_router
 playlist = playlist_router
 search = search_router
 brands = brands_router
+catalog = catalog_router
 
 # Basic status endpoints for monitoring
 @auth.get("/status")
@@ -25,4 +27,8 @@ async def search_status():
 
 @brands.get("/status")
 async def brands_status():
+    return {"status": "operational"}
+
+@catalog.get("/status")
+async def catalog_status():
     return {"status": "operational"}
\ No newline at end of file
@@ -0,0 +1,204 @@
+"""
+Playlist and library statistics computed over columnar NumPy arrays.
+
+Track records are converted once into flat arrays (durations, popularity,
+explicit flags, added_at timestamps and integer codes for artists, albums
+and URIs); every statistic is then a vectorized reduction over them.
+"""
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+TOP_N = 10
+OVERLAP_CHUNK = 8192  # shared tracks per incidence-matrix block
+POPULARITY_BINS = np.arange(0, 101, 10)
+
+
+class TrackColumns:
+    """Columnar view of a list of track records."""
+
+    __slots__ = (
+        "uris", "duration_ms", "popularity", "explicit", "added_at", "playlist_index",
+        "artist_track_index", "artist_codes", "artist_names", "album_codes", "album_names",
+    )
+
+    @classmethod
+    def from_records(cls, records: Sequence, playlist_index: Optional[Sequence[int]] = None) -> "TrackColumns":
+        """Build from TrackRecords; interned artists/albums make the code lookup cheap"""
+        n = len(records)
+        uris = np.empty(n, dtype=object)
+        durations = np.empty(n, dtype=np.int64)
+        popularity = np.empty(n, dtype=np.int16)
+        explicit = np.empty(n, dtype=bool)
+        added_at = []
+        artist_track, artist_codes, artist_code_of, artist_names = [], [], {}, []
+        album_codes, album_code_of, album_names = np.empty(n, dtype=np.int64), {}, []
+
+        for i, record in enumerate(records):
+            uris[i] = record.uri
+            durations[i] = record.duration_ms
+            popularity[i] = -1 if record.popularity is None else record.popularity
+            explicit[i] = record.explicit
+            added_at.append((record.added_at or 'NaT').rstrip('Z'))
+            album = record.album
+            album_key = id(album)
+            code = album_code_of.get(album_key)
+            if code is None:
+                code = album_code_of[album_key] = len(album_names)
+                album_names.append(album.name if album is not None else '')
+            album_codes[i] = code
+            for artist in record.artists:
+                code = artist_code_of.get(id(artist))
+                if code is None:
+                    code = artist_code_of[id(artist)] = len(artist_names)
+                    artist_names.append(artist.name)
+                artist_track.append(i)
+                artist_codes.append(code)
+
+        cols = cls()
+        cols.uris = uris
+        cols.duration_ms = durations
+        cols.popularity = popularity
+        cols.explicit = explicit
+        cols.added_at = np.array(added_at, dtype='datetime64[s]')
+        cols.playlist_index = (
+            np.asarray(playlist_index, dtype=np.int32)
+            if playlist_index is not None else np.zeros(n, dtype=np.int32)
+        )
+        cols.artist_track_index = np.array(artist_track, dtype=np.int64)
+        cols.artist_codes = np.array(artist_codes, dtype=np.int64)
+        cols.artist_names = artist_names
+        cols.album_codes = album_codes
+        cols.album_names = album_names
+        return cols
+
+    def __len__(self) -> int:
+        return len(self.uris)
+
+
+def concentration(codes: np.ndarray, names: List[str], total: int) -> Dict:
+    """Top entries, distinct count and Herfindahl index of a categorical column"""
+    if total == 0 or codes.size == 0:
+        return {"distinct": 0, "hhi": 0.0, "top": []}
+    counts = np.bincount(codes, minlength=len(names))
+    shares = counts / counts.sum()
+    k = min(TOP_N, counts.size)
+    top = np.argpartition(-counts, k - 1)[:k]
+    top = top[np.argsort(-counts[top], kind='stable')]
+    return {
+        "distinct": int(np.count_nonzero(counts)),
+        "hhi": float(np.square(shares).sum()),
+        "top": [
+            {"name": names[i], "tracks": int(counts[i]), "share": round(float(counts[i]) / total, 4)}
+            for i in top if counts[i] > 0
+        ]
+    }
+
+
+def popularity_stats(popularity: np.ndarray) -> Dict:
+    known = popularity[popularity >= 0]
+    if known.size == 0:
+        return {"mean": None, "percentiles": {}, "histogram": []}
+    hist, edges = np.histogram(known, bins=POPULARITY_BINS)
+    p25, p50, p75, p90 = np.percentile(known, [25, 50, 75, 90])
+    return {
+        "mean": round(float(known.mean()), 2),
+        "percentiles": {"p25": float(p25), "p50": float(p50), "p75": float(p75), "p90": float(p90)},
+        "histogram": [
+            {"from": int(edges[i]), "to": int(edges[i + 1]), "tracks": int(hist[i])}
+            for i in range(hist.size)
+        ]
+    }
+
+
+def added_timeline(added_at: np.ndarray) -> List[Dict]:
+    """Tracks added per month"""
+    known = added_at[~np.isnat(added_at)]
+    if known.size == 0:
+        return []
+    months, counts = np.unique(known.astype('datetime64[M]'), return_counts=True)
+    return [{"month": str(m), "tracks": int(c)} for m, c in zip(months, counts)]
+
+
+def summarize(cols: TrackColumns) -> Dict:
+    """Duration, concentration, explicit, popularity and timeline stats"""
+    total = len(cols)
+    total_duration = int(cols.duration_ms.sum())
+    return {
+        "total_tracks": total,
+        "unique_tracks": int(np.unique(cols.uris).size) if total else 0,
+        "total_duration_ms": total_duration,
+        "avg_duration_ms": round(total_duration / total, 1) if total else 0.0,
+        "median_duration_ms": float(np.median(cols.duration_ms)) if total else 0.0,
+        "explicit_ratio": round(float(cols.explicit.mean()), 4) if total else 0.0,
+        "artists": concentration(cols.artist_codes, cols.artist_names, cols.artist_codes.size),
+        "albums": concentration(cols.album_codes, cols.album_names, total),
+        "popularity": popularity_stats(cols.popularity),
+        "added_timeline": added_timeline(cols.added_at)
+    }
+
+
+def per_playlist(cols: TrackColumns, playlist_ids: List[str]) -> List[Dict]:
+    """Track count and duration per playlist via bincount"""
+    n = len(playlist_ids)
+    counts = np.bincount(cols.playlist_index, minlength=n)
+    durations = np.bincount(cols.playlist_index, weights=cols.duration_ms, minlength=n)
+    explicit = np.bincount(cols.playlist_index, weights=cols.explicit, minlength=n)
+    return [
+        {
+            "playlist_id": playlist_ids[i],
+            "tracks": int(counts[i]),
+            "duration_ms": int(durations[i]),
+            "explicit_ratio": round(float(explicit[i] / counts[i]), 4) if counts[i] else 0.0
+        }
+        for i in range(n)
+    ]
+
+
+def overlap(cols: TrackColumns, playlist_ids: List[str], top_n: int = 20) -> List[Dict]:
+    """
+    Most overlapping playlist pairs by shared tracks.
+
+    Builds a playlist x shared-track incidence matrix in blocks and multiplies
+    it by its transpose, so only tracks present in two or more playlists cost
+    anything and no Python loop runs per track.
+    """
+    n = len(playlist_ids)
+    if n < 2 or len(cols) == 0:
+        return []
+    _, track_codes = np.unique(cols.uris, return_inverse=True)
+    # Unique (track, playlist) memberships
+    keys = np.unique(track_codes.astype(np.int64) * n + cols.playlist_index)
+    tracks, playlists = keys // n, keys % n
+    sizes = np.bincount(playlists, minlength=n)
+
+    per_track = np.bincount(tracks)
+    shared = per_track[tracks] >= 2
+    tracks, playlists = tracks[shared], playlists[shared]
+    if tracks.size == 0:
+        return []
+    _, shared_codes = np.unique(tracks, return_inverse=True)
+    num_shared = int(shared_codes.max()) + 1
+
+    intersections = np.zeros((n, n), dtype=np.float64)
+    for start in range(0, num_shared, OVERLAP_CHUNK):
+        mask = (shared_codes >= start) & (shared_codes < start + OVERLAP_CHUNK)
+        block = np.zeros((n, OVERLAP_CHUNK), dtype=np.float32)
+        block[playlists[mask], shared_codes[mask] - start] = 1.0
+        intersections += block @ block.T
+
+    rows, cols_idx = np.triu_indices(n, k=1)
+    inter = intersections[rows, cols_idx]
+    keep = inter > 0
+    rows, cols_idx, inter = rows[keep], cols_idx[keep], inter[keep]
+    union = sizes[rows] + sizes[cols_idx] - inter
+    jaccard = inter / union
+    order = np.argsort(-inter, kind='stable')[:top_n]
+    return [
+        {
+            "playlists": [playlist_ids[rows[i]], playlist_ids[cols_idx[i]]],
+            "shared_tracks": int(inter[i]),
+            "jaccard": round(float(jaccard[i]), 4)
+        }
+        for i in order
+    ]
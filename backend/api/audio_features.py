@@ -0,0 +1,186 @@
+"""
+Audio-features enrichment with a persistent local cache.
+
+Features for a track never change, so they are fetched once in batches of
+the API maximum and kept in SQLite. Consumers read them back as a compact
+float32 matrix (one row per track, columns in FEATURE_KEYS order).
+
+The upstream call is injected as an async `fetch(ids) -> list`, so the
+pipeline runs against a local fake API as easily as against Spotify.
+"""
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+import spotipy
+from starlette.concurrency import run_in_threadpool
+
+from .spotify_client import PRIORITY_BACKGROUND, call_spotify, chunked, spotify_context
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+FEATURE_KEYS = (
+    'danceability', 'energy', 'key', 'loudness', 'mode', 'speechiness',
+    'acousticness', 'instrumentalness', 'liveness', 'valence', 'tempo', 'time_signature',
+)
+FEATURE_INDEX = {key: i for i, key in enumerate(FEATURE_KEYS)}
+AUDIO_FEATURES_BATCH = 100  # max ids per audio-features request
+MISSING_RETRY_AFTER = 7 * 24 * 3600  # re-ask for tracks Spotify had no features for
+DEFAULT_DB_PATH = Path(__file__).parent.parent / "cache" / "audio_features.db"
+
+FeatureFetcher = Callable[[List[str]], Awaitable[List[Optional[Dict]]]]
+
+
+def track_id_from_uri(uri: str) -> Optional[str]:
+    """'spotify:track:<id>' -> '<id>'; local files and other types have no features"""
+    parts = uri.split(':')
+    if len(parts) == 3 and parts[1] == 'track' and parts[2]:
+        return parts[2]
+    return None
+
+
+class FeatureStore:
+    """SQLite-backed cache of feature vectors keyed by track id."""
+
+    def __init__(self, db_path: Path):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), timeout=10, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS audio_features (
+                track_id TEXT PRIMARY KEY,
+                vector BLOB,
+                fetched_at REAL NOT NULL
+            )
+            """
+        )
+
+    def get_many(self, track_ids: List[str]) -> Dict[str, Optional[np.ndarray]]:
+        """Known ids -> vector, or None when Spotify had no features recently"""
+        found: Dict[str, Optional[np.ndarray]] = {}
+        retry_before = time.time() - MISSING_RETRY_AFTER
+        with self._lock:
+            for chunk in chunked(track_ids, 500):
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT track_id, vector, fetched_at FROM audio_features WHERE track_id IN ({placeholders})",
+                    chunk,
+                ).fetchall()
+                for track_id, blob, fetched_at in rows:
+                    if blob is not None:
+                        found[track_id] = np.frombuffer(blob, dtype=np.float32)
+                    elif fetched_at > retry_before:
+                        found[track_id] = None
+        return found
+
+    def put_many(self, vectors: Dict[str, Optional[np.ndarray]]) -> None:
+        now = time.time()
+        rows = [
+            (track_id, vector.astype(np.float32).tobytes() if vector is not None else None, now)
+            for track_id, vector in vectors.items()
+        ]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO audio_features (track_id, vector, fetched_at) VALUES (?, ?, ?)",
+                rows,
+            )
+
+    def matrix(self, track_ids: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Features as a (len(track_ids), len(FEATURE_KEYS)) float32 matrix plus a
+        boolean mask of rows that have features; missing rows are zero.
+        """
+        known = self.get_many(list(set(track_ids)))
+        matrix = np.zeros((len(track_ids), len(FEATURE_KEYS)), dtype=np.float32)
+        mask = np.zeros(len(track_ids), dtype=bool)
+        for row, track_id in enumerate(track_ids):
+            vector = known.get(track_id)
+            if vector is not None:
+                matrix[row] = vector
+                mask[row] = True
+        return matrix, mask
+
+
+def to_vector(features: Dict) -> np.ndarray:
+    return np.array([features.get(key) or 0.0 for key in FEATURE_KEYS], dtype=np.float32)
+
+
+class FeatureEnricher:
+    """Fetches features for ids missing from the store, in API-sized batches."""
+
+    def __init__(self, store: FeatureStore, fetch: FeatureFetcher, batch_size: int = AUDIO_FEATURES_BATCH):
+        self.store = store
+        self.fetch = fetch
+        self.batch_size = batch_size
+
+    async def enrich(self, track_ids: Iterable[str]) -> Dict:
+        unique_ids = list(dict.fromkeys(track_ids))
+        cached = await run_in_threadpool(self.store.get_many, unique_ids)
+        missing = [track_id for track_id in unique_ids if track_id not in cached]
+        metrics.incr("audio_features.cache_hits", len(unique_ids) - len(missing))
+        metrics.incr("audio_features.cache_misses", len(missing))
+
+        fetched = unavailable = 0
+        for batch in chunked(missing, self.batch_size):
+            results = await self.fetch(batch) or []
+            by_id = {features['id']: features for features in results if features}
+            vectors = {track_id: (to_vector(by_id[track_id]) if track_id in by_id else None) for track_id in batch}
+            await run_in_threadpool(self.store.put_many, vectors)
+            fetched += len(by_id)
+            unavailable += len(batch) - len(by_id)
+            metrics.incr("audio_features.upstream_calls")
+
+        return {
+            "requested": len(unique_ids),
+            "cached": len(unique_ids) - len(missing),
+            "fetched": fetched,
+            "unavailable": unavailable
+        }
+
+
+def spotify_fetcher(sp: spotipy.Spotify) -> FeatureFetcher:
+    """Fetcher backed by the Spotify audio-features endpoint"""
+    async def fetch(track_ids: List[str]) -> List[Optional[Dict]]:
+        return await call_spotify(sp.audio_features, track_ids)
+    return fetch
+
+
+_store: Optional[FeatureStore] = None
+_background_tasks: Set[asyncio.Task] = set()
+
+
+def get_feature_store() -> FeatureStore:
+    global _store
+    if _store is None:
+        _store = FeatureStore(Path(os.getenv("AUDIO_FEATURES_DB", str(DEFAULT_DB_PATH))))
+    return _store
+
+
+def enrich_in_background(sp: spotipy.Spotify, track_ids: Iterable[str]) -> None:
+    """Warm the feature cache without holding up the request"""
+    enricher = FeatureEnricher(get_feature_store(), spotify_fetcher(sp))
+    track_ids = list(track_ids)
+
+    async def enrich() -> Dict:
+        with spotify_context(priority=PRIORITY_BACKGROUND):
+            return await enricher.enrich(track_ids)
+
+    task = asyncio.create_task(enrich())
+    _background_tasks.add(task)
+
+    def done(t: asyncio.Task) -> None:
+        _background_tasks.discard(t)
+        if not t.cancelled() and t.exception():
+            logger.warning(f"Background audio-features enrichment failed: {str(t.exception())}")
+
+    task.add_done_callback(done)
@@ -6,33 +6,65 @@ import logging
 import json
 import os
 import secrets
-from typing import Optional
+import time
+import asyncio
+from typing import Dict, Optional
+from starlette.concurrency import run_in_threadpool
 from datetime import datetime, timedelta
 from urllib.parse import urlencode
+from .session_store import get_store
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
-# Store states in memory (in production, use Redis or similar)
-active_states = {}
+# Store namespaces and lifetimes
+STATE_NAMESPACE = "oauth_state"
+TOKEN_NAMESPACE = "token"
+ACCESS_NAMESPACE = "access_token"
+VALIDATED_NAMESPACE = "validated_token"
+STATE_TTL = 600  # 10 minutes
+TOKEN_TTL = 30 * 24 * 3600  # refresh tokens outlive access tokens by far; access tokens are indexed only until they expire
+
+# Token refresh timing
+REFRESH_MARGIN = 60  # refresh inline when the token expires within this many seconds
+PROACTIVE_WINDOW = 300  # refresh in the background when the token expires within this window
+VALIDATED_TTL = 300  # how long to trust a token we hold no refresh token for
 
 def generate_state():
     """Generate a secure random state string"""
     state = secrets.token_urlsafe(32)
-    active_states[state] = datetime.now()
-    # Clean up old states
-    for s in list(active_states.keys()):
-        if (datetime.now() - active_states[s]).total_seconds() > 600:  # 10 minutes
-            del active_states[s]
+    # Shared store so the callback can land on any worker; expiry is handled by the store
+    get_store().set(STATE_NAMESPACE, state, {"created_at": datetime.now().timestamp()}, STATE_TTL)
     return state
 
 def validate_state(state: str) -> bool:
     """Validate the state parameter"""
-    if not state or state not in active_states:
+    if not state:
         return False
     # Remove used state
-    del active_states[state]
-    return True
+    return get_store().pop(STATE_NAMESPACE, state) is not None
+
+def save_token_info(user_id: str, token_info: Dict) -> None:
+    """
+    Store token info for a user and index its access token, so refresh can
+    happen server-side. Each access token stays indexed until it expires, so
+    a client still holding one that was refreshed in the background is served
+    with the current session until /auth/validate hands it the new token.
+    """
+    store = get_store()
+    store.set(TOKEN_NAMESPACE, user_id, {**token_info, "user_id": user_id}, TOKEN_TTL)
+    expires_in = token_info.get('expires_at', 0) - time.time()
+    if expires_in > 0:
+        store.set(ACCESS_NAMESPACE, token_info['access_token'], {"user_id": user_id}, expires_in)
+
+def get_token_info(user_id: str) -> Optional[Dict]:
+    """Get the latest stored token info for a user"""
+    return get_store().get(TOKEN_NAMESPACE, user_id)
+
+def get_user_id_for_token(access_token: str) -> Optional[str]:
+    """Look up which user an unexpired access token belongs to"""
+    entry = get_store().get(ACCESS_NAMESPACE, access_token)
+    return entry.get("user_id") if entry else None
 
 def get_auth_manager():
     """Create SpotifyOAuth manager with configured scopes"""
@@ -79,10 +111,134 @@ def validate_spotify_token(token: str) -> bool:
     except:
         return False
 
+def public_token_info(token_info: Dict) -> Dict:
+    """Token info as returned to a client that only presented an access token"""
+    return {k: v for k, v in token_info.items() if k not in ('user_id', 'refresh_token')}
+
+def holder_token_info(token_info: Dict) -> Dict:
+    """Token info for a client that proved it holds the refresh token, which may have been rotated"""
+    return {**public_token_info(token_info), 'refresh_token': token_info.get('refresh_token')}
+
+class TokenManager:
+    """
+    Keeps access tokens valid server-side using the stored expires_at.
+
+    Tokens close to expiry are refreshed in the background, refreshes for the
+    same user are coalesced into a single upstream call, and handlers get a
+    valid token without a validation round trip.
+    """
+
+    def __init__(self):
+        self._refreshing: Dict[str, asyncio.Task] = {}
+        self._scheduled: Dict[str, asyncio.TimerHandle] = {}
+
+    async def ensure_valid(self, access_token: str) -> Dict:
+        """Return {'access_token', 'user_id'} with a token valid for at least REFRESH_MARGIN"""
+        user_id = get_user_id_for_token(access_token)
+        token_info = get_token_info(user_id) if user_id else None
+        if not token_info:
+            return await self._validate_unmanaged(access_token)
+        # A token refreshed in the background resolves to the current session until it expires itself
+
+        remaining = token_info.get('expires_at', 0) - time.time()
+        if remaining <= REFRESH_MARGIN:
+            token_info = await self.refresh(user_id)
+        elif remaining <= PROACTIVE_WINDOW:
+            self.refresh_in_background(user_id)
+        else:
+            self._schedule_refresh(user_id, token_info['expires_at'])
+        return token_info
+
+    async def refresh(self, user_id: str, refresh_token: Optional[str] = None) -> Dict:
+        """Refresh a user's token, joining any refresh already in flight"""
+        task = self._refreshing.get(user_id)
+        if task is None:
+            task = asyncio.create_task(self._do_refresh(user_id, refresh_token))
+            self._refreshing[user_id] = task
+            task.add_done_callback(lambda _: self._refreshing.pop(user_id, None))
+        # Shield so a cancelled request doesn't cancel the refresh for everyone else
+        return await asyncio.shield(task)
+
+    def refresh_in_background(self, user_id: str) -> None:
+        if user_id in self._refreshing:
+            return
+        task = asyncio.create_task(self.refresh(user_id))
+        task.add_done_callback(self._log_background_failure)
+
+    def _log_background_failure(self, task: asyncio.Task) -> None:
+        if not task.cancelled() and task.exception():
+            logger.warning(f"Background token refresh failed: {str(task.exception())}")
+
+    def _schedule_refresh(self, user_id: str, expires_at: float) -> None:
+        if user_id in self._scheduled:
+            return
+        delay = max(0.0, expires_at - PROACTIVE_WINDOW - time.time())
+        loop = asyncio.get_running_loop()
+
+        def fire():
+            self._scheduled.pop(user_id, None)
+            self.refresh_in_background(user_id)
+
+        self._scheduled[user_id] = loop.call_later(delay, fire)
+
+    async def _do_refresh(self, user_id: str, refresh_token: Optional[str]) -> Dict:
+        current = get_token_info(user_id)
+        # Another worker may have refreshed already
+        if current and current.get('expires_at', 0) - time.time() > PROACTIVE_WINDOW:
+            return current
+
+        refresh_token = refresh_token or (current or {}).get('refresh_token')
+        if not refresh_token:
+            raise HTTPException(status_code=401, detail="No refresh token available")
+
+        auth_manager = get_auth_manager()
+        try:
+            new_token_info = await run_in_threadpool(auth_manager.refresh_access_token, refresh_token)
+        except Exception as e:
+            logger.error(f"Error refreshing token for user {user_id}: {str(e)}")
+            raise HTTPException(status_code=401, detail="Failed to refresh token")
+        if not new_token_info or not new_token_info.get('access_token'):
+            raise HTTPException(status_code=401, detail="Failed to refresh token")
+
+        # Spotify doesn't always rotate the refresh token
+        new_token_info.setdefault('refresh_token', refresh_token)
+        new_token_info['expires_at'] = int(time.time() + new_token_info['expires_in'])
+        save_token_info(user_id, new_token_info)
+
+        # The next request re-arms the schedule, so idle users stop being refreshed
+        handle = self._scheduled.pop(user_id, None)
+        if handle:
+            handle.cancel()
+        logger.info(f"Refreshed token for user {user_id}")
+        return {**new_token_info, 'user_id': user_id}
+
+    async def _validate_unmanaged(self, access_token: str) -> Dict:
+        """Tokens issued before the store existed: validate once, then trust briefly"""
+        store = get_store()
+        cached = store.get(VALIDATED_NAMESPACE, access_token)
+        if cached:
+            return {'access_token': access_token, 'user_id': cached['user_id']}
+        try:
+            user = await run_in_threadpool(spotipy.Spotify(auth=access_token).me)
+        except Exception as e:
+            logger.error(f"Error validating token with Spotify API: {str(e)}")
+            raise HTTPException(status_code=401, detail="Invalid or expired token")
+        store.set(VALIDATED_NAMESPACE, access_token, {'user_id': user['id']}, VALIDATED_TTL)
+        return {'access_token': access_token, 'user_id': user['id']}
+
+token_manager = TokenManager()
+
+async def bind_token_info(token_info: Dict) -> Dict:
+    """Register token info we have no user for yet (one profile lookup)"""
+    user = await run_in_threadpool(spotipy.Spotify(auth=token_info['access_token']).me)
+    save_token_info(user['id'], token_info)
+    return {**token_info, 'user_id': user['id']}
+
 async def validate_token_string(token: str) -> bool:
     """Helper function to validate just the token string"""
     try:
-        return validate_spotify_token(token)
+        await token_manager.ensure_valid(token)
+        return True
     except Exception as e:
         logger.error(f"Error validating token string: {str(e)}")
         return False
@@ -119,9 +275,12 @@ async def callback(code: str, state: Optional[str] = None):
         # Add expiration timestamp
         token_info['expires_at'] = int(datetime.now().timestamp() + token_info['expires_in'])
         
-        # Validate token works
-        if not validate_spotify_token(token_info['access_token']):
+        # Validate token works and remember who it belongs to
+        try:
+            user = spotipy.Spotify(auth=token_info['access_token']).me()
+        except Exception:
             raise ValueError("Invalid token received from Spotify")
+        save_token_info(user['id'], token_info)
         
         logger.info("Successfully obtained and validated token with all required scopes")
         return {"token_info": token_info}
@@ -142,11 +301,18 @@ async def validate_token(request: Request):
         if not token:
             return JSONResponse(status_code=401, content={"valid": False, "error": "Invalid token format"})
         
-        # First try to validate the token directly
-        if validate_spotify_token(token):
-            return {"valid": True}
+        # Known tokens are checked against the stored expiry, no upstream call
+        try:
+            session = await token_manager.ensure_valid(token)
+            response = {"valid": True}
+            if session['access_token'] != token:
+                # Refreshed server-side, hand the new token to the client
+                response["token_info"] = public_token_info(session)
+            return response
+        except HTTPException:
+            pass
             
-        # If direct validation fails, try to refresh using the token info from request body
+        # Fall back to the token info from the request body
         try:
             body = await request.json()
             token_info = body.get('token_info', {})
@@ -154,12 +320,13 @@ async def validate_token(request: Request):
                 return {"valid": False, "error": "No refresh token available"}
                 
             auth_manager = get_auth_manager()
-            new_token_info = auth_manager.refresh_access_token(token_info['refresh_token'])
+            new_token_info = await run_in_threadpool(auth_manager.refresh_access_token, token_info['refresh_token'])
             
-            if new_token_info and validate_spotify_token(new_token_info['access_token']):
-                # Add expiration timestamp
-                new_token_info['expires_at'] = int(datetime.now().timestamp() + new_token_info['expires_in'])
-                return {"valid": True, "token_info": new_token_info}
+            if new_token_info and new_token_info.get('access_token'):
+                new_token_info.setdefault('refresh_token', token_info['refresh_token'])
+                new_token_info['expires_at'] = int(time.time() + new_token_info['expires_in'])
+                session = await bind_token_info(new_token_info)
+                return {"valid": True, "token_info": holder_token_info(session)}
         except:
             pass
             
@@ -181,28 +348,36 @@ async def refresh_token(request: Request):
         if not current_token:
             raise HTTPException(status_code=401, detail="Invalid token format")
             
-        # Get refresh token from request body
+        # Get refresh token from request body; the caller must prove it holds it
         body = await request.json()
         refresh_token = body.get('refresh_token')
         if not refresh_token:
             raise HTTPException(status_code=400, detail="No refresh token provided")
+
+        # Known users are refreshed through the token manager, coalesced with background refreshes
+        user_id = get_user_id_for_token(current_token)
+        if user_id:
+            stored = get_token_info(user_id) or {}
+            if not secrets.compare_digest(stored.get('refresh_token') or '', refresh_token):
+                raise HTTPException(status_code=401, detail="Refresh token does not match")
+            new_token_info = await token_manager.refresh(user_id)
+            return holder_token_info(new_token_info)
             
         auth_manager = get_auth_manager()
         
         # Try to refresh the token
         try:
-            new_token_info = auth_manager.refresh_access_token(refresh_token)
+            new_token_info = await run_in_threadpool(auth_manager.refresh_access_token, refresh_token)
             if not new_token_info or not new_token_info.get('access_token'):
                 raise ValueError("Failed to refresh token")
                 
-            # Validate new token works
-            if not validate_spotify_token(new_token_info['access_token']):
-                raise ValueError("Invalid token received from refresh")
-                
             # Add expiration timestamp
-            new_token_info['expires_at'] = int(datetime.now().timestamp() + new_token_info['expires_in'])
+            new_token_info.setdefault('refresh_token', refresh_token)
+            new_token_info['expires_at'] = int(time.time() + new_token_info['expires_in'])
             
-            return new_token_info
+            # Binding the token to its user also proves it works
+            session = await bind_token_info(new_token_info)
+            return holder_token_info(session)
         except Exception as e:
             logger.error(f"Error refreshing token: {str(e)}")
             raise HTTPException(status_code=401, detail="Failed to refresh token")
@@ -211,4 +386,4 @@ async def refresh_token(request: Request):
         raise
     except Exception as e:
         logger.error(f"Error in refresh endpoint: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,230 @@
+"""
+Brand-fit scoring of candidate tracks.
+
+Each track gets a score in [0, 1] combining:
+- genre fit: the track's artist genres matched against the hitcraft genres
+  most similar to the brand's description
+- audio fit: cached audio features against targets derived from the brand's
+  emotional and aesthetic vocabulary
+- text fit: similarity of the track's name, artists, genres and suggestion
+  reason to the brand's aesthetic pillars and emotional attributes
+
+Texts are embedded as hashed bag-of-words vectors, so everything reduces
+to a few matrix products over all candidates at once.
+"""
+import logging
+import re
+import zlib
+from functools import lru_cache
+from typing import Dict, List, Sequence
+
+import numpy as np
+import spotipy
+
+from .audio_features import FEATURE_INDEX, get_feature_store, track_id_from_uri
+from .cache import TTLCache
+from .catalog import get_catalog
+from .spotify_client import call_spotify, chunked
+
+logger = logging.getLogger(__name__)
+
+HASH_DIM = 2048
+ARTISTS_BATCH = 50  # max ids per artists request
+WEIGHTS = {"genre": 0.35, "audio": 0.35, "text": 0.30}
+NEUTRAL_SCORE = 0.5
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset(
+    "a an and are as at be by for from in into is it its of on or that the their this to with yet "
+    "often typically known features feature music sound genre".split()
+)
+
+# Audio targets implied by brand vocabulary (features are all in 0..1)
+AUDIO_TARGET_KEYS = ('energy', 'valence', 'danceability', 'acousticness')
+AUDIO_LEXICON = {
+    "bold": {"energy": 0.8},
+    "daring": {"energy": 0.8, "valence": 0.6},
+    "empowered": {"energy": 0.75, "valence": 0.65},
+    "energetic": {"energy": 0.85, "danceability": 0.7},
+    "playful": {"valence": 0.75, "danceability": 0.7},
+    "joyful": {"valence": 0.85},
+    "romantic": {"energy": 0.45, "valence": 0.6, "acousticness": 0.5},
+    "sophisticated": {"energy": 0.5, "acousticness": 0.45},
+    "elegant": {"energy": 0.45, "acousticness": 0.55},
+    "refined": {"energy": 0.45, "acousticness": 0.5},
+    "calm": {"energy": 0.3, "acousticness": 0.7},
+    "serene": {"energy": 0.25, "acousticness": 0.75},
+    "minimal": {"energy": 0.4, "danceability": 0.5},
+    "luxurious": {"energy": 0.5, "acousticness": 0.4},
+    "street": {"energy": 0.75, "danceability": 0.8},
+    "rebellion": {"energy": 0.85, "valence": 0.45},
+    "irreverence": {"energy": 0.75, "valence": 0.6},
+    "maximalist": {"energy": 0.75, "danceability": 0.65},
+    "melancholic": {"valence": 0.25},
+    "warm": {"valence": 0.65, "acousticness": 0.6},
+}
+
+artist_genre_cache = TTLCache(maxsize=20000, ttl=24 * 3600)
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+
+def text_matrix(texts: Sequence[str]) -> np.ndarray:
+    """L2-normalized hashed bag-of-words vectors, one row per text"""
+    rows, cols = [], []
+    for row, text in enumerate(texts):
+        for token in tokenize(text):
+            rows.append(row)
+            cols.append(zlib.crc32(token.encode()) % HASH_DIM)
+    matrix = np.zeros((len(texts), HASH_DIM), dtype=np.float32)
+    np.add.at(matrix, (np.array(rows, dtype=np.int64), np.array(cols, dtype=np.int64)), 1.0)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-9)
+
+
+def load_hitcraft_genres() -> List[Dict]:
+    return get_catalog().genres
+
+
+@lru_cache(maxsize=1)
+def genre_matrices():
+    """(name vectors, description vectors) for the hitcraft genres"""
+    genres = load_hitcraft_genres()
+    names = text_matrix([f"{g['name']} {g.get('category', '')}" for g in genres])
+    descriptions = text_matrix([f"{g['name']} {g.get('category', '')} {g.get('description', '')}" for g in genres])
+    return names, descriptions
+
+
+def brand_texts(brand_profile: Dict):
+    """(whole-brand text, attribute text) used for genre and text fit"""
+    essence = brand_profile.get("brand_essence", {})
+    pillars = brand_profile.get("aesthetic_pillars", {})
+    attributes = " ".join(
+        pillars.get("visual_language", [])
+        + pillars.get("emotional_attributes", [])
+        + pillars.get("signature_elements", [])
+    )
+    whole = " ".join([
+        essence.get("core_identity", ""),
+        essence.get("brand_voice", ""),
+        attributes,
+        " ".join(brand_profile.get("brand_expressions", {}).get("tone", []))
+    ])
+    return whole, attributes
+
+
+def audio_targets(brand_profile: Dict) -> np.ndarray:
+    """Mean lexicon targets over the brand's attribute words, 0.5 where nothing matched"""
+    _, attributes = brand_texts(brand_profile)
+    sums = np.zeros(len(AUDIO_TARGET_KEYS), dtype=np.float32)
+    counts = np.zeros(len(AUDIO_TARGET_KEYS), dtype=np.float32)
+    for token in tokenize(attributes):
+        for word, targets in AUDIO_LEXICON.items():
+            if token.startswith(word[:6]):
+                for key, value in targets.items():
+                    i = AUDIO_TARGET_KEYS.index(key)
+                    sums[i] += value
+                    counts[i] += 1
+    return np.where(counts > 0, sums / np.maximum(counts, 1), NEUTRAL_SCORE).astype(np.float32)
+
+
+class BrandScorer:
+    """Scores candidate tracks for one brand profile."""
+
+    def __init__(self, brand_profile: Dict):
+        whole, attributes = brand_texts(brand_profile)
+        brand_vectors = text_matrix([whole, attributes])
+        self.brand_vector, self.attribute_vector = brand_vectors[0], brand_vectors[1]
+        self.genre_names, genre_descriptions = genre_matrices()
+        affinity = np.clip(genre_descriptions @ self.brand_vector, 0, None)
+        self.genre_affinity = affinity / affinity.max() if affinity.size and affinity.max() > 0 else affinity
+        self.audio_target = audio_targets(brand_profile)
+        self.audio_columns = [FEATURE_INDEX[key] for key in AUDIO_TARGET_KEYS]
+
+    def score(self, candidates: List[Dict]) -> Dict[str, np.ndarray]:
+        """
+        Candidates are dicts with uri, name, artists (names), genres and an
+        optional reason. Returns component and total score arrays.
+        """
+        n = len(candidates)
+        if n == 0:
+            empty = np.zeros(0, dtype=np.float32)
+            return {"genre": empty, "audio": empty, "text": empty, "total": empty}
+
+        genre_texts = [" ".join(c.get("genres", [])) for c in candidates]
+        genre_vectors = text_matrix(genre_texts)
+        if self.genre_affinity.size:
+            genre_score = (genre_vectors @ self.genre_names.T * self.genre_affinity).max(axis=1)
+        else:
+            genre_score = np.zeros(n, dtype=np.float32)
+        has_genres = np.array([bool(t) for t in genre_texts])
+        genre_score = np.where(has_genres, genre_score, NEUTRAL_SCORE * 0.5)
+
+        track_ids = [track_id_from_uri(c.get("uri", "")) or "" for c in candidates]
+        features, mask = get_feature_store().matrix(track_ids)
+        distance = np.abs(features[:, self.audio_columns] - self.audio_target).mean(axis=1)
+        audio_score = np.where(mask, 1.0 - distance, NEUTRAL_SCORE)
+
+        track_texts = [
+            " ".join([c.get("name", ""), " ".join(c.get("artists", [])), genre_texts[i], c.get("reason", "")])
+            for i, c in enumerate(candidates)
+        ]
+        text_score = np.clip(text_matrix(track_texts) @ self.attribute_vector, 0, 1)
+
+        total = (
+            WEIGHTS["genre"] * genre_score
+            + WEIGHTS["audio"] * audio_score
+            + WEIGHTS["text"] * text_score
+        )
+        return {
+            "genre": genre_score.astype(np.float32),
+            "audio": audio_score.astype(np.float32),
+            "text": text_score.astype(np.float32),
+            "total": total.astype(np.float32)
+        }
+
+    def rank(self, candidates: List[Dict]) -> List[int]:
+        """Candidate indices, best fit first"""
+        return list(np.argsort(-self.score(candidates)["total"], kind='stable'))
+
+
+async def fetch_artist_genres(sp: spotipy.Spotify, artist_ids: List[str]) -> Dict[str, List[str]]:
+    """Artist genres in batches of 50, cached for a day"""
+    genres: Dict[str, List[str]] = {}
+    missing = []
+    for artist_id in dict.fromkeys(artist_ids):
+        cached = artist_genre_cache.get(artist_id)
+        if cached is None:
+            missing.append(artist_id)
+        else:
+            genres[artist_id] = cached
+    for batch in chunked(missing, ARTISTS_BATCH):
+        try:
+            response = await call_spotify(sp.artists, batch)
+        except Exception as e:
+            logger.warning(f"Error fetching artist genres: {str(e)}")
+            continue
+        for artist in response.get('artists', []):
+            if artist:
+                genres[artist['id']] = artist.get('genres', [])
+                artist_genre_cache.set(artist['id'], genres[artist['id']])
+    return genres
+
+
+async def build_candidates(sp: spotipy.Spotify, tracks: List[Dict], reasons: Dict[str, str] = None) -> List[Dict]:
+    """Turn Spotify track objects into scoring candidates, adding artist genres"""
+    reasons = reasons or {}
+    artist_ids = [a['id'] for t in tracks for a in t.get('artists', []) if a.get('id')]
+    genres = await fetch_artist_genres(sp, artist_ids)
+    return [
+        {
+            "uri": t.get('uri', ''),
+            "name": t.get('name', ''),
+            "artists": [a.get('name', '') for a in t.get('artists', [])],
+            "genres": [g for a in t.get('artists', []) for g in genres.get(a.get('id'), [])],
+            "reason": reasons.get(t.get('uri', ''), '')
+        }
+        for t in tracks
+    ]
@@ -0,0 +1,313 @@
+"""
+Storage for brand profiles: non-blocking, atomic and versioned.
+
+Profiles stay plain `<brand_id>.json` files. Writes go to a temporary file
+that is fsynced and renamed over the profile, under a per-brand lock that
+holds across workers (flock), so readers never see a half-written profile
+and concurrent writers can't interleave.
+
+Every write also appends the new profile to `history/<brand_id>.jsonl`.
+The line number is the profile's version, which makes rollback a matter of
+re-writing an old entry. ETags are content hashes, so optimistic
+concurrency (If-Match) works for profiles written before versioning too.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+import aiofiles
+import aiofiles.os
+from fastapi import HTTPException
+
+try:
+    import fcntl
+except ImportError:  # not on Windows; the in-process lock still applies
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+BRAND_PROFILES_DIR = Path(__file__).parent.parent / "data" / "brand_profiles"
+HISTORY_DIR_NAME = "history"
+LOCK_TIMEOUT = 10  # seconds to wait for another worker's write
+LOCK_POLL_INTERVAL = 0.02
+HISTORY_TAIL_BLOCK = 8192  # bytes read from the end of a history file per step
+
+
+class BrandStoreError(Exception):
+    pass
+
+
+class BrandNotFound(BrandStoreError):
+    def __init__(self, brand_id: str):
+        super().__init__(f"Brand not found: {brand_id}")
+
+
+class BrandExists(BrandStoreError):
+    def __init__(self, brand_id: str):
+        super().__init__(f"Brand exists: {brand_id}")
+
+
+class VersionConflict(BrandStoreError):
+    def __init__(self, brand_id: str, etag: Optional[str]):
+        super().__init__(f"Brand {brand_id} has changed (current ETag {etag})")
+        self.etag = etag
+
+
+class InvalidBrandId(BrandStoreError):
+    def __init__(self, brand_id: str):
+        super().__init__(f"Invalid brand id: {brand_id!r}")
+
+
+def http_error(exc: BrandStoreError) -> HTTPException:
+    if isinstance(exc, BrandNotFound):
+        return HTTPException(status_code=404, detail=str(exc))
+    if isinstance(exc, BrandExists):
+        return HTTPException(status_code=400, detail=str(exc))
+    if isinstance(exc, VersionConflict):
+        headers = {"ETag": exc.etag} if exc.etag else None
+        return HTTPException(status_code=412, detail=str(exc), headers=headers)
+    return HTTPException(status_code=400, detail=str(exc))
+
+
+def brand_id_for(name: str) -> str:
+    return name.lower().replace(" ", "_")
+
+
+def encode_profile(profile: Dict) -> bytes:
+    return json.dumps(profile, indent=2).encode("utf-8")
+
+
+def etag_for(data: bytes) -> str:
+    return '"' + hashlib.sha256(data).hexdigest()[:20] + '"'
+
+
+class BrandStore:
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self.history_dir = self.root / HISTORY_DIR_NAME
+        self._locks: Dict[str, asyncio.Lock] = {}
+        # brand_id -> (mtime_ns, size, profile, etag); re-read only when the file changes
+        self._cache: Dict[str, Tuple[int, int, Dict, str]] = {}
+
+    def _path(self, brand_id: str) -> Path:
+        if not brand_id or brand_id.startswith(".") or "/" in brand_id or "\\" in brand_id:
+            raise InvalidBrandId(brand_id)
+        return self.root / f"{brand_id}.json"
+
+    def _history_path(self, brand_id: str) -> Path:
+        return self.history_dir / f"{brand_id}.jsonl"
+
+    # Reads
+
+    async def read(self, brand_id: str) -> Tuple[Dict, str]:
+        """(profile, etag)"""
+        path = self._path(brand_id)
+        try:
+            stat = await aiofiles.os.stat(path)
+        except FileNotFoundError:
+            raise BrandNotFound(brand_id)
+        cached = self._cache.get(brand_id)
+        if cached and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+            return cached[2], cached[3]
+        try:
+            async with aiofiles.open(path, "rb") as f:
+                data = await f.read()
+        except FileNotFoundError:
+            raise BrandNotFound(brand_id)
+        profile, etag = json.loads(data), etag_for(data)
+        self._cache[brand_id] = (stat.st_mtime_ns, stat.st_size, profile, etag)
+        return profile, etag
+
+    async def get(self, brand_id: str) -> Dict:
+        profile, _ = await self.read(brand_id)
+        return profile
+
+    async def list(self) -> List[Tuple[str, Dict]]:
+        if not await aiofiles.os.path.isdir(self.root):
+            return []
+        names = sorted(name for name in await aiofiles.os.listdir(self.root) if name.endswith(".json"))
+        brand_ids = [name[:-len(".json")] for name in names]
+        results = await asyncio.gather(*(self.read(b) for b in brand_ids), return_exceptions=True)
+        brands = []
+        for brand_id, result in zip(brand_ids, results):
+            if isinstance(result, BaseException):
+                logger.warning(f"Skipping unreadable brand profile {brand_id}: {str(result)}")
+                continue
+            brands.append((brand_id, result[0]))
+        return brands
+
+    async def history(self, brand_id: str) -> List[Dict]:
+        """Version metadata, oldest first (profiles left out)"""
+        return [
+            {k: v for k, v in entry.items() if k != "profile"}
+            for entry in await self._read_history(brand_id)
+        ]
+
+    # Writes
+
+    async def create(self, profile: Dict) -> Dict:
+        brand_id = brand_id_for(profile["brand"])
+        async with self._locked(brand_id):
+            if await aiofiles.os.path.exists(self._path(brand_id)):
+                raise BrandExists(brand_id)
+            return await self._write(brand_id, profile, "create")
+
+    async def update(self, brand_id: str, profile: Dict, if_match: Optional[str] = None) -> Dict:
+        async with self._locked(brand_id):
+            await self._check_current(brand_id, if_match)
+            return await self._write(brand_id, profile, "update")
+
+    async def delete(self, brand_id: str, if_match: Optional[str] = None) -> Dict:
+        async with self._locked(brand_id):
+            await self._check_current(brand_id, if_match)
+            await self._ensure_baseline(brand_id)
+            await aiofiles.os.remove(self._path(brand_id))
+            self._cache.pop(brand_id, None)
+            return await self._append_history(brand_id, "delete", None, None)
+
+    async def rollback(self, brand_id: str, version: int, if_match: Optional[str] = None) -> Dict:
+        """Write the profile of an earlier version as a new version (also restores deleted brands)"""
+        async with self._locked(brand_id):
+            entries = await self._read_history(brand_id)
+            target = next((e for e in entries if e["version"] == version), None)
+            if target is None or target.get("profile") is None:
+                raise BrandStoreError(f"No restorable version {version} for brand {brand_id}")
+            if await aiofiles.os.path.exists(self._path(brand_id)):
+                await self._check_current(brand_id, if_match)
+            return await self._write(brand_id, target["profile"], f"rollback:{version}")
+
+    async def put(self, profile: Dict, overwrite: bool) -> Dict:
+        """Create, or replace when overwrite is set; used by bulk import"""
+        brand_id = brand_id_for(profile["brand"])
+        async with self._locked(brand_id):
+            exists = await aiofiles.os.path.exists(self._path(brand_id))
+            if exists and not overwrite:
+                raise BrandExists(brand_id)
+            return await self._write(brand_id, profile, "import")
+
+    # Internals
+
+    async def _check_current(self, brand_id: str, if_match: Optional[str]) -> None:
+        _, etag = await self.read(brand_id)
+        if if_match and if_match != "*" and etag not in (t.strip() for t in if_match.split(",")):
+            raise VersionConflict(brand_id, etag)
+
+    async def _write(self, brand_id: str, profile: Dict, action: str) -> Dict:
+        path = self._path(brand_id)
+        data = encode_profile(profile)
+        await aiofiles.os.makedirs(self.root, exist_ok=True)
+        await self._ensure_baseline(brand_id)
+
+        tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+        try:
+            async with aiofiles.open(tmp, "wb") as f:
+                await f.write(data)
+                await f.flush()
+                await aiofiles.os.wrap(os.fsync)(f.fileno())
+            await aiofiles.os.replace(tmp, path)
+        except BaseException:
+            try:
+                await aiofiles.os.remove(tmp)
+            except FileNotFoundError:
+                pass
+            raise
+        self._cache.pop(brand_id, None)
+        return await self._append_history(brand_id, action, profile, etag_for(data))
+
+    async def _ensure_baseline(self, brand_id: str) -> None:
+        """Profiles from before versioning get their current content recorded as version 1"""
+        if await self._last_history_entry(brand_id) is not None:
+            return
+        try:
+            profile, etag = await self.read(brand_id)
+        except BrandNotFound:
+            return
+        await self._append_history(brand_id, "baseline", profile, etag)
+
+    async def _append_history(self, brand_id: str, action: str, profile: Optional[Dict], etag: Optional[str]) -> Dict:
+        last = await self._last_history_entry(brand_id)
+        entry = {
+            "version": (last["version"] if last else 0) + 1,
+            "action": action,
+            "etag": etag,
+            "saved_at": datetime.now().isoformat(),
+            "profile": profile
+        }
+        await aiofiles.os.makedirs(self.history_dir, exist_ok=True)
+        async with aiofiles.open(self._history_path(brand_id), "a", encoding="utf-8") as f:
+            await f.write(json.dumps(entry) + "\n")
+            await f.flush()
+            await aiofiles.os.wrap(os.fsync)(f.fileno())
+        return {"brand_id": brand_id, "version": entry["version"], "etag": etag, "action": action}
+
+    async def _read_history(self, brand_id: str) -> List[Dict]:
+        try:
+            async with aiofiles.open(self._history_path(brand_id), "r", encoding="utf-8") as f:
+                return [json.loads(line) async for line in f if line.strip()]
+        except FileNotFoundError:
+            return []
+
+    async def _last_history_entry(self, brand_id: str) -> Optional[Dict]:
+        """Read backwards from the end so appends stay cheap however long the history gets"""
+        try:
+            async with aiofiles.open(self._history_path(brand_id), "rb") as f:
+                end = await f.seek(0, os.SEEK_END)
+                tail = b""
+                position = end
+                while position > 0:
+                    step = min(HISTORY_TAIL_BLOCK, position)
+                    position -= step
+                    await f.seek(position)
+                    tail = await f.read(step) + tail
+                    lines = tail.rstrip(b"\n").split(b"\n")
+                    if len(lines) > 1 or position == 0:
+                        return json.loads(lines[-1]) if lines[-1] else None
+                return None
+        except FileNotFoundError:
+            return None
+
+    @asynccontextmanager
+    async def _locked(self, brand_id: str) -> AsyncIterator[None]:
+        """Per-brand lock: an asyncio.Lock within the worker, flock across workers"""
+        self._path(brand_id)  # validate before touching the filesystem
+        lock = self._locks.setdefault(brand_id, asyncio.Lock())
+        async with lock:
+            if fcntl is None:
+                yield
+                return
+            await aiofiles.os.makedirs(self.history_dir, exist_ok=True)
+            fd = os.open(str(self.history_dir / f"{brand_id}.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                deadline = time.monotonic() + LOCK_TIMEOUT
+                while True:
+                    try:
+                        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                        break
+                    except BlockingIOError:
+                        if time.monotonic() > deadline:
+                            raise BrandStoreError(f"Timed out waiting to write brand {brand_id}")
+                        await asyncio.sleep(LOCK_POLL_INTERVAL)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+            finally:
+                os.close(fd)
+
+
+_store: Optional[BrandStore] = None
+
+
+def get_brand_store() -> BrandStore:
+    global _store
+    if _store is None:
+        _store = BrandStore(BRAND_PROFILES_DIR)
+    return _store
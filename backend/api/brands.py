@@ -1,81 +1,208 @@
-from fastapi import APIRouter, HTTPException, Header
-from typing import Dict, List
-import json
-import os
-from pathlib import Path
+from fastapi import APIRouter, HTTPException, Header, Response
+from typing import Dict, List, Optional, Tuple
+import asyncio
 import logging
-import random
 
+import numpy as np
 import spotipy
 from spotipy.oauth2 import SpotifyOAuth
 from dotenv import load_dotenv
-
-# For Anthropic
-from anthropic import Anthropic, HUMAN_PROMPT, AI_PROMPT
+from .auth import token_manager
+from .audio_features import FeatureEnricher, get_feature_store, spotify_fetcher, track_id_from_uri
+from .brand_scoring import BrandScorer, build_candidates
+from .brand_store import BrandStoreError, get_brand_store, http_error
+from .dedupe import unique_tracks
+from .metrics import StageTimer
+from .spotify_client import PlaylistWriter, call_spotify, chunked, spotify_user
+
+from .circuit_breaker import CircuitOpenError, unavailable, with_stale_fallback
+from .llm_gateway import (
+    PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, GatewayBusy, anthropic_breaker, busy, get_gateway,
+)
 
 load_dotenv()
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-BRAND_PROFILES_DIR = Path(__file__).parent.parent / "data" / "brand_profiles"
+IMPORT_CONCURRENCY = 8  # profiles written at once by a bulk import
+TRACKS_BATCH = 50  # max ids per tracks request
+SEARCH_CONCURRENCY = 8  # suggestion searches in flight at once
+PLAYLISTS_PAGE_SIZE = 50  # max playlists per current_user_playlists page
+SUGGESTION_MAX_TOKENS = 1500
+
+async def enrich_features(sp: spotipy.Spotify, tracks: List[Dict]) -> None:
+    """Make sure audio features for these tracks are in the cache before scoring"""
+    track_ids = [track_id for track_id in (track_id_from_uri(t.get('uri', '')) for t in tracks) if track_id]
+    try:
+        await FeatureEnricher(get_feature_store(), spotify_fetcher(sp)).enrich(track_ids)
+    except Exception as e:
+        # Scoring falls back to neutral audio fit
+        logger.warning(f"Error enriching audio features: {str(e)}")
+
+async def rank_tracks(sp: spotipy.Spotify, scorer: BrandScorer, tracks: List[Dict], reasons: Dict[str, str] = None) -> List[Dict]:
+    """Tracks ordered by brand fit, features enriched first"""
+    await enrich_features(sp, tracks)
+    candidates = await build_candidates(sp, tracks, reasons)
+    return [tracks[i] for i in scorer.rank(candidates)]
+
+async def find_playlist_by_name(sp: spotipy.Spotify, name: str) -> Optional[Dict]:
+    offset = 0
+    while True:
+        playlists = await call_spotify(sp.current_user_playlists, limit=PLAYLISTS_PAGE_SIZE, offset=offset)
+        for pl in playlists['items']:
+            if pl['name'] == name:
+                logger.info(f"Found existing playlist: {pl['id']}")
+                return pl
+        if not playlists['next']:
+            return None
+        offset += PLAYLISTS_PAGE_SIZE
+
+async def fetch_current_tracks(sp: spotipy.Spotify, playlist_id: str) -> List[Dict]:
+    tracks = []
+    results = await call_spotify(sp.playlist_items, playlist_id, additional_types=['track'])
+    while results:
+        tracks.extend(item['track'] for item in results['items'] if item['track'])
+        results = await call_spotify(sp.next, results) if results['next'] else None
+    return tracks
+
+async def resolve_suggestions(sp: spotipy.Spotify, suggestions: List[Dict]) -> Tuple[List[Dict], Dict[str, str], List[str]]:
+    """Search all suggestions concurrently; returns (tracks in suggestion order, reasons by uri, not found)"""
+    semaphore = asyncio.Semaphore(SEARCH_CONCURRENCY)
+
+    async def search(item: Dict) -> Optional[Dict]:
+        async with semaphore:
+            try:
+                query = f"track:{item['track']} artist:{item['artist']}"
+                results = await call_spotify(sp.search, q=query, type='track', limit=1)
+            except Exception as e:
+                logger.error(f"Error searching for track {item.get('track')}: {str(e)}")
+                return None
+        items = results['tracks']['items']
+        return items[0] if items else None
+
+    found = await asyncio.gather(*(search(item) for item in suggestions))
+    tracks, reasons, not_found = [], {}, []
+    for item, track in zip(suggestions, found):
+        if track:
+            tracks.append(track)
+            reasons[track['uri']] = item.get('reason', '')
+        elif 'track' in item:
+            not_found.append(f"{item['track']} by {item.get('artist')}")
+    return tracks, reasons, not_found
 
 @router.get("")
 async def get_all_brands():
     try:
-        if not BRAND_PROFILES_DIR.exists():
-            BRAND_PROFILES_DIR.mkdir(parents=True, exist_ok=True)
-            return {"brands": []}
-        
-        brand_files = list(BRAND_PROFILES_DIR.glob("*.json"))
-        brands = []
-        
-        for file in brand_files:
-            with open(file, 'r') as f:
-                brand_data = json.load(f)
-                brands.append({
-                    "id": file.stem,
-                    "name": brand_data.get("brand", file.stem),
+        brands = await get_brand_store().list()
+        return {
+            "brands": [
+                {
+                    "id": brand_id,
+                    "name": brand_data.get("brand", brand_id),
                     "description": brand_data.get("brand_essence", {}).get("core_identity", "")
-                })
-        
-        return {"brands": brands}
+                }
+                for brand_id, brand_data in brands
+            ]
+        }
     except Exception as e:
         logger.error(f"Error getting brands: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/import")
+async def import_brand_profiles(payload: Dict):
+    """
+    Create many brand profiles in one request: {"profiles": [...], "overwrite": false}.
+    Each profile is written atomically and versioned; one failure doesn't stop the rest.
+    """
+    profiles = payload.get("profiles")
+    if not isinstance(profiles, list):
+        raise HTTPException(status_code=422, detail="profiles must be a list")
+    overwrite = bool(payload.get("overwrite", False))
+    store = get_brand_store()
+    semaphore = asyncio.Semaphore(IMPORT_CONCURRENCY)
+
+    async def put(index: int, profile: Dict) -> Dict:
+        if not isinstance(profile, dict) or "brand" not in profile:
+            return {"index": index, "status": "error", "error": "Brand name required"}
+        async with semaphore:
+            try:
+                result = await store.put(profile, overwrite)
+                return {"index": index, "status": "ok", **result}
+            except BrandStoreError as e:
+                return {"index": index, "status": "error", "error": str(e)}
+            except Exception as e:
+                logger.error(f"Error importing brand profile {index}: {str(e)}")
+                return {"index": index, "status": "error", "error": str(e)}
+
+    results = await asyncio.gather(*(put(i, profile) for i, profile in enumerate(profiles)))
+    failed = sum(1 for r in results if r["status"] != "ok")
+    return {"results": results, "succeeded": len(results) - failed, "failed": failed}
+
 @router.get("/{brand_id}")
-async def get_brand_profile(brand_id: str):
+async def get_brand_profile(brand_id: str, response: Response):
     try:
-        file_path = BRAND_PROFILES_DIR / f"{brand_id}.json"
-        if not file_path.exists():
-            raise HTTPException(status_code=404, detail=f"Brand not found: {brand_id}")
-        
-        with open(file_path, 'r') as f:
-            return json.load(f)
+        profile, etag = await get_brand_store().read(brand_id)
+        response.headers["ETag"] = etag
+        return profile
+    except BrandStoreError as e:
+        raise http_error(e)
     except Exception as e:
         logger.error(f"Error getting brand {brand_id}: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.post("/suggest-music")
-async def suggest_music(brand_profile: Dict):
+@router.get("/{brand_id}/history")
+async def get_brand_history(brand_id: str):
+    """Saved versions of a profile, oldest first"""
     try:
-        logger.info("Starting suggest-music endpoint")
-        logger.info(f"Brand Profile: {brand_profile}")
-        
-        api_key = os.getenv("ANTHROPIC_API_KEY")
-        if not api_key:
-            logger.error("ANTHROPIC_API_KEY not found")
-            raise ValueError("ANTHROPIC_API_KEY not set")
-            
-        logger.info("Got API key, initializing Anthropic client")
-        client = Anthropic(api_key=api_key.strip())
+        return {"brand_id": brand_id, "versions": await get_brand_store().history(brand_id)}
+    except BrandStoreError as e:
+        raise http_error(e)
+    except Exception as e:
+        logger.error(f"Error getting history for brand {brand_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
 
-        brand_name = brand_profile.get("brand", "Unknown Brand")
-        core_identity = brand_profile.get("brand_essence", {}).get("core_identity", "")
+@router.post("/{brand_id}/rollback")
+async def rollback_brand_profile(
+    brand_id: str, version: int, response: Response, if_match: Optional[str] = Header(None)
+):
+    """Restore an earlier version as the newest one"""
+    try:
+        result = await get_brand_store().rollback(brand_id, version, if_match)
+        response.headers["ETag"] = result["etag"]
+        return {"message": f"Brand profile rolled back to version {version}", **result}
+    except BrandStoreError as e:
+        raise http_error(e)
+    except Exception as e:
+        logger.error(f"Error rolling back brand {brand_id}: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
 
-        user_prompt = f"""
+def parse_suggestions(text_response: str) -> List[Dict]:
+    """Parse 'Song: / Artist: / Why it fits:' sections from the completion"""
+    suggestions = []
+    song_sections = text_response.split("\n\n")
+    for section in song_sections:
+        if "Song:" in section and "Artist:" in section:
+            lines = section.strip().split("\n")
+            track_line = lines[0].replace("Song:", "").strip()
+            artist_line = lines[1].replace("Artist:", "").strip()
+            reason_line = ""
+            if len(lines) > 2:
+                reason_line = " ".join(lines[2:]).replace("Why it fits:", "").strip()
+
+            suggestions.append({
+                "track": track_line,
+                "artist": artist_line,
+                "reason": reason_line
+            })
+    return suggestions
+
+async def fetch_suggestions(brand_profile: Dict, priority: int = PRIORITY_INTERACTIVE) -> List[Dict]:
+    """Ask the LLM gateway for suggestions"""
+    brand_name = brand_profile.get("brand", "Unknown Brand")
+    core_identity = brand_profile.get("brand_essence", {}).get("core_identity", "")
+
+    user_prompt = f"""
 You are a music curator. Suggest 10 songs that match this brand:
 Brand: {brand_name}
 Identity: {core_identity}
@@ -86,39 +213,80 @@ Artist: [artist name]
 Why it fits: [one sentence reason]
 """
 
-        prompt = f"{HUMAN_PROMPT}{user_prompt}{AI_PROMPT}"
-        logger.info("Sending request to Anthropic using completions.create()")
-        response = client.completions.create(
-            model="claude-2",
-            prompt=prompt,
-            max_tokens_to_sample=1500,
-            stop_sequences=[HUMAN_PROMPT]
+    text_response = await get_gateway().complete(user_prompt, max_tokens=SUGGESTION_MAX_TOKENS, priority=priority)
+    logger.info(f"LLM response for {brand_name}: {len(text_response)} chars")
+    logger.debug(f"LLM response:\n{text_response}")
+    return parse_suggestions(text_response)
+
+@router.post("/suggest-music")
+async def suggest_music(brand_profile: Dict, background: bool = False):
+    """Song suggestions for a brand; background refreshes queue behind interactive requests"""
+    try:
+        logger.info(f"Suggesting music for brand: {brand_profile.get('brand', 'Unknown Brand')}")
+
+        # While Anthropic's circuit is open, serve the last suggestions for this brand marked stale
+        key = (
+            "suggest-music",
+            brand_profile.get("brand", "Unknown Brand"),
+            brand_profile.get("brand_essence", {}).get("core_identity", "")
         )
+        priority = PRIORITY_BACKGROUND if background else PRIORITY_INTERACTIVE
+        suggestions, stale = await with_stale_fallback(key, anthropic_breaker, lambda: fetch_suggestions(brand_profile, priority))
+        return {"suggestions": suggestions, "stale": stale}
+
+    except CircuitOpenError as e:
+        raise unavailable(e)
+    except GatewayBusy as e:
+        raise busy(e)
+    except Exception as e:
+        logger.error(f"Error in suggest-music: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
 
-        text_response = response.completion
-        logger.info(f"Anthropic response:\n{text_response}")
+@router.post("/{brand_id}/score")
+async def score_tracks(brand_id: str, payload: Dict, authorization: str = Header(None)):
+    """
+    Rank tracks by brand fit, with the genre, audio and text components.
+    """
+    try:
+        if not authorization:
+            raise HTTPException(status_code=401, detail="No authorization header")
+        track_uris = payload.get("track_uris") or []
 
-        suggestions = []
-        song_sections = text_response.split("\n\n")
-        for section in song_sections:
-            if "Song:" in section and "Artist:" in section:
-                lines = section.strip().split("\n")
-                track_line = lines[0].replace("Song:", "").strip()
-                artist_line = lines[1].replace("Artist:", "").strip()
-                reason_line = ""
-                if len(lines) > 2:
-                    reason_line = " ".join(lines[2:]).replace("Why it fits:", "").strip()
+        brand_profile = await get_brand_store().get(brand_id)
 
-                suggestions.append({
-                    "track": track_line,
-                    "artist": artist_line,
-                    "reason": reason_line
-                })
+        session = await token_manager.ensure_valid(authorization.replace('Bearer ', ''))
+        spotify_user.set(session['user_id'])
+        sp = spotipy.Spotify(auth=session['access_token'])
 
-        return {"suggestions": suggestions}
+        track_ids = [track_id for track_id in map(track_id_from_uri, track_uris) if track_id]
+        tracks = []
+        for batch in chunked(track_ids, TRACKS_BATCH):
+            response = await call_spotify(sp.tracks, batch)
+            tracks.extend(t for t in response.get('tracks', []) if t)
 
+        await enrich_features(sp, tracks)
+        candidates = await build_candidates(sp, tracks)
+        scores = BrandScorer(brand_profile).score(candidates)
+        order = np.argsort(-scores["total"], kind='stable')
+        return {
+            "brand_id": brand_id,
+            "ranked": [
+                {
+                    "uri": candidates[i]["uri"],
+                    "name": candidates[i]["name"],
+                    "artists": candidates[i]["artists"],
+                    "score": round(float(scores["total"][i]), 4),
+                    "components": {k: round(float(scores[k][i]), 4) for k in ("genre", "audio", "text")}
+                }
+                for i in order
+            ]
+        }
+    except HTTPException:
+        raise
+    except BrandStoreError as e:
+        raise http_error(e)
     except Exception as e:
-        logger.error(f"Error in suggest-music: {str(e)}", exc_info=True)
+        logger.error(f"Error scoring tracks for brand {brand_id}: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/create-playlist")
@@ -126,7 +294,12 @@ async def create_brand_playlist(payload: Dict, authorization: str = Header(None)
     """
     If a playlist exists, replace half of its songs with new ones while maintaining the same total count.
     If no playlist exists, create a new one with all suggested songs.
+
+    Suggestions are resolved while the playlist is looked up and its current
+    tracks are fetched and ranked; the playlist is only rewritten once both
+    are done. Per-stage timings are returned.
     """
+    pending: List[asyncio.Task] = []
     try:
         if not authorization:
             raise HTTPException(status_code=401, detail="No authorization header")
@@ -138,163 +311,130 @@ async def create_brand_playlist(payload: Dict, authorization: str = Header(None)
         if not all([brand_id, suggestions]):
             raise HTTPException(status_code=422, detail="Missing required fields")
 
-        file_path = BRAND_PROFILES_DIR / f"{brand_id}.json"
-        if not file_path.exists():
-            raise HTTPException(status_code=404, detail=f"Brand not found: {brand_id}")
+        timer = StageTimer("brand_playlist")
+        brand_profile = await get_brand_store().get(brand_id)
 
-        with open(file_path, 'r') as f:
-            brand_profile = json.load(f)
-
-        # Create Spotify client with access token
-        sp = spotipy.Spotify(auth=token)
-        
-        try:
-            user_id = sp.current_user()["id"]
-            logger.info(f"Creating playlist for user: {user_id}")
-        except Exception as e:
-            logger.error(f"Error getting user profile: {str(e)}")
-            raise HTTPException(status_code=401, detail="Invalid or expired token")
+        # Create Spotify client with a valid token, the session already knows the user
+        session = await token_manager.ensure_valid(token)
+        sp = spotipy.Spotify(auth=session['access_token'])
+        user_id = session['user_id']
+        spotify_user.set(user_id)
+        logger.info(f"Creating playlist for user: {user_id}")
 
         playlist_name = f"{brand_profile['brand']} Brand Playlist"
         description = f"A curated playlist for {brand_profile['brand']}"
+        scorer = BrandScorer(brand_profile)
 
-        # Search for existing playlist
-        existing_playlist = None
-        offset = 0
-        limit = 50
-        
-        while True:
-            playlists = sp.user_playlists(user_id, limit=limit, offset=offset)
-            logger.info(f"Checking batch of {len(playlists['items'])} playlists")
-            
-            for pl in playlists['items']:
-                if pl['name'] == playlist_name:
-                    existing_playlist = pl
-                    logger.info(f"Found existing playlist: {pl['id']}")
-                    break
-
-            if existing_playlist or not playlists['next']:
-                break
-                
-            offset += limit
-
-        # Search for new tracks
-        new_track_uris = []
-        not_found = []
-        for item in suggestions:
-            try:
-                query = f"track:{item['track']} artist:{item['artist']}"
-                results = sp.search(q=query, type='track', limit=1)
-                if results['tracks']['items']:
-                    new_track_uris.append(results['tracks']['items'][0]['uri'])
-                else:
-                    not_found.append(f"{item['track']} by {item['artist']}")
-            except Exception as e:
-                logger.error(f"Error searching for track {item['track']}: {str(e)}")
-                continue
+        # Resolving and ranking suggestions doesn't depend on the playlist, start it right away
+        async def resolve_and_rank() -> Tuple[List[Dict], Dict[str, str], List[str]]:
+            tracks, reasons, not_found = await timer.run("resolve", resolve_suggestions(sp, suggestions))
+            tracks = await timer.run("rank_new", rank_tracks(sp, scorer, unique_tracks(tracks), reasons))
+            return tracks, reasons, not_found
 
+        suggestions_task = asyncio.create_task(resolve_and_rank())
+        pending.append(suggestions_task)
+
+        existing_playlist = await timer.run("lookup", find_playlist_by_name(sp, playlist_name))
         if existing_playlist:
             playlist_id = existing_playlist['id']
             logger.info(f"Updating existing playlist: {playlist_id}")
-            
-            # Get current tracks
-            current_tracks = []
-            results = sp.playlist_items(playlist_id)
-            while results:
-                current_tracks.extend([item['track']['uri'] for item in results['items'] if item['track']])
-                if results['next']:
-                    results = sp.next(results)
-                else:
-                    break
-
-            total_tracks = len(current_tracks)
-            if total_tracks > 0:
-                # Keep half of the existing tracks
-                tracks_to_keep = total_tracks // 2
-                kept_tracks = random.sample(current_tracks, min(tracks_to_keep, len(current_tracks)))
-                
-                # Remove all current tracks and add back kept tracks + new tracks
-                logger.info(f"Replacing playlist tracks. Keeping {len(kept_tracks)} existing tracks")
-                all_tracks = kept_tracks + new_track_uris[:total_tracks - len(kept_tracks)]
-                sp.playlist_replace_items(playlist_id, all_tracks)
-            else:
-                # If playlist is empty, just add all new tracks
-                if new_track_uris:
-                    sp.playlist_add_items(playlist_id, new_track_uris)
-            
+            current_tracks = await timer.run("fetch_current", fetch_current_tracks(sp, playlist_id))
         else:
             logger.info("Creating new playlist")
             try:
-                new_playlist = sp.user_playlist_create(
-                    user=user_id,
-                    name=playlist_name,
-                    public=False,
-                    description=description
-                )
-                playlist_id = new_playlist['id']
-                if new_track_uris:
-                    sp.playlist_add_items(playlist_id, new_track_uris)
+                new_playlist = await timer.run("create", call_spotify(
+                    sp.user_playlist_create, user=user_id, name=playlist_name, public=False, description=description
+                ))
             except Exception as e:
                 logger.error(f"Error creating playlist: {str(e)}")
                 raise HTTPException(status_code=500, detail="Failed to create playlist")
+            playlist_id = new_playlist['id']
+            current_tracks = []
+
+        total_tracks = len(current_tracks)
+        kept: List[Dict] = []
+        if total_tracks > 0:
+            # Keep the best-fitting half of the existing tracks, without repeats
+            ranked_current = await timer.run("rank_current", rank_tracks(sp, scorer, current_tracks))
+            kept = unique_tracks(ranked_current)[:total_tracks // 2]
+            logger.info(f"Replacing playlist tracks. Keeping {len(kept)} best-fitting existing tracks")
+
+        new_tracks, reasons, not_found = await suggestions_task
+        # New tracks must not repeat a kept one, not even as another release of the same song
+        new_track_uris = [t['uri'] for t in unique_tracks(new_tracks, existing=kept)]
+        if total_tracks > 0:
+            new_track_uris = new_track_uris[:total_tracks - len(kept)]
+
+        # The replace only starts once the new tracks are known, so a failed or
+        # cancelled lookup leaves the existing playlist untouched
+        if new_track_uris:
+            writer = PlaylistWriter(sp, playlist_id, replace=bool(current_tracks))
+            writer.put([t['uri'] for t in kept] + new_track_uris)
+            writer.close()
+            await timer.run("write", writer.run())
+        else:
+            logger.warning(f"No new tracks resolved for brand playlist {playlist_id}, leaving it unchanged")
 
+        timings = timer.report()
+        logger.info(f"Brand playlist {playlist_id} ready in {timings['total_ms']}ms: {timings['stages']}")
         return {
             "playlist_id": playlist_id,
             "tracks_added": len(new_track_uris),
             "tracks_not_found": not_found,
-            "playlist_url": f"https://open.spotify.com/playlist/{playlist_id}"
+            "playlist_url": f"https://open.spotify.com/playlist/{playlist_id}",
+            "timings": timings
         }
     except HTTPException:
         raise
+    except BrandStoreError as e:
+        raise http_error(e)
     except Exception as e:
         logger.error(f"Error creating or updating playlist: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        for task in pending:
+            task.cancel()
 
 @router.post("")
-async def create_brand_profile(brand_data: Dict):
+async def create_brand_profile(brand_data: Dict, response: Response):
     try:
         if "brand" not in brand_data:
             raise HTTPException(status_code=400, detail="Brand name required")
-        
-        BRAND_PROFILES_DIR.mkdir(parents=True, exist_ok=True)
-        brand_id = brand_data["brand"].lower().replace(" ", "_")
-        file_path = BRAND_PROFILES_DIR / f"{brand_id}.json"
-
-        if file_path.exists():
-            raise HTTPException(status_code=400, detail=f"Brand exists: {brand_id}")
 
-        with open(file_path, 'w') as f:
-            json.dump(brand_data, f, indent=2)
-
-        return {"message": "Brand profile created", "brand_id": brand_id}
+        result = await get_brand_store().create(brand_data)
+        response.headers["ETag"] = result["etag"]
+        return {"message": "Brand profile created", **result}
+    except HTTPException:
+        raise
+    except BrandStoreError as e:
+        raise http_error(e)
     except Exception as e:
         logger.error(f"Error creating brand: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.put("/{brand_id}")
-async def update_brand_profile(brand_id: str, brand_data: Dict):
+async def update_brand_profile(
+    brand_id: str, brand_data: Dict, response: Response, if_match: Optional[str] = Header(None)
+):
+    """Replace a profile; with If-Match the write only happens if nobody changed it since"""
     try:
-        file_path = BRAND_PROFILES_DIR / f"{brand_id}.json"
-        if not file_path.exists():
-            raise HTTPException(status_code=404, detail=f"Brand not found: {brand_id}")
-
-        with open(file_path, 'w') as f:
-            json.dump(brand_data, f, indent=2)
-
-        return {"message": "Brand profile updated"}
+        result = await get_brand_store().update(brand_id, brand_data, if_match)
+        response.headers["ETag"] = result["etag"]
+        return {"message": "Brand profile updated", **result}
+    except BrandStoreError as e:
+        raise http_error(e)
     except Exception as e:
         logger.error(f"Error updating brand {brand_id}: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.delete("/{brand_id}")
-async def delete_brand_profile(brand_id: str):
+async def delete_brand_profile(brand_id: str, if_match: Optional[str] = Header(None)):
+    """Delete a profile; its history is kept so it can be restored with a rollback"""
     try:
-        file_path = BRAND_PROFILES_DIR / f"{brand_id}.json"
-        if not file_path.exists():
-            raise HTTPException(status_code=404, detail=f"Brand not found: {brand_id}")
-
-        os.remove(file_path)
-        return {"message": "Brand profile deleted"}
+        result = await get_brand_store().delete(brand_id, if_match)
+        return {"message": "Brand profile deleted", **result}
+    except BrandStoreError as e:
+        raise http_error(e)
     except Exception as e:
         logger.error(f"Error deleting brand {brand_id}: {str(e)}", exc_info=True)
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
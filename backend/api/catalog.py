@@ -0,0 +1,264 @@
+"""
+Hitcraft genre catalog, loaded once and served from memory.
+
+hitcraft_library.json lists genres (name, category, description) with the
+numeric Hitcraft ids of their tracks. At startup it is indexed by genre
+name and URL slug, by category and by track id. Numeric ids are resolved to Spotify URIs
+lazily, in batches, through a pluggable resolver whose answers are cached.
+
+The library itself carries no Spotify ids, so the default resolver reads an
+optional id -> URI mapping file (HITCRAFT_TRACK_MAP, a JSON object); ids it
+doesn't know are reported as unresolved and asked about again later.
+"""
+import asyncio
+import json
+import logging
+import os
+import re
+import time
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import spotipy
+from fastapi import APIRouter, HTTPException, Header
+from pydantic import BaseModel
+
+from .auth import extract_token, token_manager
+from .circuit_breaker import CircuitOpenError, unavailable
+from .metrics import metrics
+from .spotify_client import PlaylistWriter, call_spotify, chunked, spotify_user
+
+logger = logging.getLogger(__name__)
+router = APIRouter()
+
+HITCRAFT_LIBRARY_PATH = Path(__file__).parent.parent / "data" / "hitcraft_library.json"
+RESOLVE_BATCH = 50  # ids per resolver call
+UNRESOLVED_RETRY = 3600  # seconds before asking the resolver about an unknown id again
+MAX_PLAYLIST_TRACKS = 500
+
+TrackResolver = Callable[[List[int]], Awaitable[Dict[int, Optional[str]]]]
+
+
+def slugify(name: str) -> str:
+    """'Electropop / House' -> 'electropop-house', safe as a single path segment"""
+    return re.sub(r'[^a-z0-9]+', '-', name.lower()).strip('-') or 'genre'
+
+
+def mapping_resolver(path: Optional[str]) -> TrackResolver:
+    """Resolve ids from a JSON {"<id>": "spotify:track:..."} file, read once on first use"""
+    mapping: Optional[Dict[int, str]] = None
+
+    async def resolve(ids: List[int]) -> Dict[int, Optional[str]]:
+        nonlocal mapping
+        if mapping is None:
+            mapping = {}
+            if path and Path(path).exists():
+                try:
+                    with open(path, 'r') as f:
+                        mapping = {int(k): v for k, v in json.load(f).items() if v}
+                except Exception as e:
+                    logger.error(f"Error loading hitcraft track map {path}: {str(e)}")
+        return {track_id: mapping.get(track_id) for track_id in ids}
+
+    return resolve
+
+
+class HitcraftCatalog:
+    def __init__(self, genres: List[Dict], resolver: TrackResolver):
+        self.genres = genres
+        self.resolver = resolver
+        self.by_name: Dict[str, Dict] = {g['name'].lower(): g for g in genres}
+        # Some names contain "/", so routes address genres by slug
+        self.slugs: Dict[str, str] = {}
+        self.by_slug: Dict[str, Dict] = {}
+        for genre in genres:
+            slug = base = slugify(genre['name'])
+            suffix = 2
+            while slug in self.by_slug:
+                slug, suffix = f"{base}-{suffix}", suffix + 1
+            self.slugs[genre['name']] = slug
+            self.by_slug[slug] = genre
+        self.categories: Dict[str, List[str]] = {}
+        self.genres_by_track: Dict[int, List[str]] = {}
+        for genre in genres:
+            self.categories.setdefault(genre.get('category', 'Other'), []).append(genre['name'])
+            for track_id in genre.get('tracks', []):
+                self.genres_by_track.setdefault(track_id, []).append(genre['name'])
+        # The genre listing never changes, build the response once
+        self.summaries = [
+            {
+                "name": g['name'],
+                "slug": self.slugs[g['name']],
+                "category": g.get('category', 'Other'),
+                "description": g.get('description', ''),
+                "track_count": len(g.get('tracks', []))
+            }
+            for g in genres
+        ]
+        self._uris: Dict[int, str] = {}
+        self._unresolved_at: Dict[int, float] = {}
+        self._resolve_lock = asyncio.Lock()
+
+    def genre(self, key: str) -> Optional[Dict]:
+        """A genre by slug or by name"""
+        return self.by_slug.get(key.lower()) or self.by_name.get(key.lower())
+
+    async def resolve(self, track_ids: List[int]) -> Dict[int, Optional[str]]:
+        """Spotify URI per id (None when unknown); only ids not seen recently go to the resolver"""
+        now = time.time()
+        missing = [
+            t for t in dict.fromkeys(track_ids)
+            if t not in self._uris and now - self._unresolved_at.get(t, 0) > UNRESOLVED_RETRY
+        ]
+        if missing:
+            # One resolution at a time, so concurrent requests for a genre share the work
+            async with self._resolve_lock:
+                missing = [t for t in missing if t not in self._uris]
+                for batch in chunked(missing, RESOLVE_BATCH):
+                    try:
+                        resolved = await self.resolver(batch)
+                    except Exception as e:
+                        logger.warning(f"Error resolving hitcraft tracks: {str(e)}")
+                        resolved = {}
+                    metrics.incr("catalog.resolver_calls")
+                    for track_id in batch:
+                        uri = resolved.get(track_id)
+                        if uri:
+                            self._uris[track_id] = uri
+                            self._unresolved_at.pop(track_id, None)
+                        else:
+                            self._unresolved_at[track_id] = now
+        return {t: self._uris.get(t) for t in track_ids}
+
+    async def genre_tracks(self, genre: Dict) -> List[Dict]:
+        uris = await self.resolve(genre.get('tracks', []))
+        return [
+            {"id": track_id, "uri": uris[track_id], "genres": self.genres_by_track.get(track_id, [])}
+            for track_id in genre.get('tracks', [])
+        ]
+
+
+def load_catalog(path: Path = HITCRAFT_LIBRARY_PATH, resolver: Optional[TrackResolver] = None) -> HitcraftCatalog:
+    try:
+        with open(path, 'r') as f:
+            genres = json.load(f).get("genres", [])
+    except Exception as e:
+        logger.error(f"Error loading hitcraft library: {str(e)}")
+        genres = []
+    catalog = HitcraftCatalog(genres, resolver or mapping_resolver(os.getenv("HITCRAFT_TRACK_MAP")))
+    logger.info(f"Loaded hitcraft catalog: {len(genres)} genres, {len(catalog.genres_by_track)} tracks")
+    return catalog
+
+
+_catalog: Optional[HitcraftCatalog] = None
+
+
+def get_catalog() -> HitcraftCatalog:
+    global _catalog
+    if _catalog is None:
+        _catalog = load_catalog()
+    return _catalog
+
+
+@router.on_event("startup")
+async def load_on_startup():
+    get_catalog()
+
+
+class GenrePlaylistRequest(BaseModel):
+    genres: List[str]
+    name: Optional[str] = None
+    limit: Optional[int] = None
+    public: bool = False
+
+
+@router.get("/genres")
+async def list_genres(category: Optional[str] = None):
+    catalog = get_catalog()
+    genres = catalog.summaries
+    if category:
+        genres = [g for g in genres if g["category"].lower() == category.lower()]
+    return {"genres": genres, "categories": catalog.categories}
+
+
+@router.get("/genres/{slug}/tracks")
+async def get_genre_tracks(slug: str):
+    """Tracks of a genre, addressed by the slug /genres lists (or a name without "/")"""
+    catalog = get_catalog()
+    genre = catalog.genre(slug)
+    if genre is None:
+        raise HTTPException(status_code=404, detail=f"Genre not found: {slug}")
+    try:
+        tracks = await catalog.genre_tracks(genre)
+        resolved = sum(1 for t in tracks if t["uri"])
+        return {
+            "genre": genre['name'],
+            "slug": catalog.slugs[genre['name']],
+            "category": genre.get('category', 'Other'),
+            "tracks": tracks,
+            "resolved": resolved,
+            "unresolved": len(tracks) - resolved
+        }
+    except Exception as e:
+        logger.error(f"Error getting tracks for genre {slug}: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/playlists")
+async def create_genre_playlist(payload: GenrePlaylistRequest, authorization: str = Header(None)):
+    """
+    Create a playlist from one or more genres. Tracks are interleaved across
+    the genres in catalog order; tracks without a Spotify URI are skipped.
+    """
+    try:
+        if not authorization:
+            raise HTTPException(status_code=401, detail="No authorization header")
+        catalog = get_catalog()
+        genres = [catalog.genre(name) for name in payload.genres]
+        unknown = [name for name, genre in zip(payload.genres, genres) if genre is None]
+        if unknown or not genres:
+            raise HTTPException(status_code=404, detail=f"Genres not found: {unknown}")
+
+        # Round-robin so every genre is represented even with a limit
+        columns = [genre.get('tracks', []) for genre in genres]
+        ordered: Dict[int, None] = {}
+        for row in range(max(len(c) for c in columns)):
+            for column in columns:
+                if row < len(column):
+                    ordered.setdefault(column[row])
+        uris = await catalog.resolve(list(ordered))
+        track_uris = [uris[t] for t in ordered if uris[t]]
+        limit = min(payload.limit or MAX_PLAYLIST_TRACKS, MAX_PLAYLIST_TRACKS)
+        track_uris = track_uris[:limit]
+        if not track_uris:
+            raise HTTPException(status_code=422, detail="None of these genres' tracks are available on Spotify")
+
+        session = await token_manager.ensure_valid(extract_token(authorization))
+        spotify_user.set(session['user_id'])
+        sp = spotipy.Spotify(auth=session['access_token'])
+        name = payload.name or f"Hitcraft: {', '.join(g['name'] for g in genres)}"
+        playlist = await call_spotify(
+            sp.user_playlist_create,
+            user=session['user_id'],
+            name=name,
+            public=payload.public,
+            description=f"Hitcraft genres: {', '.join(g['name'] for g in genres)}"
+        )
+        writer = PlaylistWriter(sp, playlist['id'])
+        writer.put(track_uris)
+        writer.close()
+        await writer.run()
+
+        return {
+            "playlist_id": playlist['id'],
+            "tracks_added": len(track_uris),
+            "unresolved": len(ordered) - sum(1 for t in ordered if uris[t]),
+            "playlist_url": f"https://open.spotify.com/playlist/{playlist['id']}"
+        }
+    except HTTPException:
+        raise
+    except CircuitOpenError as e:
+        raise unavailable(e)
+    except Exception as e:
+        logger.error(f"Error creating genre playlist: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
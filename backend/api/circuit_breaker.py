@@ -0,0 +1,189 @@
+"""
+Per-upstream circuit breakers and a stale-data fallback for read endpoints.
+
+A breaker opens once the error rate over a sliding window crosses a
+threshold, and then rejects calls immediately with CircuitOpenError instead
+of letting handlers retry and pile up. After a cool-down one probe call is
+let through; if it succeeds the circuit closes and any stale responses
+served in the meantime are revalidated in the background.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Tuple, Type
+
+import httpx
+import requests
+from fastapi import HTTPException
+
+from .cache import TTLCache
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Breaker configuration
+WINDOW_SECONDS = 30
+MIN_CALLS = 10  # don't judge the error rate on fewer calls than this
+ERROR_RATE_THRESHOLD = 0.5
+OPEN_SECONDS = 30  # cool-down before a probe call is allowed
+
+STALE_CACHE_SIZE = 500
+STALE_CACHE_TTL = 24 * 3600
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, upstream: str, retry_after: float):
+        super().__init__(f"{upstream} is unavailable, retry in {retry_after:.0f}s")
+        self.upstream = upstream
+        self.retry_after = retry_after
+
+
+def upstream_status(exc: Exception) -> Optional[int]:
+    """HTTP status carried by spotipy, httpx, requests or anthropic errors"""
+    for attr in ("http_status", "status_code"):
+        status = getattr(exc, attr, None)
+        if isinstance(status, int):
+            return status
+    response = getattr(exc, "response", None)
+    status = getattr(response, "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, transient_errors: Tuple[Type[BaseException], ...] = ()):
+        self.name = name
+        self.state = CLOSED
+        self.transient_errors = (
+            ConnectionError, TimeoutError, requests.ConnectionError, requests.Timeout, httpx.TransportError,
+        ) + tuple(transient_errors)
+        self._calls: Deque[Tuple[float, bool]] = deque()
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._revalidations: Dict[Any, Callable[[], Awaitable[Any]]] = {}
+        metrics.register_gauge(f"circuit.{name}.open", lambda: 1.0 if self.state != CLOSED else 0.0)
+
+    def is_failure(self, exc: BaseException) -> bool:
+        """Only upstream degradation counts; client errors like 404 don't trip the breaker"""
+        status = upstream_status(exc)
+        if status is not None:
+            return status >= 500 or status == 429
+        return isinstance(exc, self.transient_errors)
+
+    def before_call(self) -> None:
+        if self.state == CLOSED:
+            return
+        remaining = self._opened_at + OPEN_SECONDS - time.monotonic()
+        if self.state == OPEN and remaining <= 0:
+            self.state = HALF_OPEN
+        if self.state == HALF_OPEN and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return
+        metrics.incr(f"circuit.{self.name}.rejected")
+        raise CircuitOpenError(self.name, max(remaining, 1.0))
+
+    def record_success(self) -> None:
+        self._record(True)
+        if self.state == HALF_OPEN:
+            self._close()
+
+    def record_failure(self, exc: BaseException) -> None:
+        if not self.is_failure(exc):
+            if self.state == HALF_OPEN:
+                self._probe_in_flight = False
+            return
+        self._record(False)
+        if self.state == HALF_OPEN:
+            self._open()
+            return
+        total = len(self._calls)
+        failures = sum(1 for _, ok in self._calls if not ok)
+        if total >= MIN_CALLS and failures / total >= ERROR_RATE_THRESHOLD:
+            self._open()
+
+    async def call(self, fn: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        self.before_call()
+        try:
+            result = await fn(*args, **kwargs)
+        except BaseException as e:
+            self.record_failure(e)
+            raise
+        self.record_success()
+        return result
+
+    def revalidate_on_close(self, key: Any, refresh: Callable[[], Awaitable[Any]]) -> None:
+        """Queue a refresh of stale data to run once the circuit closes (one per key)"""
+        self._revalidations[key] = refresh
+
+    def _record(self, ok: bool) -> None:
+        now = time.monotonic()
+        self._calls.append((now, ok))
+        while self._calls and self._calls[0][0] < now - WINDOW_SECONDS:
+            self._calls.popleft()
+
+    def _open(self) -> None:
+        if self.state != OPEN:
+            logger.warning(f"Circuit for {self.name} opened")
+            metrics.incr(f"circuit.{self.name}.opened")
+        self.state = OPEN
+        self._opened_at = time.monotonic()
+        self._probe_in_flight = False
+
+    def _close(self) -> None:
+        logger.info(f"Circuit for {self.name} closed")
+        self.state = CLOSED
+        self._calls.clear()
+        self._probe_in_flight = False
+        revalidations, self._revalidations = self._revalidations, {}
+        for key, refresh in revalidations.items():
+            task = asyncio.create_task(refresh())
+            task.add_done_callback(lambda t, key=key: self._log_revalidation(key, t))
+
+    def _log_revalidation(self, key: Any, task: asyncio.Task) -> None:
+        if not task.cancelled() and task.exception():
+            logger.warning(f"Revalidation of {key} after {self.name} recovery failed: {str(task.exception())}")
+        else:
+            metrics.incr(f"circuit.{self.name}.revalidated")
+
+
+def unavailable(exc: CircuitOpenError) -> HTTPException:
+    """503 with Retry-After for a rejected call that had no stale data to fall back on"""
+    return HTTPException(status_code=503, detail=str(exc), headers={"Retry-After": str(int(exc.retry_after))})
+
+
+breakers: Dict[str, CircuitBreaker] = {}
+
+
+def get_breaker(name: str, transient_errors: Tuple[Type[BaseException], ...] = ()) -> CircuitBreaker:
+    if name not in breakers:
+        breakers[name] = CircuitBreaker(name, transient_errors)
+    return breakers[name]
+
+
+stale_cache = TTLCache(maxsize=STALE_CACHE_SIZE, ttl=STALE_CACHE_TTL)
+
+
+async def with_stale_fallback(
+    key: Any, breaker: CircuitBreaker, fetch: Callable[[], Awaitable[Any]]
+) -> Tuple[Any, bool]:
+    """
+    Run fetch and remember the result; while the circuit is open serve the
+    last good result instead, marked stale, and revalidate it on recovery.
+    Returns (value, is_stale).
+    """
+    async def refresh() -> Any:
+        value = await fetch()
+        stale_cache.set(key, value)
+        return value
+
+    try:
+        return await refresh(), False
+    except CircuitOpenError:
+        cached = stale_cache.peek(key)
+        if cached is None:
+            raise
+        metrics.incr(f"circuit.{breaker.name}.stale_served")
+        breaker.revalidate_on_close(key, refresh)
+        return cached, True
@@ -0,0 +1,81 @@
+"""
+Conditional GETs (ETag / If-None-Match) for the playlist API.
+
+ETags are derived from what Spotify already versions: a playlist's tracks
+are identified by its snapshot_id, and the library listing by a fingerprint
+of every listed playlist's fields (snapshot_ids included), computed once
+when the listing is cached. fetch_time and stale are response metadata and
+do not take part.
+
+A matching If-None-Match is answered with an empty 304 before anything is
+serialized, and without calling Spotify when the cache can vouch for the
+version. The size of the last full body sent per ETag is remembered, so
+/metrics can report the bytes each 304 saved.
+"""
+import hashlib
+from typing import Dict, List, Optional
+
+from fastapi import Response
+from fastapi.responses import JSONResponse
+
+from .cache import TTLCache
+from .metrics import metrics
+from .records import PlaylistRecord, TrackRecord
+
+BODY_SIZES_TRACKED = 5000  # ETags whose last full body size is remembered
+BODY_SIZE_TTL = 3600
+
+
+def etag_for(*parts: object) -> str:
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(repr(part).encode("utf-8"))
+        digest.update(b"\x00")
+    return '"' + digest.hexdigest()[:20] + '"'
+
+
+def listing_etag(playlists: List[PlaylistRecord]) -> str:
+    return etag_for("listing", *(tuple(getattr(p, field) for field in PlaylistRecord.__slots__) for p in playlists))
+
+
+def tracks_etag(playlist_id: str, snapshot_id: Optional[str], tracks: Optional[List[TrackRecord]] = None) -> str:
+    """From the snapshot_id when known, otherwise from the track list itself"""
+    if snapshot_id:
+        return etag_for("tracks", playlist_id, snapshot_id)
+    return etag_for("tracks", playlist_id, *((t.uri, t.added_at) for t in tracks or ()))
+
+
+def matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match uses weak comparison, so W/ prefixes are ignored"""
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in (tag[2:] if tag.startswith("W/") else tag for tag in tags)
+
+
+def cache_headers(etag: str) -> Dict[str, str]:
+    # Browsers may keep the body but must revalidate; bodies differ per user
+    return {"ETag": etag, "Cache-Control": "private, no-cache", "Vary": "Authorization"}
+
+
+class ConditionalResponses:
+    def __init__(self):
+        self._sizes = TTLCache(maxsize=BODY_SIZES_TRACKED, ttl=BODY_SIZE_TTL)  # etag -> bytes of the last full body
+
+    def not_modified(self, if_none_match: Optional[str], etag: str, route: str) -> Optional[Response]:
+        """A 304 when the client already has `etag`, else None"""
+        if not matches(if_none_match, etag):
+            return None
+        metrics.incr(f"conditional.{route}.not_modified")
+        metrics.incr(f"conditional.{route}.bytes_saved", self._sizes.peek(etag) or 0)
+        return Response(status_code=304, headers=cache_headers(etag))
+
+    def full(self, body: Dict, etag: str, route: str) -> JSONResponse:
+        response = JSONResponse(body, headers=cache_headers(etag))
+        self._sizes.set(etag, len(response.body))
+        metrics.incr(f"conditional.{route}.full")
+        metrics.incr(f"conditional.{route}.bytes_sent", len(response.body))
+        return response
+
+
+conditional = ConditionalResponses()
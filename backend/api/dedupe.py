@@ -0,0 +1,161 @@
+"""
+Duplicate detection for playlists.
+
+Besides exact URI repeats, the same song often appears as several releases
+(single, album, remaster) under different URIs. Those are matched by ISRC,
+or failing that by a normalized title + primary artist key with durations
+within a small tolerance. Every lookup is a dict hit, so a pass over a
+playlist is linear in its length.
+"""
+import re
+import unicodedata
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from .records import TrackRecord
+
+DURATION_TOLERANCE_MS = 3000  # releases of one recording differ by a few seconds at most
+REMOVE_BATCH = 100  # max items per remove-tracks request
+
+# Suffixes that mark another release of the same recording; live, remix, acoustic etc. are different recordings
+RELEASE_TAGS = re.compile(
+    r"\s*(?:[-(\[]\s*)(?:\d{4}\s+)?(?:remaster(?:ed)?|re-?mastered|single|album|radio edit|original mix|"
+    r"mono|stereo|deluxe|bonus track|explicit|clean|feat\.?|ft\.?|with)\b.*$",
+    re.IGNORECASE,
+)
+PUNCTUATION = re.compile(r"[^\w\s]")
+WHITESPACE = re.compile(r"\s+")
+
+
+class Fingerprint(NamedTuple):
+    uri: str
+    isrc: Optional[str]
+    title: str
+    artist: str
+    duration_ms: int
+
+
+def normalize_title(title: str) -> str:
+    """'Song Name - 2011 Remaster' -> 'song name'; accents and punctuation are dropped"""
+    title = RELEASE_TAGS.sub("", title or "")
+    title = unicodedata.normalize("NFKD", title).encode("ascii", "ignore").decode()
+    title = PUNCTUATION.sub(" ", title.lower())
+    return WHITESPACE.sub(" ", title).strip()
+
+
+def normalize_artist(name: str) -> str:
+    name = unicodedata.normalize("NFKD", name or "").encode("ascii", "ignore").decode()
+    return WHITESPACE.sub(" ", PUNCTUATION.sub(" ", name.lower())).strip()
+
+
+def fingerprint_record(record: TrackRecord) -> Fingerprint:
+    artist = record.artists[0].name if record.artists else ""
+    return Fingerprint(
+        record.uri, record.isrc, normalize_title(record.name), normalize_artist(artist), record.duration_ms or 0
+    )
+
+
+def fingerprint_track(track: Dict) -> Fingerprint:
+    """Same as fingerprint_record, for a raw Spotify track object"""
+    artists = track.get('artists') or [{}]
+    return Fingerprint(
+        track.get('uri', ''),
+        (track.get('external_ids') or {}).get('isrc'),
+        normalize_title(track.get('name', '')),
+        normalize_artist(artists[0].get('name', '')),
+        track.get('duration_ms') or 0,
+    )
+
+
+class DuplicateIndex:
+    """Remembers fingerprints seen so far and matches new ones against them."""
+
+    def __init__(self, near: bool = True):
+        self.near = near
+        self._by_uri: Dict[str, int] = {}
+        self._by_isrc: Dict[str, int] = {}
+        self._by_meta: Dict[Tuple[str, str], List[Tuple[int, int]]] = {}
+
+    def match(self, fp: Fingerprint) -> Optional[Tuple[int, str]]:
+        """(ref of the earlier occurrence, reason) or None"""
+        if fp.uri in self._by_uri:
+            return self._by_uri[fp.uri], "uri"
+        if not self.near:
+            return None
+        if fp.isrc and fp.isrc in self._by_isrc:
+            return self._by_isrc[fp.isrc], "isrc"
+        if fp.title:
+            for duration, ref in self._by_meta.get((fp.title, fp.artist), ()):
+                if abs(duration - fp.duration_ms) <= DURATION_TOLERANCE_MS:
+                    return ref, "metadata"
+        return None
+
+    def add(self, fp: Fingerprint, ref: int) -> None:
+        self._by_uri.setdefault(fp.uri, ref)
+        if fp.isrc:
+            self._by_isrc.setdefault(fp.isrc, ref)
+        if fp.title:
+            self._by_meta.setdefault((fp.title, fp.artist), []).append((fp.duration_ms, ref))
+
+
+def playlist_position(record: TrackRecord, ref: int) -> int:
+    return record.position if record.position is not None else ref
+
+
+def find_duplicates(records: List[TrackRecord], near: bool = True) -> List[Dict]:
+    """
+    Later occurrences of tracks already in the list; the first occurrence is
+    the one kept. Positions are the records' playlist positions when known.
+    """
+    index = DuplicateIndex(near)
+    duplicates = []
+    for ref, record in enumerate(records):
+        if record.is_local:
+            continue  # local files can't be removed through the API
+        fp = fingerprint_record(record)
+        found = index.match(fp)
+        if found is None:
+            index.add(fp, ref)
+            continue
+        original, reason = found
+        duplicates.append({
+            "position": playlist_position(record, ref),
+            "uri": record.uri,
+            "name": record.name,
+            "artists": [a.name for a in record.artists],
+            "reason": reason,
+            "duplicate_of": {
+                "position": playlist_position(records[original], original),
+                "uri": records[original].uri,
+                "name": records[original].name
+            }
+        })
+    return duplicates
+
+
+def removal_batches(duplicates: List[Dict]) -> List[List[Dict]]:
+    """
+    Position-specific remove payloads of at most REMOVE_BATCH items, highest
+    positions first so earlier batches never shift the positions of later ones.
+    """
+    ordered = sorted(duplicates, key=lambda d: d["position"], reverse=True)
+    batches = []
+    for start in range(0, len(ordered), REMOVE_BATCH):
+        positions: Dict[str, List[int]] = {}
+        for duplicate in ordered[start:start + REMOVE_BATCH]:
+            positions.setdefault(duplicate["uri"], []).append(duplicate["position"])
+        batches.append([{"uri": uri, "positions": sorted(p)} for uri, p in positions.items()])
+    return batches
+
+
+def unique_tracks(tracks: Iterable[Dict], existing: Iterable[Dict] = ()) -> List[Dict]:
+    """Tracks (raw Spotify objects) that don't duplicate `existing` or an earlier one, order kept"""
+    index = DuplicateIndex()
+    for ref, track in enumerate(existing):
+        index.add(fingerprint_track(track), ref)
+    kept = []
+    for track in tracks:
+        fp = fingerprint_track(track)
+        if index.match(fp) is None:
+            index.add(fp, -1)
+            kept.append(track)
+    return kept
@@ -0,0 +1,261 @@
+"""
+Per-user full-text index over the tracks of playlists we have fetched.
+
+Track names, artists and album names are tokenized (case- and accent-folded,
+split on non-word characters) into posting lists: token -> ids of the tracks
+containing it. A sorted vocabulary lets a query term match every token it
+prefixes with two bisects, so search-as-you-type works without a trie. Tokens
+added or dropped by updates are kept aside and merged into the vocabulary on
+the next search, in one linear pass, so indexing stays linear in its input.
+Postings are kept per field, so intersecting the terms and ranking matches
+by where each term hit (name > artist > album, whole word > prefix) are set
+operations rather than per-track scans.
+
+Indexes are updated whenever a playlist's tracks are fetched or read from
+the track cache, replacing that playlist's previous contents, so searching
+never calls Spotify. Each user's index only covers what this worker has seen.
+"""
+import bisect
+import heapq
+import re
+import unicodedata
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from .cache import TTLCache
+from .metrics import metrics
+from .records import TrackRecord
+
+MAX_INDEXED_USERS = 200
+INDEX_TTL = 6 * 3600  # seconds an index survives without being updated or searched
+MIN_PREFIX = 2  # shorter terms only match whole words
+FIELD_WEIGHTS = (3.0, 2.0, 1.0)  # name, artists, album
+PREFIX_FACTOR = 0.5  # a prefix hit counts half a whole-word hit
+
+WORD = re.compile(r"\w+")
+
+Fields = Tuple[Tuple[str, ...], Tuple[str, ...], Tuple[str, ...]]
+
+
+def fold(text: str) -> str:
+    """Lowercase and strip accents, keeping non-Latin scripts intact"""
+    text = text or ""
+    if text.isascii():
+        return text.lower()  # nothing to decompose, and casefold() equals lower() for ASCII
+    decomposed = unicodedata.normalize("NFKD", text.casefold())
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def tokenize(text: str) -> List[str]:
+    return WORD.findall(fold(text))
+
+
+def record_fields(record: TrackRecord) -> Fields:
+    return (
+        tuple(tokenize(record.name)),
+        tuple(token for artist in record.artists for token in tokenize(artist.name)),
+        tuple(tokenize(record.album.name)) if record.album is not None else (),
+    )
+
+
+class LibraryIndex:
+    def __init__(self):
+        self._doc_ids: Dict[str, int] = {}  # uri -> doc id
+        self._records: List[Optional[TrackRecord]] = []
+        self._fields: List[Optional[Fields]] = []
+        self._doc_playlists: List[Set[str]] = []
+        self._free: List[int] = []
+        # One posting dict per field (name, artists, album), so ranking is set algebra
+        self._postings: Tuple[Dict[str, Set[int]], ...] = ({}, {}, {})
+        self._token_fields: Dict[str, int] = {}  # token -> number of fields it appears in
+        self._vocab: List[str] = []  # sorted keys of _token_fields, once the changes below are merged
+        self._vocab_added: Set[str] = set()  # in _token_fields, not yet in _vocab
+        self._vocab_removed: Set[str] = set()  # still in _vocab, no longer in _token_fields
+        self._playlists: Dict[str, Set[int]] = {}  # playlist_id -> doc ids
+        self._sources: Dict[str, List[TrackRecord]] = {}  # playlist_id -> track list last indexed
+        self.playlist_names: Dict[str, str] = {}
+
+    @property
+    def size(self) -> int:
+        return len(self._doc_ids)
+
+    @property
+    def playlist_count(self) -> int:
+        return len(self._playlists)
+
+    # Updates
+
+    def index_playlist(self, playlist_id: str, tracks: List[TrackRecord]) -> bool:
+        """Replace a playlist's contents; a no-op for the track list already indexed"""
+        if self._sources.get(playlist_id) is tracks:
+            return False
+        self.remove_playlist(playlist_id)
+        doc_ids = set()
+        for record in tracks:
+            if not record.uri:
+                continue
+            doc_id = self._doc_ids.get(record.uri)
+            if doc_id is None:
+                doc_id = self._add_doc(record)
+            self._doc_playlists[doc_id].add(playlist_id)
+            doc_ids.add(doc_id)
+        self._playlists[playlist_id] = doc_ids
+        self._sources[playlist_id] = tracks
+        return True
+
+    def remove_playlist(self, playlist_id: str) -> None:
+        self._sources.pop(playlist_id, None)
+        for doc_id in self._playlists.pop(playlist_id, ()):
+            playlists = self._doc_playlists[doc_id]
+            playlists.discard(playlist_id)
+            if not playlists:
+                self._remove_doc(doc_id)
+
+    def retain(self, playlist_ids: Iterable[str]) -> None:
+        """Drop playlists no longer in the user's library"""
+        keep = set(playlist_ids)
+        for playlist_id in [p for p in self._playlists if p not in keep]:
+            self.remove_playlist(playlist_id)
+
+    def _add_doc(self, record: TrackRecord) -> int:
+        fields = record_fields(record)
+        if self._free:
+            doc_id = self._free.pop()
+            self._records[doc_id], self._fields[doc_id], self._doc_playlists[doc_id] = record, fields, set()
+        else:
+            doc_id = len(self._records)
+            self._records.append(record)
+            self._fields.append(fields)
+            self._doc_playlists.append(set())
+        self._doc_ids[record.uri] = doc_id
+        for postings, tokens in zip(self._postings, fields):
+            for token in set(tokens):
+                posting = postings.get(token)
+                if posting is None:
+                    posting = postings[token] = set()
+                    count = self._token_fields.get(token, 0)
+                    if not count:
+                        self._vocab_changed(token, added=True)
+                    self._token_fields[token] = count + 1
+                posting.add(doc_id)
+        return doc_id
+
+    def _remove_doc(self, doc_id: int) -> None:
+        record, fields = self._records[doc_id], self._fields[doc_id]
+        for postings, tokens in zip(self._postings, fields):
+            for token in set(tokens):
+                posting = postings[token]
+                posting.discard(doc_id)
+                if posting:
+                    continue
+                del postings[token]
+                self._token_fields[token] -= 1
+                if not self._token_fields[token]:
+                    del self._token_fields[token]
+                    self._vocab_changed(token, added=False)
+        del self._doc_ids[record.uri]
+        self._records[doc_id] = self._fields[doc_id] = None
+        self._free.append(doc_id)
+
+    def _vocab_changed(self, token: str, added: bool) -> None:
+        # A token dropped and re-added before the next merge cancels out
+        if added:
+            if token in self._vocab_removed:
+                self._vocab_removed.discard(token)
+            else:
+                self._vocab_added.add(token)
+        elif token in self._vocab_added:
+            self._vocab_added.discard(token)
+        else:
+            self._vocab_removed.add(token)
+
+    def _merge_vocab(self) -> None:
+        if self._vocab_removed:
+            removed = self._vocab_removed
+            self._vocab = [token for token in self._vocab if token not in removed]
+            self._vocab_removed = set()
+        if self._vocab_added:
+            # Two sorted runs: timsort merges them in linear time
+            self._vocab += sorted(self._vocab_added)
+            self._vocab.sort()
+            self._vocab_added = set()
+
+    # Queries
+
+    def _prefixed(self, term: str) -> List[str]:
+        """Indexed tokens that extend `term` (the term itself excluded)"""
+        if len(term) < MIN_PREFIX:
+            return []
+        self._merge_vocab()
+        start = bisect.bisect_right(self._vocab, term)
+        end = bisect.bisect_left(self._vocab, term + "\U0010ffff")
+        return self._vocab[start:end]
+
+    def _tiers(self, term: str) -> List[Tuple[float, Set[int]]]:
+        """(weight, docs) per field and match kind, best weight first"""
+        prefixed = self._prefixed(term)
+        tiers = []
+        for weight, postings in zip(FIELD_WEIGHTS, self._postings):
+            exact = postings.get(term)
+            if exact:
+                tiers.append((weight, exact))
+            partial = [postings[t] for t in prefixed if t in postings]
+            if partial:
+                tiers.append((weight * PREFIX_FACTOR, set().union(*partial)))
+        tiers.sort(key=lambda tier: tier[0], reverse=True)
+        return tiers
+
+    def search(self, query: str, limit: int = 20) -> Tuple[List[Tuple[TrackRecord, List[str], float]], int]:
+        """([(record, playlist_ids, score)], number of matches); every term must match"""
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return [], 0
+        tiers = [self._tiers(term) for term in terms]
+        # Intersect the most selective terms first
+        matches = sorted((set().union(*(docs for _, docs in t)) for t in tiers), key=len)
+        candidates = matches[0]
+        for docs in matches[1:]:
+            if not candidates:
+                break
+            candidates = candidates & docs
+
+        # A term scores its best tier per track
+        scores = dict.fromkeys(candidates, 0.0)
+        for term_tiers in tiers:
+            credited: Set[int] = set()
+            for weight, docs in term_tiers:
+                hit = (docs & candidates) - credited
+                for doc_id in hit:
+                    scores[doc_id] += weight
+                credited |= hit
+
+        best = heapq.nlargest(limit, scores, key=lambda d: (scores[d], len(self._doc_playlists[d])))
+        return [
+            (self._records[d], sorted(self._doc_playlists[d]), scores[d])
+            for d in best
+        ], len(candidates)
+
+
+_indexes = TTLCache(maxsize=MAX_INDEXED_USERS, ttl=INDEX_TTL)
+metrics.register_gauge("library_index.users", lambda: len(_indexes))
+
+
+def get_index(user_id: str) -> LibraryIndex:
+    index = _indexes.peek(user_id)
+    if index is None:
+        index = LibraryIndex()
+    _indexes.set(user_id, index)
+    return index
+
+
+def index_playlist(user_id: Optional[str], playlist_id: str, tracks: List[TrackRecord]) -> None:
+    if not user_id:
+        return
+    if get_index(user_id).index_playlist(playlist_id, tracks):
+        metrics.incr("library_index.updates")
+
+
+def update_listing(user_id: str, names: Dict[str, str]) -> None:
+    """Record playlist names and forget playlists that left the library"""
+    index = get_index(user_id)
+    index.playlist_names = names
+    index.retain(names)
@@ -0,0 +1,244 @@
+"""
+Gateway for LLM completions shared by every request in the worker.
+
+One async provider client is reused across requests. At most LLM_CONCURRENCY
+completions run at once; further requests wait in a priority queue (lower
+number first, FIFO within a priority) for at most their timeout, and are
+turned away straight away once LLM_MAX_QUEUE are waiting. Transient failures
+are retried with jittered exponential backoff, each attempt going through
+the Anthropic circuit breaker.
+
+LLM_PROVIDER=fake swaps in a local provider with configurable latency and
+failure rate, so the brand flow can be load-tested offline.
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import random
+import time
+from typing import List, Optional, Tuple
+
+import anthropic
+from anthropic import AsyncAnthropic, HUMAN_PROMPT, AI_PROMPT
+from fastapi import HTTPException
+from starlette.concurrency import run_in_threadpool
+
+from .circuit_breaker import CircuitOpenError, get_breaker, upstream_status
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Gateway configuration
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "4"))  # completions in flight per worker
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "100"))
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "30"))  # seconds a request may wait for a slot
+LLM_REQUEST_TIMEOUT = 60  # seconds per provider call
+LLM_MAX_RETRIES = 3
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 8.0
+
+ANTHROPIC_MODEL = os.getenv("ANTHROPIC_MODEL", "claude-2")
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 10
+
+anthropic_breaker = get_breaker("anthropic", (anthropic.APIConnectionError,))
+
+
+class GatewayBusy(Exception):
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.retry_after = retry_after
+
+
+def busy(exc: GatewayBusy) -> HTTPException:
+    return HTTPException(status_code=503, detail=str(exc), headers={"Retry-After": str(int(exc.retry_after))})
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+class AnthropicProvider:
+    """Legacy completions API (the pinned SDK predates messages) on a shared async client"""
+
+    name = "anthropic"
+
+    def __init__(self, api_key: str, model: str = ANTHROPIC_MODEL):
+        # The gateway does its own retries
+        self.client = AsyncAnthropic(api_key=api_key, max_retries=0, timeout=LLM_REQUEST_TIMEOUT)
+        self.model = model
+
+    async def complete(self, prompt: str, max_tokens: int, stop_sequences: Optional[List[str]] = None) -> str:
+        response = await self.client.completions.create(
+            model=self.model,
+            prompt=f"{HUMAN_PROMPT}{prompt}{AI_PROMPT}",
+            max_tokens_to_sample=max_tokens,
+            stop_sequences=[HUMAN_PROMPT] + list(stop_sequences or [])
+        )
+        return response.completion
+
+    async def count_tokens(self, text: str) -> int:
+        try:
+            return await run_in_threadpool(self.client.count_tokens, text)
+        except Exception:
+            return estimate_tokens(text)
+
+    def is_transient(self, exc: BaseException) -> bool:
+        if isinstance(exc, (anthropic.APIConnectionError, anthropic.RateLimitError, anthropic.InternalServerError)):
+            return True
+        status = upstream_status(exc)
+        return status is not None and (status >= 500 or status == 429)
+
+
+class FakeTransientError(Exception):
+    pass
+
+
+class FakeProvider:
+    """Offline stand-in returning well-formed suggestions after a simulated delay"""
+
+    name = "fake"
+    SONGS = [
+        ("Midnight City", "M83"), ("Dreams", "Fleetwood Mac"), ("Get Lucky", "Daft Punk"),
+        ("Nightcall", "Kavinsky"), ("Lose Yourself to Dance", "Daft Punk"), ("Heroes", "David Bowie"),
+        ("Breathe", "Télépopmusik"), ("Teardrop", "Massive Attack"), ("Intro", "The xx"),
+        ("Kids", "MGMT"), ("Electric Feel", "MGMT"), ("Redbone", "Childish Gambino"),
+    ]
+
+    def __init__(self, latency: float = 1.0, jitter: float = 0.5, failure_rate: float = 0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+
+    async def complete(self, prompt: str, max_tokens: int, stop_sequences: Optional[List[str]] = None) -> str:
+        await asyncio.sleep(max(0.0, random.gauss(self.latency, self.jitter)))
+        if random.random() < self.failure_rate:
+            raise FakeTransientError("Simulated provider failure")
+        songs = random.sample(self.SONGS, 10)
+        return "\n\n".join(
+            f"Song: {song}\nArtist: {artist}\nWhy it fits: A fake suggestion for load testing."
+            for song, artist in songs
+        )
+
+    async def count_tokens(self, text: str) -> int:
+        return estimate_tokens(text)
+
+    def is_transient(self, exc: BaseException) -> bool:
+        return isinstance(exc, FakeTransientError)
+
+
+def create_provider():
+    if os.getenv("LLM_PROVIDER", "anthropic").lower() == "fake":
+        return FakeProvider(
+            latency=float(os.getenv("LLM_FAKE_LATENCY", "1.0")),
+            jitter=float(os.getenv("LLM_FAKE_JITTER", "0.5")),
+            failure_rate=float(os.getenv("LLM_FAKE_FAILURE_RATE", "0.0"))
+        )
+    api_key = os.getenv("ANTHROPIC_API_KEY")
+    if not api_key:
+        logger.error("ANTHROPIC_API_KEY not found")
+        raise ValueError("ANTHROPIC_API_KEY not set")
+    return AnthropicProvider(api_key.strip())
+
+
+class LLMGateway:
+    def __init__(self, provider, concurrency: int = LLM_CONCURRENCY, max_queue: int = LLM_MAX_QUEUE):
+        self.provider = provider
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self._active = 0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        metrics.register_gauge("llm.queue_depth", lambda: self.queue_depth)
+        metrics.register_gauge("llm.active", lambda: self._active)
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(1 for _, _, waiter in self._waiters if not waiter.done())
+
+    async def _acquire(self, priority: int, timeout: float) -> None:
+        if self._active < self.concurrency and not self.queue_depth:
+            self._active += 1
+            return
+        if self.queue_depth >= self.max_queue:
+            metrics.incr("llm.rejected")
+            raise GatewayBusy("LLM queue is full", retry_after=timeout)
+        waiter = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), waiter))
+        try:
+            # The slot is handed over by _release, so _active already counts us
+            await asyncio.wait_for(asyncio.shield(waiter), timeout=timeout)
+        except asyncio.TimeoutError:
+            if waiter.done() and not waiter.cancelled():
+                return  # granted just as we timed out
+            waiter.cancel()
+            metrics.incr("llm.queue_timeouts")
+            raise GatewayBusy(f"Timed out after {timeout:.0f}s waiting for the LLM", retry_after=timeout)
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self._release()
+            else:
+                waiter.cancel()
+            raise
+
+    def _release(self) -> None:
+        while self._waiters:
+            _, _, waiter = heapq.heappop(self._waiters)
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self._active -= 1
+
+    async def complete(
+        self,
+        prompt: str,
+        max_tokens: int,
+        stop_sequences: Optional[List[str]] = None,
+        priority: int = PRIORITY_INTERACTIVE,
+        timeout: float = LLM_QUEUE_TIMEOUT
+    ) -> str:
+        queued_at = time.monotonic()
+        metrics.incr("llm.requests")
+        await self._acquire(priority, timeout)
+        metrics.observe("llm.queue_wait", time.monotonic() - queued_at)
+        try:
+            text = await self._complete_with_retries(prompt, max_tokens, stop_sequences)
+        finally:
+            self._release()
+        metrics.incr("llm.tokens.prompt", await self.provider.count_tokens(prompt))
+        metrics.incr("llm.tokens.completion", await self.provider.count_tokens(text))
+        return text
+
+    async def _complete_with_retries(self, prompt: str, max_tokens: int, stop_sequences: Optional[List[str]]) -> str:
+        attempt = 0
+        while True:
+            started = time.monotonic()
+            try:
+                text = await anthropic_breaker.call(self.provider.complete, prompt, max_tokens, stop_sequences)
+                metrics.observe("llm.latency", time.monotonic() - started)
+                return text
+            except CircuitOpenError:
+                raise
+            except Exception as e:
+                attempt += 1
+                if attempt > LLM_MAX_RETRIES or not self.provider.is_transient(e):
+                    metrics.incr("llm.failures")
+                    raise
+                delay = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** (attempt - 1)) * random.uniform(0.5, 1.0)
+                metrics.incr("llm.retries")
+                logger.warning(f"LLM call failed ({str(e)}), retry {attempt} in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+
+_gateway: Optional[LLMGateway] = None
+
+
+def get_gateway() -> LLMGateway:
+    global _gateway
+    if _gateway is None:
+        _gateway = LLMGateway(create_provider())
+        logger.info(f"LLM gateway using {_gateway.provider.name} provider, concurrency {_gateway.concurrency}")
+    return _gateway
@@ -0,0 +1,86 @@
+"""
+In-process metrics registry exposed at /metrics.
+
+Counters and timings are per worker; gauges can be registered as callables
+so derived values (hit ratios, queue depths, top-N breakdowns) are computed
+on read.
+"""
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, TypeVar
+
+T = TypeVar("T")
+
+
+class Metrics:
+    def __init__(self):
+        self._counters: Dict[str, float] = {}
+        self._timings: Dict[str, Dict[str, float]] = {}
+        self._gauges: Dict[str, Callable[[], Any]] = {}
+        self._lock = threading.Lock()
+
+    def incr(self, name: str, value: float = 1) -> None:
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def observe(self, name: str, seconds: float) -> None:
+        """Record a duration sample."""
+        with self._lock:
+            timing = self._timings.setdefault(name, {"count": 0, "total": 0.0, "max": 0.0})
+            timing["count"] += 1
+            timing["total"] += seconds
+            timing["max"] = max(timing["max"], seconds)
+
+    def register_gauge(self, name: str, fn: Callable[[], Any]) -> None:
+        self._gauges[name] = fn
+
+    def counter(self, name: str) -> float:
+        return self._counters.get(name, 0)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            counters = dict(self._counters)
+            timings = {
+                name: {**t, "avg": t["total"] / t["count"] if t["count"] else 0.0}
+                for name, t in self._timings.items()
+            }
+        gauges = {}
+        for name, fn in self._gauges.items():
+            try:
+                gauges[name] = fn()
+            except Exception:
+                gauges[name] = None
+        return {"counters": counters, "gauges": gauges, "timings": timings}
+
+
+metrics = Metrics()
+
+
+class StageTimer:
+    """
+    Per-request stage latencies. Stages may overlap, so each records its
+    start offset as well as its duration; every stage is also observed in
+    the global metrics as `<prefix>.<stage>`.
+    """
+
+    def __init__(self, prefix: str):
+        self.prefix = prefix
+        self.started = time.monotonic()
+        self.stages: Dict[str, Dict[str, float]] = {}
+
+    async def run(self, name: str, awaitable: Awaitable[T]) -> T:
+        start = time.monotonic()
+        try:
+            return await awaitable
+        finally:
+            end = time.monotonic()
+            self.stages[name] = {
+                "start_ms": round((start - self.started) * 1000, 1),
+                "duration_ms": round((end - start) * 1000, 1)
+            }
+            metrics.observe(f"{self.prefix}.{name}", end - start)
+
+    def report(self) -> Dict:
+        total = time.monotonic() - self.started
+        metrics.observe(f"{self.prefix}.total", total)
+        return {"total_ms": round(total * 1000, 1), "stages": self.stages}
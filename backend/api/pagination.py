@@ -0,0 +1,133 @@
+"""
+Cursor pagination over server-side snapshots.
+
+The first page request freezes the list (a playlist listing or a playlist's
+tracks) into a snapshot held in memory; cursors point into that snapshot, so
+scrolling stays consistent even if the playlist changes meanwhile. A snapshot
+can be filled in the background: the first page is answered as soon as the
+first upstream page arrives and later pages wait only for what they need.
+
+Cursors are opaque to clients (url-safe base64 of snapshot id and offset)
+and only valid for the user who created the snapshot, on the route that
+created it: each snapshot records its source (a playlist id, or "listing").
+"""
+import asyncio
+import base64
+import binascii
+import json
+import logging
+import uuid
+from datetime import datetime
+from typing import Any, AsyncIterator, Callable, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+from .cache import TTLCache
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PAGE_LIMIT = 50
+MAX_PAGE_LIMIT = 100
+SNAPSHOT_TTL = 900  # seconds a snapshot stays scrollable after it was last used
+MAX_SNAPSHOTS = 500
+LISTING_SOURCE = "listing"  # source of snapshots of the playlist listing; others use the playlist id
+
+
+def encode_cursor(snapshot_id: str, offset: int) -> str:
+    raw = json.dumps({"s": snapshot_id, "o": offset}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        data = json.loads(raw)
+        snapshot_id, offset = str(data["s"]), int(data["o"])
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if offset < 0:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return snapshot_id, offset
+
+
+def page_limit(limit: Optional[int]) -> int:
+    return max(1, min(limit or DEFAULT_PAGE_LIMIT, MAX_PAGE_LIMIT))
+
+
+class PagedSnapshot:
+    """A frozen list, either complete up front or filled page by page in the background"""
+
+    def __init__(self, owner: str, source: str, items: Optional[List[Any]] = None, total: Optional[int] = None):
+        self.id = uuid.uuid4().hex
+        self.owner = owner
+        self.source = source
+        self.created = datetime.now().isoformat()
+        self.items: List[Any] = list(items) if items is not None else []
+        self.complete = items is not None
+        self.total = len(self.items) if self.complete else total
+        self._progress = asyncio.Event()
+        self._error: Optional[BaseException] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def fill(self, pages: AsyncIterator[List[Any]], on_complete: Optional[Callable[[List[Any]], None]] = None) -> None:
+        self._task = asyncio.create_task(self._fill(pages, on_complete))
+
+    async def _fill(self, pages: AsyncIterator[List[Any]], on_complete: Optional[Callable[[List[Any]], None]]) -> None:
+        try:
+            async for page in pages:
+                self.items.extend(page)
+                self._notify()
+            self.complete = True
+            self.total = len(self.items)
+            if on_complete:
+                on_complete(self.items)
+        except Exception as e:
+            logger.warning(f"Error filling snapshot {self.id}: {str(e)}")
+            self._error = e
+        finally:
+            self._notify()
+
+    def _notify(self) -> None:
+        progress, self._progress = self._progress, asyncio.Event()
+        progress.set()
+
+    async def page(self, offset: int, limit: int) -> List[Any]:
+        while len(self.items) < offset + limit and not self.complete:
+            if self._error is not None:
+                if len(self.items) > offset:
+                    break  # serve what arrived before the failure
+                raise self._error
+            await self._progress.wait()
+        return self.items[offset:offset + limit]
+
+    def next_cursor(self, offset: int, count: int) -> Optional[str]:
+        end = offset + count
+        if count and (not self.complete or end < len(self.items)):
+            return encode_cursor(self.id, end)
+        return None
+
+
+class SnapshotStore:
+    def __init__(self, maxsize: int = MAX_SNAPSHOTS, ttl: float = SNAPSHOT_TTL):
+        self._snapshots = TTLCache(maxsize=maxsize, ttl=ttl)
+        metrics.register_gauge("pagination.snapshots", lambda: len(self._snapshots))
+
+    def add(self, snapshot: PagedSnapshot) -> PagedSnapshot:
+        self._snapshots.set(snapshot.id, snapshot)
+        return snapshot
+
+    def resume(self, cursor: str, owner: str, source: str) -> Tuple[PagedSnapshot, int]:
+        """(snapshot, offset) for a cursor; 410 once the snapshot has expired, 400 if it pages something else"""
+        snapshot_id, offset = decode_cursor(cursor)
+        snapshot = self._snapshots.get(snapshot_id)
+        if snapshot is None or snapshot.owner != owner:
+            metrics.incr("pagination.expired")
+            raise HTTPException(status_code=410, detail="Cursor expired, start again without a cursor")
+        if snapshot.source != source:
+            raise HTTPException(status_code=400, detail="Cursor belongs to a different list")
+        self._snapshots.set(snapshot_id, snapshot)  # scrolling keeps it alive
+        return snapshot, offset
+
+
+snapshots = SnapshotStore()
@@ -1,11 +1,34 @@
-from fastapi import APIRouter, HTTPException, Header, Depends, Request, Body
-from typing import Optional, Dict, List
+from fastapi import APIRouter, HTTPException, Header, Depends, Request, Body, File, Form, UploadFile, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from typing import AsyncIterator, Optional, Dict, List, Tuple
+from itertools import islice
 import spotipy
 from spotipy.oauth2 import SpotifyOAuth
 import logging
-import time
+import asyncio
+import numpy as np
 from datetime import datetime
-from .auth import get_auth_manager, extract_token
+from .auth import get_auth_manager, extract_token, token_manager
+from .spotify_client import (
+    PRIORITY_BULK, PlaylistWriter, call_spotify, chunked, runs_at, spotify_breaker, spotify_context,
+    spotify_priority, spotify_user
+)
+from .circuit_breaker import CircuitOpenError, unavailable, with_stale_fallback
+from .metrics import StageTimer
+from .cache import TTLCache
+from . import analytics
+from . import transfer
+from . import watcher
+from . import dedupe
+from . import library_index
+from . import sequencing
+from . import set_algebra
+from .prefetch import PREFETCH_ENABLED, get_prefetcher
+from .pagination import LISTING_SOURCE, PagedSnapshot, page_limit, snapshots
+from .conditional import conditional, listing_etag, tracks_etag
+from .records import PlaylistRecord, TrackRecord
+from .audio_features import FeatureEnricher, get_feature_store, spotify_fetcher, track_id_from_uri
 from pydantic import BaseModel
 
 logger = logging.getLogger(__name__)
@@ -15,11 +38,47 @@ router = APIRouter()
 REQUEST_DELAY = 0.2  # 200ms delay between requests to prevent rate limiting
 MAX_RETRIES = 3
 BATCH_SIZE = 20  # Reduced batch size to prevent memory issues
+BULK_CONCURRENCY = 5  # playlists updated at once by a bulk request
+TRACKS_PAGE_SIZE = 100  # max items per playlist_items page
+STATS_CONCURRENCY = 4  # playlists fetched at once for library stats
+ALBUM_TRACKS_PAGE_SIZE = 50  # max items per album_tracks page
+IMPORT_BATCH_SIZE = 100  # rows resolved and written per step
+IMPORT_CONCURRENCY = 8  # concurrent searches while resolving an import batch
+LISTING_PAGE_SIZE = 50  # max playlists per current_user_playlists page
+REPLACE_PAGE_SIZE = 100  # max items per replace/add call when rewriting a playlist in a new order
+
+# Cache Configuration
+# Track lists are cached per user, so a hit never serves a playlist Spotify hasn't shown that user
+track_cache = TTLCache(maxsize=500, ttl=600)  # (user_id, playlist_id) -> {snapshot_id, tracks: [TrackRecord], fetch_time}
+track_cache_users = TTLCache(maxsize=500, ttl=600)  # playlist_id -> user_ids with a cached copy, for invalidation
+listing_cache = TTLCache(maxsize=200, ttl=300)  # user_id -> {playlists: [PlaylistRecord], by_id, etag}
 
 # Request Models
 class AddTracksRequest(BaseModel):
     uris: List[str]
 
+class PlaylistOperation(BaseModel):
+    playlist_id: str
+    add_uris: List[str] = []
+    remove_uris: List[str] = []
+
+class BulkOperationsRequest(BaseModel):
+    operations: List[PlaylistOperation]
+
+class EnrichFeaturesRequest(BaseModel):
+    playlist_ids: List[str] = []
+    track_uris: List[str] = []
+
+class CombineRequest(BaseModel):
+    expression: str  # e.g. "(A | B) - C", see set_algebra
+    dedupe_by: str = "uri"  # or "isrc"
+    target_playlist_id: Optional[str] = None  # write into an existing playlist
+    mode: str = "replace"  # or "append", for target_playlist_id
+    name: Optional[str] = None  # or create a new playlist
+    description: str = ""
+    public: bool = False
+    dry_run: bool = False
+
 async def get_spotify_client(request: Request) -> spotipy.Spotify:
     """
     Create a Spotify client with token refresh handling.
@@ -36,17 +95,13 @@ async def get_spotify_client(request: Request) -> spotipy.Spotify:
             if not token:
                 raise ValueError("Empty token")
             
-            # Create Spotify client with token directly
-            sp = spotipy.Spotify(auth=token)
-            
-            # Test the client
-            try:
-                sp.me()
-                logger.info("Successfully created Spotify client")
-                return sp
-            except Exception as e:
-                logger.error(f"Error validating token with Spotify API: {str(e)}")
-                raise HTTPException(status_code=401, detail="Invalid token")
+            # The token manager knows expiry and refreshes server-side, no sp.me() round trip
+            session = await token_manager.ensure_valid(token)
+            request.state.user_id = session['user_id']
+            # Async dependencies share the endpoint's context, so its Spotify calls are queued under this user
+            spotify_user.set(session['user_id'])
+            watcher.hub.touch(session['user_id'])
+            return spotipy.Spotify(auth=session['access_token'])
             
         except ValueError as e:
             raise HTTPException(status_code=401, detail=str(e))
@@ -60,9 +115,11 @@ async def get_spotify_client(request: Request) -> spotipy.Spotify:
             detail="Invalid or expired token. Please re-authenticate."
         )
 
-async def fetch_all_playlists(sp: spotipy.Spotify, user_id: str) -> List[Dict]:
+@runs_at(PRIORITY_BULK)
+async def fetch_all_playlists(sp: spotipy.Spotify, user_id: str) -> List[PlaylistRecord]:
     """
     Fetch all playlists for a user with comprehensive error handling and retries.
+    Raises once a page keeps failing: the listing is cached and diffed, so it must be complete.
     """
     try:
         all_playlists = {}  # Use dict to prevent duplicates
@@ -73,101 +130,75 @@ async def fetch_all_playlists(sp: spotipy.Spotify, user_id: str) -> List[Dict]:
         offset = 0
         while True:
             try:
-                logger.info(f"Fetching user playlists batch, offset: {offset}")
-                playlists = sp.current_user_playlists(limit=BATCH_SIZE, offset=offset)
+                logger.debug(f"Fetching user playlists batch, offset: {offset}")
+                playlists = await call_spotify(sp.current_user_playlists, limit=BATCH_SIZE, offset=offset)
                 retry_count = 0  # Reset retry count on success
                 
                 if not playlists or 'items' not in playlists:
-                    logger.error("Invalid response from Spotify API")
-                    break
+                    raise ValueError("Invalid response from Spotify API")
                     
                 if playlists['items']:
                     for playlist in playlists['items']:
-                        all_playlists[playlist['id']] = {
-                            **playlist,
-                            'is_owner': playlist['owner']['id'] == user_id,
-                            'fetch_time': datetime.now().isoformat()
-                        }
-                    logger.info(f"Added {len(playlists['items'])} playlists")
+                        all_playlists[playlist['id']] = PlaylistRecord.from_playlist(playlist, user_id)
+                    logger.debug(f"Added {len(playlists['items'])} playlists")
                 
                 if not playlists.get('next'):
                     break
                     
                 offset += BATCH_SIZE
-                time.sleep(REQUEST_DELAY)
                 
+            except CircuitOpenError:
+                # Fail fast, retrying against an open circuit only piles up requests
+                raise
             except Exception as e:
                 retry_count += 1
                 if retry_count >= MAX_RETRIES:
                     logger.error(f"Max retries reached while fetching playlists: {str(e)}")
-                    break
+                    raise
                 logger.warning(f"Retry {retry_count} after error: {str(e)}")
-                time.sleep(REQUEST_DELAY * 2)
+                await asyncio.sleep(REQUEST_DELAY * 2)
                 continue
         
-        # Get collaborative playlists
-        try:
-            logger.info("Fetching collaborative playlists")
-            collab_playlists = sp.current_user_playlists(limit=BATCH_SIZE)
-            
-            while collab_playlists:
-                for playlist in collab_playlists['items']:
-                    if playlist.get('collaborative') and playlist['id'] not in all_playlists:
-                        all_playlists[playlist['id']] = {
-                            **playlist,
-                            'is_owner': playlist['owner']['id'] == user_id,
-                            'fetch_time': datetime.now().isoformat()
-                        }
-                
-                if not collab_playlists.get('next'):
-                    break
-                    
-                collab_playlists = sp.next(collab_playlists)
-                time.sleep(REQUEST_DELAY)
-                
-        except Exception as e:
-            logger.warning(f"Error fetching collaborative playlists: {str(e)}")
-        
+        # Get collaborative playlists; a failure here fails the listing, which must not be cached partial
+        logger.info("Fetching collaborative playlists")
+        collab_playlists = await call_spotify(sp.current_user_playlists, limit=BATCH_SIZE)
+
+        while collab_playlists:
+            for playlist in collab_playlists['items']:
+                if playlist.get('collaborative') and playlist['id'] not in all_playlists:
+                    all_playlists[playlist['id']] = PlaylistRecord.from_playlist(playlist, user_id)
+
+            if not collab_playlists.get('next'):
+                break
+
+            collab_playlists = await call_spotify(sp.next, collab_playlists)
+
         # Get saved albums as playlists
-        try:
-            logger.info("Fetching saved albums")
-            offset = 0
-            
-            while True:
-                results = sp.current_user_saved_albums(limit=BATCH_SIZE, offset=offset)
-                if not results or 'items' not in results:
-                    break
-                    
-                for item in results['items']:
-                    if 'album' in item:
-                        album = item['album']
-                        playlist_id = f"album_{album['id']}"
-                        if playlist_id not in all_playlists:
-                            all_playlists[playlist_id] = {
-                                'id': playlist_id,
-                                'name': album['name'],
-                                'owner': {'id': album['artists'][0]['id'], 'display_name': album['artists'][0]['name']},
-                                'images': album.get('images', []),
-                                'tracks': {'total': album.get('total_tracks', 0)},
-                                'type': 'album',
-                                'is_owner': False,
-                                'fetch_time': datetime.now().isoformat()
-                            }
-                
-                if not results.get('next'):
-                    break
-                    
-                offset += BATCH_SIZE
-                time.sleep(REQUEST_DELAY)
-                
-        except Exception as e:
-            logger.warning(f"Error fetching saved albums: {str(e)}")
+        logger.info("Fetching saved albums")
+        offset = 0
+
+        while True:
+            results = await call_spotify(sp.current_user_saved_albums, limit=BATCH_SIZE, offset=offset)
+            if not results or 'items' not in results:
+                raise ValueError("Invalid saved albums response from Spotify API")
+
+            for item in results['items']:
+                if 'album' in item:
+                    album = item['album']
+                    playlist_id = f"album_{album['id']}"
+                    if playlist_id not in all_playlists:
+                        all_playlists[playlist_id] = PlaylistRecord.from_saved_album(album)
+
+            if not results.get('next'):
+                break
+
+            offset += BATCH_SIZE
         
         # Convert dict back to list
         playlists_list = list(all_playlists.values())
         
         # Add statistics
-        owned = sum(1 for p in playlists_list if p['is_owner'])
+        owned = sum(1 for p in playlists_list if p.is_owner)
         followed = len(playlists_list) - owned
         
         end_time = datetime.now()
@@ -178,39 +209,898 @@ async def fetch_all_playlists(sp: spotipy.Spotify, user_id: str) -> List[Dict]:
         
         return playlists_list
         
+    except CircuitOpenError:
+        raise
     except Exception as e:
         logger.error(f"Error fetching playlists: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to fetch playlists: {str(e)}")
 
+async def fetch_playlist_tracks(sp: spotipy.Spotify, playlist_id: str) -> List[TrackRecord]:
+    """
+    Fetch every track of a playlist (or saved album) as compact records, with pagination and retries.
+    Raises once a page keeps failing: callers cache and write back the result, so it must be complete.
+    """
+    # Handle album-type playlists
+    if playlist_id.startswith('album_'):
+        records = []
+        async for page in iter_track_records(sp, playlist_id):
+            records.extend(page)
+        return records
+
+    all_tracks = []
+    offset = 0
+    retry_count = 0
+    while True:
+        try:
+            results = await call_spotify(
+                sp.playlist_items,
+                playlist_id,
+                offset=offset,
+                limit=TRACKS_PAGE_SIZE,
+                additional_types=['track']
+            )
+            retry_count = 0
+
+            if results['items']:
+                # Items whose track is gone are skipped, but keep their slot in the positions of the rest
+                tracks = [
+                    TrackRecord.from_item(item, position=offset + i)
+                    for i, item in enumerate(results['items']) if item['track']
+                ]
+                all_tracks.extend(tracks)
+                logger.debug(f"Fetched {len(tracks)} tracks, total: {len(all_tracks)}")
+
+            if not results['next']:
+                break
+
+            offset += TRACKS_PAGE_SIZE
+
+        except CircuitOpenError:
+            raise
+        except Exception as e:
+            retry_count += 1
+            if retry_count >= MAX_RETRIES:
+                logger.error(f"Max retries reached while fetching tracks: {str(e)}")
+                raise
+            logger.warning(f"Retry {retry_count} after error: {str(e)}")
+            await asyncio.sleep(REQUEST_DELAY * 2)
+    return all_tracks
+
+def known_snapshot(user_id: str, playlist_id: str) -> Optional[str]:
+    """snapshot_id of a playlist from the user's cached listing, if any"""
+    listing = listing_cache.peek(user_id)
+    if not listing:
+        return None
+    playlist = listing["by_id"].get(playlist_id)
+    return playlist.snapshot_id if playlist else None
+
+async def get_cached_tracks(sp: spotipy.Spotify, user_id: str, playlist_id: str, snapshot_id: Optional[str] = None) -> Dict:
+    """
+    Track items of a playlist from the user's cache, fetching them when
+    missing or when the cached copy belongs to a different snapshot.
+    """
+    entry = track_cache.get((user_id, playlist_id))
+    if entry and snapshot_matches(entry, snapshot_id):
+        library_index.index_playlist(user_id, playlist_id, entry["tracks"])
+        return entry
+
+    tracks = await fetch_playlist_tracks(sp, playlist_id)
+    entry = {
+        "snapshot_id": snapshot_id,
+        "tracks": tracks,
+        "fetch_time": datetime.now().isoformat()
+    }
+    cache_tracks(user_id, playlist_id, entry)
+    return entry
+
+def snapshot_matches(entry: Dict, snapshot_id: Optional[str]) -> bool:
+    """A copy cached without a snapshot_id can't vouch for any particular snapshot"""
+    return snapshot_id is None or entry["snapshot_id"] == snapshot_id
+
+def cache_tracks(user_id: str, playlist_id: str, entry: Dict) -> None:
+    track_cache.set((user_id, playlist_id), entry)
+    users = track_cache_users.peek(playlist_id) or set()
+    users.add(user_id)
+    track_cache_users.set(playlist_id, users)
+    library_index.index_playlist(user_id, playlist_id, entry["tracks"])
+
+def peek_cached_tracks(user_id: str, playlist_id: str) -> Optional[Dict]:
+    return track_cache.peek((user_id, playlist_id))
+
+def invalidate_playlist(playlist_id: str) -> None:
+    """Drop every user's cached tracks after we modify a playlist"""
+    for user_id in track_cache_users.pop(playlist_id) or ():
+        track_cache.pop((user_id, playlist_id))
+
+async def get_cached_listing(sp: spotipy.Spotify, user_id: str) -> List[PlaylistRecord]:
+    """The user's playlist listing from the cache, fetching it when missing"""
+    listing = listing_cache.get(user_id)
+    if listing:
+        return listing["playlists"]
+    playlists = await fetch_all_playlists(sp, user_id)
+    cache_listing(user_id, playlists)
+    return playlists
+
+def cache_listing(user_id: str, playlists: List[PlaylistRecord]) -> None:
+    listing_cache.set(user_id, {
+        "playlists": playlists,
+        "by_id": {p.id: p for p in playlists},
+        "etag": listing_etag(playlists)
+    })
+    library_index.update_listing(user_id, {p.id: p.name for p in playlists})
+
+async def fetch_playlist_snapshots(sp: spotipy.Spotify, user_id: str) -> Dict[str, PlaylistRecord]:
+    """The user's playlists (not saved albums) with their current snapshot_ids, in as few calls as possible"""
+    playlists = {}
+    offset = 0
+    while True:
+        results = await call_spotify(sp.current_user_playlists, limit=LISTING_PAGE_SIZE, offset=offset)
+        for playlist in results['items']:
+            playlists[playlist['id']] = PlaylistRecord.from_playlist(playlist, user_id)
+        if not results.get('next'):
+            return playlists
+        offset += LISTING_PAGE_SIZE
+
+async def poll_changes(
+    user_id: str, access_token: str, baseline: Optional[Dict[str, PlaylistRecord]]
+) -> Tuple[List[Dict], Dict[str, PlaylistRecord]]:
+    """
+    Change events since the last poll: compare snapshot_ids and re-fetch only
+    the playlists that moved, diffing them against their cached tracks.
+    Returns (events, new baseline).
+    """
+    sp = spotipy.Spotify(auth=access_token)
+    listing = listing_cache.peek(user_id)
+    if baseline is None and listing:
+        baseline = {p.id: p for p in listing["playlists"] if p.type == 'playlist'}
+    current = await fetch_playlist_snapshots(sp, user_id)
+    if baseline is None:
+        # Nothing to compare against yet; this poll becomes the baseline
+        return [], current
+
+    events, changed = watcher.diff_listing(baseline, current)
+    for playlist_id in changed:
+        snapshot_id = current[playlist_id].snapshot_id
+        old_entry = peek_cached_tracks(user_id, playlist_id)
+        invalidate_playlist(playlist_id)
+        if old_entry is None:
+            events.append({"type": "playlist_updated", "playlist_id": playlist_id, "snapshot_id": snapshot_id})
+            continue
+        entry = await get_cached_tracks(sp, user_id, playlist_id, snapshot_id)
+        events.extend(watcher.diff_tracks(playlist_id, snapshot_id, old_entry["tracks"], entry["tracks"]))
+
+    if events and listing:
+        albums = [p for p in listing["playlists"] if p.type == 'album']
+        cache_listing(user_id, list(current.values()) + albums)
+    return events, current
+
+async def iter_track_pages(sp: spotipy.Spotify, playlist_id: str) -> AsyncIterator[List[Dict]]:
+    """
+    Yield a playlist's (or saved album's) track items one upstream page at a time.
+    Each item carries its 'position' in the playlist, counting skipped items without a track.
+    """
+    offset = 0
+    while True:
+        if playlist_id.startswith('album_'):
+            results = await call_spotify(
+                sp.album_tracks, playlist_id.replace('album_', ''), limit=ALBUM_TRACKS_PAGE_SIZE, offset=offset
+            )
+            items = [{'track': track, 'added_at': None, 'position': offset + i} for i, track in enumerate(results['items'])]
+        else:
+            results = await call_spotify(
+                sp.playlist_items, playlist_id, offset=offset, limit=TRACKS_PAGE_SIZE, additional_types=['track']
+            )
+            items = [
+                {'track': item['track'], 'added_at': item['added_at'], 'position': offset + i}
+                for i, item in enumerate(results['items']) if item['track']
+            ]
+        if items:
+            yield items
+        if not results.get('next'):
+            break
+        offset += len(results['items'])
+
+async def export_stream(sp: spotipy.Spotify, playlists: List[Tuple[str, str]], fmt: str) -> AsyncIterator[str]:
+    """Encode playlists page by page so memory stays flat regardless of size"""
+    encoder = transfer.get_encoder(fmt)
+    wrote_any = False
+    # The stream runs in the response's own task, so the class only affects the export
+    spotify_priority.set(max(PRIORITY_BULK, spotify_priority.get()))
+    for playlist_id, playlist_name in playlists:
+        try:
+            async for page in iter_track_pages(sp, playlist_id):
+                rows = [transfer.item_to_row(item, playlist_id, playlist_name, item['position']) for item in page]
+                wrote_any = True
+                yield encoder.encode(rows)
+        except Exception as e:
+            # Headers are already sent, so end the file with a row that marks it incomplete
+            logger.error(f"Error exporting playlist {playlist_id}: {str(e)}")
+            yield encoder.encode([transfer.error_row(playlist_id, playlist_name, str(e))])
+            return
+    if not wrote_any:
+        yield encoder.encode([])
+
+def export_response(stream: AsyncIterator[str], fmt: str, filename: str) -> StreamingResponse:
+    return StreamingResponse(
+        stream,
+        media_type=transfer.EXPORT_FORMATS[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{fmt}"'}
+    )
+
+def check_export_format(fmt: str) -> str:
+    fmt = fmt.lower()
+    if fmt not in transfer.EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported format: {fmt}")
+    return fmt
+
+async def resolve_import_rows(sp: spotipy.Spotify, rows: List[Dict]) -> List[Optional[str]]:
+    """URIs for a batch of rows, searching concurrently for rows without one"""
+    semaphore = asyncio.Semaphore(IMPORT_CONCURRENCY)
+
+    async def resolve(row: Dict) -> Optional[str]:
+        uri = transfer.row_uri(row)
+        if uri:
+            return uri
+        query = transfer.row_query(row)
+        if not query:
+            return None
+        async with semaphore:
+            try:
+                results = await call_spotify(sp.search, q=query, type='track', limit=1)
+            except Exception as e:
+                logger.warning(f"Error resolving import row: {str(e)}")
+                return None
+        items = results['tracks']['items']
+        return items[0]['uri'] if items else None
+
+    return await asyncio.gather(*(resolve(row) for row in rows))
+
+def is_cached(user_id: str, playlist_id: str, snapshot_id: Optional[str]) -> bool:
+    entry = peek_cached_tracks(user_id, playlist_id)
+    return entry is not None and snapshot_matches(entry, snapshot_id)
+
+def playlist_slots(tracks: List[TrackRecord], total: int = 0) -> List[Optional[TrackRecord]]:
+    """Records at their playlist positions, None where an item has no track"""
+    length = max((r.position for r in tracks if r.position is not None), default=-1) + 1
+    slots: List[Optional[TrackRecord]] = [None] * max(length, len(tracks), total)
+    for ref, record in enumerate(tracks):
+        slots[record.position if record.position is not None else ref] = record
+    return slots
+
+def start_prefetch(sp: spotipy.Spotify, user_id: str, playlists: List[PlaylistRecord]) -> None:
+    get_prefetcher().start(
+        user_id, playlists,
+        lambda pid, snapshot: get_cached_tracks(sp, user_id, pid, snapshot),
+        lambda pid, snapshot: is_cached(user_id, pid, snapshot)
+    )
+
+async def listing_page(snapshot: PagedSnapshot, offset: int, limit: Optional[int], stale: bool = False) -> Dict:
+    playlists = await snapshot.page(offset, page_limit(limit))
+    return {
+        "playlists": [p.to_dict(snapshot.created) for p in playlists],
+        "total": snapshot.total,
+        "offset": offset,
+        "next_cursor": snapshot.next_cursor(offset, len(playlists)),
+        "fetch_time": snapshot.created,
+        "stale": stale
+    }
+
+async def tracks_page(snapshot: PagedSnapshot, offset: int, limit: Optional[int]) -> Dict:
+    tracks = await snapshot.page(offset, page_limit(limit))
+    return {
+        "tracks": [record.to_item() for record in tracks],
+        "total": snapshot.total,
+        "offset": offset,
+        "next_cursor": snapshot.next_cursor(offset, len(tracks)),
+        "fetch_time": snapshot.created,
+        "complete": snapshot.complete
+    }
+
+async def iter_track_records(sp: spotipy.Spotify, playlist_id: str) -> AsyncIterator[List[TrackRecord]]:
+    async for page in iter_track_pages(sp, playlist_id):
+        yield [TrackRecord.from_item(item, position=item['position']) for item in page]
+
 @router.get("/user")
 async def get_user_playlists(
     request: Request,
+    prefetch: Optional[bool] = None,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = None,
+    if_none_match: Optional[str] = Header(None),
     sp: spotipy.Spotify = Depends(get_spotify_client)
 ):
     """
     Get all playlists for the authenticated user.
+    With prefetch (or PLAYLIST_PREFETCH set), the playlists the user is most
+    likely to open next are warmed into the track cache in the background.
+    With limit or cursor the listing is paginated: the first page freezes the
+    listing server-side and next_cursor walks through that snapshot.
+    The full listing carries an ETag; If-None-Match is answered from the
+    cached listing with a 304, without calling Spotify, while it is fresh.
     """
     try:
         logger.info("Getting user playlists")
-        user = sp.me()
-        if not user or 'id' not in user:
-            raise HTTPException(status_code=401, detail="Could not get user information")
-            
-        user_id = user['id']
+        user_id = request.state.user_id
+        if cursor:
+            snapshot, offset = snapshots.resume(cursor, user_id, LISTING_SOURCE)
+            return await listing_page(snapshot, offset, limit)
+        should_prefetch = (PREFETCH_ENABLED if prefetch is None else prefetch)
+        listed = listing_cache.peek(user_id)
+        if limit is None and listed:
+            not_modified = conditional.not_modified(if_none_match, listed["etag"], "listing")
+            if not_modified:
+                if should_prefetch:
+                    start_prefetch(sp, user_id, listed["playlists"])
+                return not_modified
         logger.info(f"Fetching playlists for user: {user_id}")
-        playlists = await fetch_all_playlists(sp, user_id)
-        
-        return {
-            "playlists": playlists,
+
+        async def load() -> List[PlaylistRecord]:
+            playlists = await fetch_all_playlists(sp, user_id)
+            cache_listing(user_id, playlists)
+            return playlists
+
+        # While Spotify's circuit is open, serve the last listing marked stale
+        playlists, stale = await with_stale_fallback(("listing", user_id), spotify_breaker, load)
+        fetch_time = datetime.now().isoformat()
+        if should_prefetch and not stale:
+            start_prefetch(sp, user_id, playlists)
+        if limit is not None:
+            return await listing_page(snapshots.add(PagedSnapshot(user_id, LISTING_SOURCE, playlists)), 0, limit, stale)
+
+        if not stale:
+            listed = listing_cache.peek(user_id)
+            etag = listed["etag"] if listed and listed["playlists"] is playlists else listing_etag(playlists)
+            not_modified = conditional.not_modified(if_none_match, etag, "listing")
+            if not_modified:
+                return not_modified
+
+        body = {
+            "playlists": [p.to_dict(fetch_time) for p in playlists],
             "total": len(playlists),
-            "owned": sum(1 for p in playlists if p['is_owner']),
-            "followed": sum(1 for p in playlists if not p['is_owner']),
-            "fetch_time": datetime.now().isoformat()
+            "owned": sum(1 for p in playlists if p.is_owner),
+            "followed": sum(1 for p in playlists if not p.is_owner),
+            "fetch_time": fetch_time,
+            "stale": stale
         }
+        return body if stale else conditional.full(body, etag, "listing")
+    except HTTPException:
+        raise
+    except CircuitOpenError as e:
+        raise unavailable(e)
     except Exception as e:
         logger.error(f"Error in get_user_playlists: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+async def authenticate_websocket(websocket: WebSocket) -> Optional[Dict]:
+    """The session for the token in the first message, {"type": "auth", "token": ...}"""
+    try:
+        message = await asyncio.wait_for(websocket.receive_json(), timeout=watcher.AUTH_TIMEOUT)
+        token = message.get("token") if isinstance(message, dict) and message.get("type") == "auth" else None
+        if token:
+            return await token_manager.ensure_valid(token)
+    except (asyncio.TimeoutError, ValueError, KeyError, HTTPException):
+        pass
+    return None
+
+@router.websocket("/changes")
+async def playlist_changes(websocket: WebSocket):
+    """
+    Push playlist change events (added, removed, renamed, tracks added/removed/reordered).
+    Browsers can't set headers on a WebSocket, and a query parameter would put
+    the token in access logs, so the client sends it in its first message.
+    Any later message counts as activity and keeps polling frequent.
+    """
+    await websocket.accept()
+    try:
+        session = await authenticate_websocket(websocket)
+    except WebSocketDisconnect:
+        return
+    if session is None:
+        await websocket.close(code=watcher.UNAUTHORIZED_CLOSE_CODE)
+        return
+
+    user_id = session['user_id']
+    watcher.hub.attach(user_id, session['access_token'], websocket, poll_changes)
+    try:
+        await websocket.send_json({"type": "watching", "interval": watcher.ACTIVE_INTERVAL})
+        while True:
+            message = await websocket.receive_text()
+            watcher.hub.touch(user_id)
+            if message == "ping":
+                await websocket.send_text("pong")
+    except WebSocketDisconnect:
+        pass
+    finally:
+        watcher.hub.detach(user_id, websocket)
+
+@router.get("/library/stats")
+async def get_library_stats(
+    request: Request,
+    owned_only: bool = False,
+    sp: spotipy.Spotify = Depends(get_spotify_client)
+):
+    """
+    Library-wide stats across the user's playlists, including playlist overlap.
+    """
+    try:
+        user_id = request.state.user_id
+        playlists = await get_cached_listing(sp, user_id)
+        if owned_only:
+            playlists = [p for p in playlists if p.is_owner]
+
+        semaphore = asyncio.Semaphore(STATS_CONCURRENCY)
+
+        async def load(playlist: PlaylistRecord) -> List[TrackRecord]:
+            async with semaphore:
+                entry = await get_cached_tracks(sp, user_id, playlist.id, playlist.snapshot_id)
+                return entry["tracks"]
+
+        with spotify_context(priority=PRIORITY_BULK):
+            track_lists = await asyncio.gather(*(load(p) for p in playlists))
+        playlist_ids = [p.id for p in playlists]
+        records = [record for tracks in track_lists for record in tracks]
+        playlist_index = np.repeat(np.arange(len(track_lists)), [len(tracks) for tracks in track_lists])
+
+        cols = analytics.TrackColumns.from_records(records, playlist_index)
+        return {
+            "playlists": len(playlists),
+            **analytics.summarize(cols),
+            "per_playlist": analytics.per_playlist(cols, playlist_ids),
+            "overlap": analytics.overlap(cols, playlist_ids)
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error computing library stats: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/features/enrich")
+async def enrich_audio_features(
+    payload: EnrichFeaturesRequest,
+    request: Request,
+    sp: spotipy.Spotify = Depends(get_spotify_client)
+):
+    """
+    Collect track ids from playlists and explicit URIs and fill the
+    persistent audio-features cache for any not seen before.
+    """
+    try:
+        with spotify_context(priority=PRIORITY_BULK):
+            uris = list(payload.track_uris)
+            user_id = request.state.user_id
+            for playlist_id in payload.playlist_ids:
+                entry = await get_cached_tracks(sp, user_id, playlist_id, known_snapshot(user_id, playlist_id))
+                uris.extend(record.uri for record in entry["tracks"])
+
+            track_ids = [track_id for track_id in map(track_id_from_uri, uris) if track_id]
+            enricher = FeatureEnricher(get_feature_store(), spotify_fetcher(sp))
+            return await enricher.enrich(track_ids)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error enriching audio features: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/library/export")
+async def export_library(
+    request: Request,
+    format: str = "csv",
+    owned_only: bool = False,
+    sp: spotipy.Spotify = Depends(get_spotify_client)
+):
+    """
+    Stream every track of the user's library as CSV or JSONL, one page at a time.
+    """
+    fmt = check_export_format(format)
+    playlists = await get_cached_listing(sp, request.state.user_id)
+    if owned_only:
+        playlists = [p for p in playlists if p.is_owner]
+    return export_response(export_stream(sp, [(p.id, p.name) for p in playlists], fmt), fmt, "library")
+
+@router.get("/{playlist_id}/export")
+async def export_playlist(
+    playlist_id: str,
+    request: Request,
+    format: str = "csv",
+    sp: spotipy.Spotify = Depends(get_spotify_client)
+):
+    """
+    Stream a playlist's tracks as CSV or JSONL, one page at a time.
+    """
+    fmt = check_export_format(format)
+    try:
+        if playlist_id.startswith('album_'):
+            name = (await call_spotify(sp.album, playlist_id.replace('album_', '')))['name']
+        else:
+            name = (await call_spotify(sp.playlist, playlist_id, fields='name'))['name']
+    except Exception as e:
+        logger.error(f"Error getting playlist {playlist_id} for export: {str(e)}")
+        raise HTTPException(status_code=404, detail=f"Playlist not found: {playlist_id}")
+    return export_response(export_stream(sp, [(playlist_id, name)], fmt), fmt, playlist_id)
+
+@router.post("/import")
+async def import_tracks(
+    request: Request,
+    file: UploadFile = File(...),
+    playlist_id: Optional[str] = Form(None),
+    name: Optional[str] = Form(None),
+    format: Optional[str] = Form(None),
+    sp: spotipy.Spotify = Depends(get_spotify_client)
+):
+    """
+    Import a CSV or JSONL file into an existing or new playlist.
+    Every row is checked first, then rows are parsed lazily again, resolved
+    in concurrent batches and added in 100-item chunks.
+    """
+    try:
+        fmt = transfer.detect_format(file.filename, format)
+        check_export_format(fmt)
+        try:
+            await run_in_threadpool(transfer.validate_import_rows, file.file, fmt)
+        except transfer.ImportRowError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+
+        if not playlist_id:
+            playlist_name = name or (file.filename or "Imported playlist").rsplit('.', 1)[0]
+            new_playlist = await call_spotify(
+                sp.user_playlist_create, user=request.state.user_id, name=playlist_name, public=False
+            )
+            playlist_id = new_playlist['id']
+
+        rows = transfer.iter_import_rows(file.file, fmt)
+        total_rows = added = 0
+        not_found = []
+        while True:
+            batch = await run_in_threadpool(lambda: list(islice(rows, IMPORT_BATCH_SIZE)))
+            if not batch:
+                break
+            total_rows += len(batch)
+            with spotify_context(priority=PRIORITY_BULK):
+                uris = await resolve_import_rows(sp, batch)
+            found = [uri for uri in uris if uri]
+            for row, uri in zip(batch, uris):
+                if not uri and len(not_found) < 20:
+                    not_found.append(row)
+            for chunk in chunked(found):
+                await call_spotify(sp.playlist_add_items, playlist_id, chunk)
+                added += len(chunk)
+
+        invalidate_playlist(playlist_id)
+        return {
+            "playlist_id": playlist_id,
+            "rows": total_rows,
+            "added": added,
+            "not_found": total_rows - added,
+            "not_found_sample": not_found
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error importing tracks: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/{playlist_id}/stats")
+async def get_playlist_stats(
+    playlist_id: str,
+    request: Request,
+    sp: spotipy.Spotify = Depends(get_spotify_client)
+):
+    """
+    Duration, artist/album concentration, explicit ratio, popularity and
+    added_at timeline for a single playlist.
+    """
+    try:
+        user_id = request.state.user_id
+        entry = await get_cached_tracks(sp, user_id, playlist_id, known_snapshot(user_id, playlist_id))
+        cols = analytics.TrackColumns.from_records(entry["tracks"])
+        return {"playlist_id": playlist_id, **analytics.summarize(cols)}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error computing stats for playlist {playlist_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+async def apply_playlist_operation(sp: spotipy.Spotify, operation: PlaylistOperation) -> Dict:
+    """
+    Apply removals then additions to one playlist in 100-item chunks.
+    Errors are reported per playlist instead of failing the whole batch.
+    """
+    result = {
+        "playlist_id": operation.playlist_id,
+        "status": "ok",
+        "added": 0,
+        "removed": 0,
+        "snapshot_id": None
+    }
+    try:
+        # Remove first so re-adding a removed URI in the same operation keeps it
+        for chunk in chunked(operation.remove_uris):
+            response = await call_spotify(sp.playlist_remove_all_occurrences_of_items, operation.playlist_id, chunk)
+            result["snapshot_id"] = response.get("snapshot_id")
+            result["removed"] += len(chunk)
+        for chunk in chunked(operation.add_uris):
+            response = await call_spotify(sp.playlist_add_items, operation.playlist_id, chunk)
+            result["snapshot_id"] = response.get("snapshot_id")
+            result["added"] += len(chunk)
+    except Exception as e:
+        logger.error(f"Error applying bulk operation to playlist {operation.playlist_id}: {str(e)}")
+        result["status"] = "error"
+        result["error"] = str(e)
+    invalidate_playlist(operation.playlist_id)
+    return result
+
+@router.post("/bulk")
+async def bulk_update_playlists(
+    payload: BulkOperationsRequest,
+    request: Request,
+    sp: spotipy.Spotify = Depends(get_spotify_client)
+):
+    """
+    Add and remove tracks across many playlists in one request.
+    Playlists are processed concurrently under the shared rate limiter.
+    """
+    try:
+        logger.info(f"Applying bulk operations to {len(payload.operations)} playlists")
+        semaphore = asyncio.Semaphore(BULK_CONCURRENCY)
+
+        async def run(operation: PlaylistOperation) -> Dict:
+            async with semaphore:
+                return await apply_playlist_operation(sp, operation)
+
+        with spotify_context(priority=PRIORITY_BULK):
+            results = await asyncio.gather(*(run(operation) for operation in payload.operations))
+        failed = sum(1 for r in results if r["status"] != "ok")
+        return {
+            "results": results,
+            "succeeded": len(results) - failed,
+            "failed": failed
+        }
+    except Exception as e:
+        logger.error(f"Error in bulk_update_playlists: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/combine")
+async def combine_playlists(
+    payload: CombineRequest,
+    request: Request,
+    sp: spotipy.Spotify = Depends(get_spotify_client)
+):
+    """
+    Evaluate a set expression over playlists (union, intersection,
+    difference, merge) from cached track lists and write the result to an
+    existing playlist (replace or append) or a new one, in 100-item batches.
+    Without a target, or with dry_run, only the resulting URIs are returned.
+    """
+    try:
+        node = set_algebra.parse(payload.expression)
+    except set_algebra.ExpressionError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if payload.dedupe_by not in set_algebra.DEDUPE_KEYS:
+        raise HTTPException(status_code=400, detail=f"dedupe_by must be one of {', '.join(set_algebra.DEDUPE_KEYS)}")
+    if payload.mode not in ("replace", "append"):
+        raise HTTPException(status_code=400, detail="mode must be replace or append")
+    if payload.target_playlist_id and payload.name:
+        raise HTTPException(status_code=400, detail="Give either target_playlist_id or name, not both")
+    if (payload.target_playlist_id or "").startswith('album_'):
+        raise HTTPException(status_code=400, detail="Saved albums can't be written to")
+    try:
+        timer = StageTimer("combine")
+        user_id = request.state.user_id
+        target = payload.target_playlist_id
+        operands = set_algebra.playlist_ids(node)
+        loaded = operands + ([target] if target and payload.mode == "append" and target not in operands else [])
+        semaphore = asyncio.Semaphore(STATS_CONCURRENCY)
+
+        async def load(playlist_id: str) -> List[TrackRecord]:
+            async with semaphore:
+                entry = await get_cached_tracks(sp, user_id, playlist_id, known_snapshot(user_id, playlist_id))
+                return entry["tracks"]
+
+        with spotify_context(priority=PRIORITY_BULK):
+            track_lists = await timer.run("tracks", asyncio.gather(*(load(pid) for pid in loaded)))
+        playlists = dict(zip(loaded, track_lists))
+        key = set_algebra.track_key(payload.dedupe_by)
+        result = await timer.run("evaluate", run_in_threadpool(set_algebra.evaluate, node, playlists, key))
+
+        if target and payload.mode == "append":
+            present = {key(record) for record in playlists[target]}
+            records = [record for k, record in result.items() if k not in present]
+        else:
+            records = list(result.values())
+        # Local files can't be added through the API
+        uris = [record.uri for record in records if not record.is_local]
+
+        created = False
+        written = 0
+        if not payload.dry_run and (target or payload.name):
+            if not target:
+                playlist = await timer.run("create", call_spotify(
+                    sp.user_playlist_create, user=user_id, name=payload.name,
+                    public=payload.public, description=payload.description
+                ))
+                target, created = playlist['id'], True
+            writer = PlaylistWriter(sp, target, replace=payload.mode == "replace" and not created)
+            writer.put(uris)
+            writer.close()
+            with spotify_context(priority=PRIORITY_BULK):
+                written = await timer.run("write", writer.run())
+            if writer.replace and not uris:
+                await call_spotify(sp.playlist_replace_items, target, [])
+            invalidate_playlist(target)
+            logger.info(f"Combined {len(operands)} playlists into {target}: {written} tracks")
+
+        return {
+            "expression": payload.expression,
+            "playlists": {pid: len(playlists[pid]) for pid in operands},
+            "total": len(uris),
+            "skipped_local": len(records) - len(uris),
+            "playlist_id": target,
+            "created": created,
+            "written": written,
+            "uris": uris if payload.dry_run or not target else None,
+            "timings": timer.report()
+        }
+    except HTTPException:
+        raise
+    except CircuitOpenError as e:
+        raise unavailable(e)
+    except Exception as e:
+        logger.error(f"Error combining playlists: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/{playlist_id}/dedupe")
+async def dedupe_playlist(
+    playlist_id: str,
+    request: Request,
+    dry_run: bool = False,
+    near: bool = True,
+    sp: spotipy.Spotify = Depends(get_spotify_client)
+):
+    """
+    Remove repeated tracks, keeping the first occurrence. With `near`, other
+    releases of the same song (same ISRC, or same normalized title, artist
+    and duration) count as repeats too. `dry_run` only lists what would go.
+    """
+    if playlist_id.startswith('album_'):
+        raise HTTPException(status_code=400, detail="Saved albums can't be deduplicated")
+    try:
+        # Positions must refer to the playlist as it is now, so pin the current snapshot
+        playlist = await call_spotify(sp.playlist, playlist_id, fields='snapshot_id')
+        snapshot_id = playlist['snapshot_id']
+        user_id = request.state.user_id
+        cached = peek_cached_tracks(user_id, playlist_id)
+        if cached and cached["snapshot_id"] != snapshot_id:
+            invalidate_playlist(playlist_id)
+        entry = await get_cached_tracks(sp, user_id, playlist_id, snapshot_id)
+
+        duplicates = dedupe.find_duplicates(entry["tracks"], near=near)
+        removed = 0
+        if duplicates and not dry_run:
+            for batch in dedupe.removal_batches(duplicates):
+                result = await call_spotify(
+                    sp.playlist_remove_specific_occurrences_of_items, playlist_id, batch, snapshot_id=snapshot_id
+                )
+                snapshot_id = result['snapshot_id']
+                removed += sum(len(item["positions"]) for item in batch)
+            invalidate_playlist(playlist_id)
+            logger.info(f"Removed {removed} duplicates from playlist {playlist_id}")
+
+        return {
+            "playlist_id": playlist_id,
+            "dry_run": dry_run,
+            "total_tracks": len(entry["tracks"]),
+            "duplicates": duplicates,
+            "removed": removed,
+            "snapshot_id": snapshot_id
+        }
+    except HTTPException:
+        raise
+    except CircuitOpenError as e:
+        raise unavailable(e)
+    except Exception as e:
+        logger.error(f"Error deduplicating playlist {playlist_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/{playlist_id}/sequence")
+async def sequence_playlist(
+    playlist_id: str,
+    request: Request,
+    dry_run: bool = False,
+    keep_first: bool = True,
+    allow_rewrite: bool = False,
+    sp: spotipy.Spotify = Depends(get_spotify_client)
+):
+    """
+    Reorder a playlist for smooth transitions in tempo, key and energy, using
+    cached audio features (missing ones are fetched first). The new order is
+    applied with range moves, which keep added_at. With allow_rewrite the
+    playlist is instead rewritten in order when that takes fewer calls; this
+    resets added_at and is refused when the playlist has local files or items
+    whose track is no longer available, which a rewrite would drop.
+    """
+    if playlist_id.startswith('album_'):
+        raise HTTPException(status_code=400, detail="Saved albums can't be reordered")
+    try:
+        timer = StageTimer("sequence")
+        # Moves are positional, so pin the snapshot they are computed against
+        playlist = await call_spotify(sp.playlist, playlist_id, fields='snapshot_id,tracks.total')
+        snapshot_id = playlist['snapshot_id']
+        user_id = request.state.user_id
+        cached = peek_cached_tracks(user_id, playlist_id)
+        if cached and cached["snapshot_id"] != snapshot_id:
+            invalidate_playlist(playlist_id)
+        entry = await timer.run("tracks", get_cached_tracks(sp, user_id, playlist_id, snapshot_id))
+        tracks = entry["tracks"]
+        # Moves address real playlist positions, so items without a track keep their slots
+        slots = playlist_slots(tracks, playlist.get('tracks', {}).get('total', 0))
+        placeholders = len(slots) - len(tracks)
+        if len(slots) > sequencing.MAX_TRACKS:
+            raise HTTPException(
+                status_code=422, detail=f"Playlists of more than {sequencing.MAX_TRACKS} tracks can't be sequenced"
+            )
+
+        track_ids = [(track_id_from_uri(record.uri) or "") if record else "" for record in slots]
+        store = get_feature_store()
+        enricher = FeatureEnricher(store, spotify_fetcher(sp))
+        await timer.run("features", enricher.enrich([t for t in track_ids if t]))
+        features, mask = await run_in_threadpool(store.matrix, track_ids)
+
+        order, cost_before, cost_after, moves = await timer.run("solve", run_in_threadpool(
+            sequencing.plan, features, mask, 0 if keep_first else None
+        ))
+        rewrite_calls = -(-len(tracks) // REPLACE_PAGE_SIZE)
+        rewrite = (
+            allow_rewrite
+            and len(moves) > rewrite_calls
+            and not placeholders
+            and not any(record.is_local for record in tracks)
+        )
+
+        calls = 0
+        if moves and not dry_run:
+            if rewrite:
+                writer = PlaylistWriter(sp, playlist_id, replace=True)
+                writer.put([slots[i].uri for i in order])
+                writer.close()
+                await timer.run("apply", writer.run())
+                calls = rewrite_calls
+            else:
+                async def apply() -> None:
+                    nonlocal snapshot_id, calls
+                    for range_start, range_length, insert_before in moves:
+                        result = await call_spotify(
+                            sp.playlist_reorder_items, playlist_id, range_start=range_start,
+                            insert_before=insert_before, range_length=range_length, snapshot_id=snapshot_id
+                        )
+                        snapshot_id = result['snapshot_id']
+                        calls += 1
+                await timer.run("apply", apply())
+            invalidate_playlist(playlist_id)
+            logger.info(f"Resequenced playlist {playlist_id} with {calls} calls")
+
+        return {
+            "playlist_id": playlist_id,
+            "dry_run": dry_run,
+            "total_tracks": len(tracks),
+            "with_features": int(mask.sum()),
+            "cost_before": round(cost_before, 3),
+            "cost_after": round(cost_after, 3),
+            "order": [slots[i].uri if slots[i] else None for i in order],
+            "unavailable": placeholders,
+            "strategy": "rewrite" if rewrite else "moves",
+            "moves": len(moves),
+            "calls": calls,
+            "snapshot_id": None if rewrite and calls else snapshot_id,
+            "timings": timer.report()
+        }
+    except HTTPException:
+        raise
+    except CircuitOpenError as e:
+        raise unavailable(e)
+    except Exception as e:
+        logger.error(f"Error sequencing playlist {playlist_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @router.get("/{playlist_id}")
 async def get_playlist(
     playlist_id: str,
@@ -224,7 +1114,7 @@ async def get_playlist(
         # Handle album-type playlists
         if playlist_id.startswith('album_'):
             album_id = playlist_id.replace('album_', '')
-            album = sp.album(album_id)
+            album = await call_spotify(sp.album, album_id)
             return {
                 'id': playlist_id,
                 'name': album['name'],
@@ -235,8 +1125,10 @@ async def get_playlist(
             }
         
         # Regular playlist
-        playlist = sp.playlist(playlist_id)
+        playlist = await call_spotify(sp.playlist, playlist_id)
         return playlist
+    except CircuitOpenError as e:
+        raise unavailable(e)
     except Exception as e:
         logger.error(f"Error getting playlist {playlist_id}: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -252,9 +1144,12 @@ async def add_tracks_to_playlist(
     Add tracks to a playlist.
     """
     try:
-        logger.info(f"Adding tracks {uris} to playlist {playlist_id}")
-        sp.playlist_add_items(playlist_id, uris["uris"])
+        logger.info(f"Adding {len(uris['uris'])} tracks to playlist {playlist_id}")
+        await call_spotify(sp.playlist_add_items, playlist_id, uris["uris"])
+        invalidate_playlist(playlist_id)
         return {"message": "Tracks added successfully"}
+    except CircuitOpenError as e:
+        raise unavailable(e)
     except Exception as e:
         logger.error(f"Error adding tracks to playlist: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -271,8 +1166,11 @@ async def remove_from_playlist(
     """
     try:
         logger.info(f"Removing track {track_uri} from playlist {playlist_id}")
-        sp.playlist_remove_all_occurrences_of_items(playlist_id, [track_uri])
+        await call_spotify(sp.playlist_remove_all_occurrences_of_items, playlist_id, [track_uri])
+        invalidate_playlist(playlist_id)
         return {"message": "Track removed successfully"}
+    except CircuitOpenError as e:
+        raise unavailable(e)
     except Exception as e:
         logger.error(f"Error removing track from playlist: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -281,66 +1179,73 @@ async def remove_from_playlist(
 async def get_playlist_tracks(
     playlist_id: str,
     request: Request,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = None,
+    if_none_match: Optional[str] = Header(None),
     sp: spotipy.Spotify = Depends(get_spotify_client)
 ):
     """
     Get all tracks in a playlist with proper pagination and error handling.
+    With limit or cursor the tracks come a page at a time from a server-side
+    snapshot. On a cache miss the first page is answered after one upstream
+    call while the rest of the playlist loads in the background.
+    The full track list carries an ETag from the playlist's snapshot_id; a
+    matching If-None-Match gets a 304 without calling Spotify when the
+    cached listing or track cache already knows that snapshot.
     """
     try:
         logger.info(f"Getting tracks for playlist {playlist_id}")
-        all_tracks = []
-        offset = 0
-        retry_count = 0
-        
-        # Handle album-type playlists
-        if playlist_id.startswith('album_'):
-            album_id = playlist_id.replace('album_', '')
-            album_tracks = sp.album_tracks(album_id)
-            return {
-                "tracks": [{'track': track, 'added_at': None} for track in album_tracks['items']],
-                "total": len(album_tracks['items']),
-                "fetch_time": datetime.now().isoformat()
-            }
-        
-        # Regular playlist
-        while True:
-            try:
-                results = sp.playlist_items(
-                    playlist_id,
-                    offset=offset,
-                    limit=BATCH_SIZE,
-                    additional_types=['track']
-                )
-                retry_count = 0
-                
-                if results['items']:
-                    tracks = [{
-                        'track': item['track'],
-                        'added_at': item['added_at']
-                    } for item in results['items'] if item['track']]
-                    all_tracks.extend(tracks)
-                    logger.info(f"Fetched {len(tracks)} tracks, total: {len(all_tracks)}")
-                
-                if not results['next']:
-                    break
-                    
-                offset += BATCH_SIZE
-                time.sleep(REQUEST_DELAY)
-                
-            except Exception as e:
-                retry_count += 1
-                if retry_count >= MAX_RETRIES:
-                    logger.error(f"Max retries reached while fetching tracks: {str(e)}")
-                    break
-                logger.warning(f"Retry {retry_count} after error: {str(e)}")
-                time.sleep(REQUEST_DELAY * 2)
-                continue
-        
-        return {
-            "tracks": all_tracks,
-            "total": len(all_tracks),
-            "fetch_time": datetime.now().isoformat()
+        user_id = request.state.user_id
+        if cursor:
+            snapshot, offset = snapshots.resume(cursor, user_id, playlist_id)
+            return await tracks_page(snapshot, offset, limit)
+
+        snapshot_id = known_snapshot(user_id, playlist_id)
+        cached = peek_cached_tracks(user_id, playlist_id) if is_cached(user_id, playlist_id, snapshot_id) else None
+        get_prefetcher().record_open(user_id, playlist_id, cached)
+        if limit is None and (snapshot_id or cached):
+            etag = tracks_etag(playlist_id, snapshot_id or cached["snapshot_id"], cached["tracks"] if cached else None)
+            not_modified = conditional.not_modified(if_none_match, etag, "tracks")
+            if not_modified:
+                return not_modified
+        if limit is not None:
+            if cached:
+                snapshot = PagedSnapshot(user_id, playlist_id, cached["tracks"])
+            else:
+                listed = listing_cache.peek(user_id)
+                known = listed["by_id"].get(playlist_id) if listed else None
+                snapshot = PagedSnapshot(user_id, playlist_id, total=known.total if known else None)
+
+                def store(tracks: List[TrackRecord]) -> None:
+                    cache_tracks(user_id, playlist_id, {
+                        "snapshot_id": snapshot_id,
+                        "tracks": tracks,
+                        "fetch_time": snapshot.created
+                    })
+
+                snapshot.fill(iter_track_records(sp, playlist_id), store)
+            return await tracks_page(snapshots.add(snapshot), 0, limit)
+
+        entry, stale = await with_stale_fallback(
+            ("tracks", user_id, playlist_id), spotify_breaker, lambda: get_cached_tracks(sp, user_id, playlist_id, snapshot_id)
+        )
+        if not stale:
+            etag = tracks_etag(playlist_id, entry["snapshot_id"], entry["tracks"])
+            not_modified = conditional.not_modified(if_none_match, etag, "tracks")
+            if not_modified:
+                return not_modified
+
+        body = {
+            "tracks": [record.to_item() for record in entry["tracks"]],
+            "total": len(entry["tracks"]),
+            "fetch_time": entry["fetch_time"],
+            "stale": stale
         }
+        return body if stale else conditional.full(body, etag, "tracks")
+    except HTTPException:
+        raise
+    except CircuitOpenError as e:
+        raise unavailable(e)
     except Exception as e:
         logger.error(f"Error getting playlist tracks: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -357,20 +1262,18 @@ async def update_playlist_tracks(
     """
     try:
         logger.info(f"Updating tracks for playlist {playlist_id}")
-        
-        # Split track_uris into chunks of 100 (Spotify API limit)
-        chunk_size = 100
-        for i in range(0, len(track_uris), chunk_size):
-            chunk = track_uris[i:i + chunk_size]
-            if i == 0:
-                # First chunk replaces all tracks
-                sp.playlist_replace_items(playlist_id, chunk)
-            else:
-                # Subsequent chunks are added
-                sp.playlist_add_items(playlist_id, chunk)
-            time.sleep(REQUEST_DELAY)
-            
+
+        # The first chunk replaces all tracks, later ones are appended; pacing is
+        # left to the shared rate limiter instead of sleeping on the event loop
+        writer = PlaylistWriter(sp, playlist_id, replace=True)
+        writer.put(track_uris)
+        writer.close()
+        await writer.run()
+
+        invalidate_playlist(playlist_id)
         return {"message": "Playlist tracks updated successfully"}
+    except CircuitOpenError as e:
+        raise unavailable(e)
     except Exception as e:
         logger.error(f"Error updating playlist tracks: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
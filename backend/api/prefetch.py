@@ -0,0 +1,137 @@
+"""
+Predictive prefetch of playlist tracks.
+
+After the library listing, users usually open one of a few playlists: the
+ones they open most, or ones that just changed. Opens are counted per user
+with exponential decay, and after a listing the top-K likely playlists are
+warmed into the track cache in the background.
+
+Prefetching only spends spare rate-limit budget: it runs in the background
+scheduling class, stops when the limiter runs low, and is cancelled outright
+as soon as an interactive call has to queue. Warmed entries are remembered
+so opens served by them count as hits.
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from .cache import TTLCache
+from .metrics import metrics
+from .records import PlaylistRecord
+from .spotify_client import PRIORITY_BACKGROUND, spotify_context, spotify_scheduler
+
+logger = logging.getLogger(__name__)
+
+# Prefetch configuration
+PREFETCH_ENABLED = os.getenv("PLAYLIST_PREFETCH", "0").lower() in ("1", "true", "yes")  # default when the client doesn't say
+PREFETCH_TOP_K = int(os.getenv("PREFETCH_TOP_K", "3"))
+PREFETCH_MAX_TRACKS = 1000  # bigger playlists cost too many calls to fetch speculatively
+PREFETCH_RESERVE = 5  # limiter tokens left untouched for interactive calls
+ACCESS_HALF_LIFE = 7 * 24 * 3600  # seconds for an open to count half as much
+MODIFIED_BOOST = 2.0  # playlists whose snapshot moved since the last listing
+POSITION_WEIGHT = 0.5  # listing order, mostly to rank users without history
+TRACKED_USERS = 1000
+TRACKED_PLAYLISTS = 200  # per user
+USER_TTL = 30 * 24 * 3600
+WARMED_TTL = 600  # matches the track cache
+
+TrackWarmer = Callable[[str, Optional[str]], Awaitable[Dict]]
+CachedCheck = Callable[[str, Optional[str]], bool]
+
+
+class Prefetcher:
+    def __init__(self, top_k: int = PREFETCH_TOP_K):
+        self.top_k = top_k
+        self._opens = TTLCache(maxsize=TRACKED_USERS, ttl=USER_TTL)  # user_id -> {playlist_id: (score, at)}
+        self._snapshots = TTLCache(maxsize=TRACKED_USERS, ttl=USER_TTL)  # user_id -> {playlist_id: snapshot_id}
+        self._warmed = TTLCache(maxsize=TRACKED_USERS * 4, ttl=WARMED_TTL)  # (user_id, playlist_id) -> cache entry
+        self._tasks: Dict[str, asyncio.Task] = {}
+        spotify_scheduler.on_interactive_wait(self.cancel_all)
+        metrics.register_gauge("prefetch.hit_rate", self.hit_rate)
+        metrics.register_gauge("prefetch.running", lambda: len(self._tasks))
+
+    def record_open(self, user_id: str, playlist_id: str, entry: Optional[Dict]) -> bool:
+        """Count an open; True when `entry` (the cached tracks about to be served) came from a prefetch"""
+        now = time.time()
+        opens = self._opens.peek(user_id) or {}
+        score, at = opens.get(playlist_id, (0.0, now))
+        opens[playlist_id] = (score * 0.5 ** ((now - at) / ACCESS_HALF_LIFE) + 1, now)
+        if len(opens) > TRACKED_PLAYLISTS:
+            del opens[min(opens, key=lambda p: opens[p][0])]
+        self._opens.set(user_id, opens)
+
+        warmed = self._warmed.pop((user_id, playlist_id))
+        hit = warmed is not None and warmed is entry
+        if hit:
+            metrics.incr("prefetch.hits")
+        return hit
+
+    def rank(self, user_id: str, playlists: List[PlaylistRecord]) -> List[PlaylistRecord]:
+        """Playlists by likelihood of being opened next, most likely first"""
+        now = time.time()
+        opens = self._opens.peek(user_id) or {}
+        previous = self._snapshots.peek(user_id)
+        scores = {}
+        for position, playlist in enumerate(playlists):
+            score, at = opens.get(playlist.id, (0.0, now))
+            score = score * 0.5 ** ((now - at) / ACCESS_HALF_LIFE) + POSITION_WEIGHT / (1 + position)
+            if previous and playlist.snapshot_id and previous.get(playlist.id) not in (None, playlist.snapshot_id):
+                score += MODIFIED_BOOST
+            scores[playlist.id] = score
+        self._snapshots.set(user_id, {p.id: p.snapshot_id for p in playlists})
+        return sorted(playlists, key=lambda p: scores[p.id], reverse=True)
+
+    def start(self, user_id: str, playlists: List[PlaylistRecord], warm: TrackWarmer, is_cached: CachedCheck) -> None:
+        """Warm the top-K playlists not already cached; replaces a prefetch still running for the user"""
+        candidates = [
+            p for p in self.rank(user_id, playlists)
+            if p.total <= PREFETCH_MAX_TRACKS and not is_cached(p.id, p.snapshot_id)
+        ][:self.top_k]
+        self.cancel(user_id)
+        if not candidates:
+            return
+        task = asyncio.create_task(self._run(user_id, candidates, warm))
+        self._tasks[user_id] = task
+        task.add_done_callback(lambda t: self._tasks.pop(user_id, None) if self._tasks.get(user_id) is t else None)
+
+    async def _run(self, user_id: str, playlists: List[PlaylistRecord], warm: TrackWarmer) -> None:
+        with spotify_context(user_id, PRIORITY_BACKGROUND):
+            for playlist in playlists:
+                if not spotify_scheduler.has_headroom(PREFETCH_RESERVE):
+                    metrics.incr("prefetch.skipped_busy")
+                    return
+                try:
+                    entry = await warm(playlist.id, playlist.snapshot_id)
+                except asyncio.CancelledError:
+                    metrics.incr("prefetch.cancelled")
+                    raise
+                except Exception as e:
+                    logger.warning(f"Prefetch of playlist {playlist.id} failed: {str(e)}")
+                    return
+                self._warmed.set((user_id, playlist.id), entry)
+                metrics.incr("prefetch.warmed")
+
+    def cancel(self, user_id: str) -> None:
+        task = self._tasks.pop(user_id, None)
+        if task is not None:
+            task.cancel()
+
+    def cancel_all(self) -> None:
+        for user_id in list(self._tasks):
+            self.cancel(user_id)
+
+    def hit_rate(self) -> float:
+        warmed = metrics.counter("prefetch.warmed")
+        return metrics.counter("prefetch.hits") / warmed if warmed else 0.0
+
+
+_prefetcher: Optional[Prefetcher] = None
+
+
+def get_prefetcher() -> Prefetcher:
+    global _prefetcher
+    if _prefetcher is None:
+        _prefetcher = Prefetcher()
+    return _prefetcher
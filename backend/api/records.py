@@ -0,0 +1,218 @@
+"""
+Compact internal representations of playlists and tracks.
+
+Spotify objects carry a lot we never use (available_markets lists, repeated
+album images, hrefs) and every track repeats its album and artist objects.
+Records keep only the fields the API serves, use __slots__, and intern
+artists and albums so each is stored once per worker however many tracks
+reference it. They are converted back to Spotify-shaped dicts at the edge.
+"""
+import sys
+import weakref
+from typing import Dict, List, Optional, Tuple
+
+Image = Tuple[str, Optional[int], Optional[int]]  # (url, height, width)
+
+
+def _s(value: Optional[str]) -> Optional[str]:
+    """Intern short repeated strings (ids, names); None passes through"""
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+def _images(images: Optional[List[Dict]]) -> Tuple[Image, ...]:
+    return tuple((img.get('url'), img.get('height'), img.get('width')) for img in images or ())
+
+
+def _images_out(images: Tuple[Image, ...]) -> List[Dict]:
+    return [{'url': url, 'height': height, 'width': width} for url, height, width in images]
+
+
+class ArtistRef:
+    __slots__ = ('id', 'name', 'uri', '__weakref__')
+
+    def __init__(self, id: Optional[str], name: str, uri: Optional[str]):
+        self.id = _s(id)
+        self.name = _s(name)
+        self.uri = _s(uri)
+
+    def to_dict(self) -> Dict:
+        return {'id': self.id, 'name': self.name, 'uri': self.uri, 'type': 'artist'}
+
+
+class AlbumRef:
+    __slots__ = ('id', 'name', 'uri', 'release_date', 'images', 'artists', '__weakref__')
+
+    def __init__(self, id: Optional[str], name: str, uri: Optional[str], release_date: Optional[str],
+                 images: Tuple[Image, ...], artists: Tuple[ArtistRef, ...]):
+        self.id = _s(id)
+        self.name = name
+        self.uri = uri
+        self.release_date = release_date
+        self.images = images
+        self.artists = artists
+
+    def to_dict(self) -> Dict:
+        return {
+            'id': self.id,
+            'name': self.name,
+            'uri': self.uri,
+            'release_date': self.release_date,
+            'images': _images_out(self.images),
+            'artists': [a.to_dict() for a in self.artists],
+            'type': 'album'
+        }
+
+
+class InternPool:
+    """Shares ArtistRef/AlbumRef instances by id; entries vanish with their last track"""
+
+    def __init__(self):
+        self.artists: "weakref.WeakValueDictionary[str, ArtistRef]" = weakref.WeakValueDictionary()
+        self.albums: "weakref.WeakValueDictionary[str, AlbumRef]" = weakref.WeakValueDictionary()
+
+    def artist(self, data: Dict) -> ArtistRef:
+        key = data.get('id') or data.get('name', '')
+        ref = self.artists.get(key)
+        if ref is None:
+            ref = ArtistRef(data.get('id'), data.get('name', ''), data.get('uri'))
+            self.artists[key] = ref
+        return ref
+
+    def album(self, data: Optional[Dict]) -> Optional[AlbumRef]:
+        if not data:
+            return None
+        key = data.get('id') or data.get('name', '')
+        ref = self.albums.get(key)
+        if ref is None:
+            ref = AlbumRef(
+                data.get('id'), data.get('name', ''), data.get('uri'), data.get('release_date'),
+                _images(data.get('images')), tuple(self.artist(a) for a in data.get('artists') or ()),
+            )
+            self.albums[key] = ref
+        return ref
+
+
+pool = InternPool()
+
+
+class TrackRecord:
+    __slots__ = (
+        'id', 'uri', 'name', 'duration_ms', 'popularity', 'explicit', 'isrc',
+        'preview_url', 'is_local', 'artists', 'album', 'added_at', 'position',
+    )
+
+    @classmethod
+    def from_item(cls, item: Dict, intern: InternPool = pool, position: Optional[int] = None) -> "TrackRecord":
+        """
+        Build from a playlist item {'track': ..., 'added_at': ...}. `position`
+        is the item's index in the playlist, which differs from the record's
+        list index once items without a track have been skipped.
+        """
+        track = item.get('track') or {}
+        record = cls()
+        record.id = track.get('id')
+        record.uri = track.get('uri') or ''
+        record.name = track.get('name', '')
+        record.duration_ms = track.get('duration_ms') or 0
+        record.popularity = track.get('popularity')
+        record.explicit = bool(track.get('explicit'))
+        record.isrc = (track.get('external_ids') or {}).get('isrc')
+        record.preview_url = track.get('preview_url')
+        record.is_local = bool(track.get('is_local'))
+        record.artists = tuple(intern.artist(a) for a in track.get('artists') or ())
+        record.album = intern.album(track.get('album'))
+        record.added_at = _s(item.get('added_at'))
+        record.position = position
+        return record
+
+    def to_track(self) -> Dict:
+        track = {
+            'id': self.id,
+            'uri': self.uri,
+            'name': self.name,
+            'duration_ms': self.duration_ms,
+            'explicit': self.explicit,
+            'preview_url': self.preview_url,
+            'is_local': self.is_local,
+            'artists': [a.to_dict() for a in self.artists],
+            'type': 'track'
+        }
+        if self.popularity is not None:
+            track['popularity'] = self.popularity
+        if self.isrc:
+            track['external_ids'] = {'isrc': self.isrc}
+        if self.album is not None:
+            track['album'] = self.album.to_dict()
+        return track
+
+    def to_item(self) -> Dict:
+        """Spotify-shaped playlist item, as the API has always returned"""
+        return {'track': self.to_track(), 'added_at': self.added_at}
+
+
+class PlaylistRecord:
+    __slots__ = (
+        'id', 'name', 'description', 'owner_id', 'owner_name', 'images', 'total',
+        'snapshot_id', 'public', 'collaborative', 'uri', 'type', 'is_owner',
+    )
+
+    @classmethod
+    def from_playlist(cls, playlist: Dict, user_id: str) -> "PlaylistRecord":
+        owner = playlist.get('owner') or {}
+        record = cls()
+        record.id = playlist['id']
+        record.name = playlist.get('name', '')
+        record.description = playlist.get('description') or ''
+        record.owner_id = _s(owner.get('id'))
+        record.owner_name = _s(owner.get('display_name'))
+        record.images = _images(playlist.get('images'))
+        record.total = (playlist.get('tracks') or {}).get('total', 0)
+        record.snapshot_id = playlist.get('snapshot_id')
+        record.public = playlist.get('public')
+        record.collaborative = bool(playlist.get('collaborative'))
+        record.uri = playlist.get('uri')
+        record.type = 'playlist'
+        record.is_owner = record.owner_id == user_id
+        return record
+
+    @classmethod
+    def from_saved_album(cls, album: Dict) -> "PlaylistRecord":
+        """Saved albums are listed as pseudo-playlists with an album_ prefix"""
+        artist = (album.get('artists') or [{}])[0]
+        record = cls()
+        record.id = f"album_{album['id']}"
+        record.name = album.get('name', '')
+        record.description = ''
+        record.owner_id = _s(artist.get('id'))
+        record.owner_name = _s(artist.get('name'))
+        record.images = _images(album.get('images'))
+        record.total = album.get('total_tracks', 0)
+        record.snapshot_id = None
+        record.public = None
+        record.collaborative = False
+        record.uri = album.get('uri')
+        record.type = 'album'
+        record.is_owner = False
+        return record
+
+    def to_dict(self, fetch_time: Optional[str] = None) -> Dict:
+        data = {
+            'id': self.id,
+            'name': self.name,
+            'owner': {'id': self.owner_id, 'display_name': self.owner_name},
+            'images': _images_out(self.images),
+            'tracks': {'total': self.total},
+            'type': self.type,
+            'is_owner': self.is_owner
+        }
+        if self.type == 'playlist':
+            data.update({
+                'description': self.description,
+                'snapshot_id': self.snapshot_id,
+                'public': self.public,
+                'collaborative': self.collaborative,
+                'uri': self.uri
+            })
+        if fetch_time:
+            data['fetch_time'] = fetch_time
+        return data
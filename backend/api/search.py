@@ -1,13 +1,141 @@
 from fastapi import APIRouter, HTTPException, Header
-from typing import Optional, Dict, List
+from typing import Any, Optional, Dict, List, Tuple
+import asyncio
+import time
 import httpx
-from .auth import validate_token_string
+from .auth import token_manager
+from .cache import TTLCache
+from .library_index import get_index
+from .metrics import metrics
+from .spotify_client import spotify_scheduler, spotify_user
 
 router = APIRouter()
 
 SPOTIFY_API_BASE = "https://api.spotify.com/v1"
+SEARCH_LIMIT = 20
+LIBRARY_SEARCH_MAX_LIMIT = 100
 
-@router.get("/tracks", response_model=Dict[str, List[dict]])
+# Search cache configuration
+SEARCH_CACHE_SIZE = 5000
+SEARCH_CACHE_TTL = 300  # seconds
+
+search_cache = TTLCache(maxsize=SEARCH_CACHE_SIZE, ttl=SEARCH_CACHE_TTL)
+_inflight: Dict[Tuple[str, str], asyncio.Task] = {}  # (user_id, query) -> upstream fetch
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+def _search_hit_ratio() -> float:
+    requests = metrics.counter("search.requests")
+    hits = metrics.counter("search.cache_hits") + metrics.counter("search.prefix_hits")
+    return hits / requests if requests else 0.0
+
+metrics.register_gauge("search.hit_ratio", _search_hit_ratio)
+metrics.register_gauge("search.cache_size", lambda: len(search_cache))
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Shared client so connections to Spotify are reused across requests"""
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.AsyncClient(timeout=10.0)
+    return _http_client
+
+
+def normalize_query(q: str) -> str:
+    return " ".join(q.lower().split())
+
+
+def format_track(track: Dict) -> Dict:
+    """Format a track to match frontend expectations"""
+    return {
+        "id": track["id"],
+        "name": track["name"],
+        "artists": track["artists"],  # Keep full artists array as frontend expects it
+        "album": {
+            "name": track["album"]["name"],
+            "images": track["album"]["images"]
+        },
+        "duration_ms": track["duration_ms"],
+        "preview_url": track["preview_url"],
+        "uri": track["uri"]  # Important for adding to playlist
+    }
+
+
+def track_matches(track: Dict, terms: List[str]) -> bool:
+    """Every term must prefix a word of the track name, artists or album"""
+    words = " ".join([
+        track["name"],
+        track["album"]["name"],
+        *(artist["name"] for artist in track["artists"])
+    ]).lower().split()
+    return all(any(word.startswith(term) for word in words) for term in terms)
+
+
+def answer_from_prefix(query: str) -> Optional[List[Dict]]:
+    """
+    Answer a query by filtering the cached results of a broader (shorter) query.
+
+    Only complete result sets are used, i.e. the broader query returned every
+    match Spotify had, so filtering them locally cannot miss tracks.
+    """
+    if ":" in query:  # field filters don't narrow like plain text
+        return None
+    terms = query.split()
+    for cut in range(len(query) - 1, 0, -1):
+        entry = search_cache.peek(query[:cut])
+        if entry and entry["complete"]:
+            return [track for track in entry["tracks"] if track_matches(track, terms)]
+    return None
+
+
+async def fetch_tracks(query: str, access_token: str) -> Dict:
+    """Query Spotify and cache the formatted results"""
+    metrics.incr("search.upstream_calls")
+    # Same budget and fair queue as the spotipy calls; searches are interactive
+    await spotify_scheduler.acquire()
+    response = await get_http_client().get(
+        f"{SPOTIFY_API_BASE}/search",
+        params={
+            "q": query,
+            "type": "track",
+            "limit": SEARCH_LIMIT
+        },
+        headers={
+            "Authorization": f"Bearer {access_token}"
+        }
+    )
+    # Check if request was successful
+    response.raise_for_status()
+    data = response.json()
+
+    tracks = data.get("tracks", {})
+    items = tracks.get("items", [])
+    entry = {
+        "tracks": [format_track(track) for track in items if track],
+        "complete": tracks.get("total", 0) <= len(items)
+    }
+    search_cache.set(query, entry)
+    return entry
+
+
+async def coalesced_fetch(user_id: str, query: str, access_token: str) -> Dict:
+    """
+    Share one upstream call between a user's identical concurrent queries.
+    Fetches are per user, so one session's 401 never reaches another's
+    request; the results cache is shared.
+    """
+    key = (user_id, query)
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.create_task(fetch_tracks(query, access_token))
+        _inflight[key] = task
+        task.add_done_callback(lambda _: _inflight.pop(key, None))
+    else:
+        metrics.incr("search.coalesced")
+    return await asyncio.shield(task)
+
+
+@router.get("/tracks", response_model=Dict[str, Any])
 async def search_tracks(
     q: str,
     authorization: str = Header(None)
@@ -18,49 +146,31 @@ async def search_tracks(
     # Extract token from header
     token = authorization.replace("Bearer ", "")
 
-    # Validate the token using the new helper function
-    is_valid = await validate_token_string(token)
-    if not is_valid:
+    # Resolve a valid (possibly server-side refreshed) token without an upstream check
+    try:
+        session = await token_manager.ensure_valid(token)
+    except HTTPException:
         raise HTTPException(status_code=401, detail="Invalid or expired token")
 
+    spotify_user.set(session['user_id'])
+    query = normalize_query(q)
+    metrics.incr("search.requests")
+    if not query:
+        return {"tracks": []}
+
+    cached = search_cache.get(query)
+    if cached:
+        metrics.incr("search.cache_hits")
+        return {"tracks": cached["tracks"]}
+
+    filtered = answer_from_prefix(query)
+    if filtered is not None:
+        metrics.incr("search.prefix_hits")
+        return {"tracks": filtered}
+
     try:
-        # Create async HTTP client
-        async with httpx.AsyncClient() as client:
-            # Make request to Spotify search API
-            response = await client.get(
-                f"{SPOTIFY_API_BASE}/search",
-                params={
-                    "q": q,
-                    "type": "track",
-                    "limit": 20
-                },
-                headers={
-                    "Authorization": authorization
-                }
-            )
-            # Check if request was successful
-            response.raise_for_status()
-            data = response.json()
-
-            # Extract and format track results to match frontend expectations
-            tracks = data.get("tracks", {}).get("items", [])
-            formatted_tracks = []
-            for track in tracks:
-                formatted_track = {
-                    "id": track["id"],
-                    "name": track["name"],
-                    "artists": track["artists"],  # Keep full artists array as frontend expects it
-                    "album": {
-                        "name": track["album"]["name"],
-                        "images": track["album"]["images"]
-                    },
-                    "duration_ms": track["duration_ms"],
-                    "preview_url": track["preview_url"],
-                    "uri": track["uri"]  # Important for adding to playlist
-                }
-                formatted_tracks.append(formatted_track)
-
-            return {"tracks": formatted_tracks}
+        entry = await coalesced_fetch(session['user_id'], query, session['access_token'])
+        return {"tracks": entry["tracks"]}
 
     except httpx.HTTPStatusError as e:
         error_detail = "Failed to search tracks"
@@ -81,4 +191,43 @@ async def search_tracks(
         raise HTTPException(
             status_code=500,
             detail=str(e)
-        )
\ No newline at end of file
+        )
+
+
+@router.get("/library", response_model=Dict[str, Any])
+async def search_library(
+    q: str,
+    limit: int = SEARCH_LIMIT,
+    authorization: str = Header(None)
+):
+    """
+    Search the tracks of the user's own playlists, from the in-memory index
+    built as playlists are fetched. Never calls Spotify.
+    """
+    if not authorization:
+        raise HTTPException(status_code=401, detail="Authorization header is required")
+    try:
+        session = await token_manager.ensure_valid(authorization.replace("Bearer ", ""))
+    except HTTPException:
+        raise HTTPException(status_code=401, detail="Invalid or expired token")
+
+    started = time.perf_counter()
+    index = get_index(session['user_id'])
+    matches, total = index.search(q, max(1, min(limit, LIBRARY_SEARCH_MAX_LIMIT)))
+    took = time.perf_counter() - started
+    metrics.incr("search.library_requests")
+    metrics.observe("search.library", took)
+    return {
+        "tracks": [
+            {
+                **format_track({"album": {"name": "", "images": []}, **record.to_track()}),
+                "playlists": [{"id": p, "name": index.playlist_names.get(p)} for p in playlist_ids],
+                "score": score
+            }
+            for record, playlist_ids, score in matches
+        ],
+        "total": total,
+        "indexed_tracks": index.size,
+        "indexed_playlists": index.playlist_count,
+        "took_ms": round(took * 1000, 2)
+    }
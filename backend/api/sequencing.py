@@ -0,0 +1,172 @@
+"""
+Transition-aware track ordering.
+
+The cost of playing track j after track i combines tempo (in octaves, so
+half- and double-time count as close), key (steps around the Camelot wheel,
+where relative major/minor share a position) and energy. The full pairwise
+matrix is built in float32 with NumPy broadcasting, a block of rows at a
+time so the temporaries stay small; the order is a shortest open path
+through it, found with nearest neighbour and improved by 2-opt within a
+time budget.
+
+The new order is then turned into block moves for Spotify's reorder
+endpoint: every run of tracks that is already in its target sequence moves
+as one range, so a mostly-sorted playlist takes few calls.
+"""
+import time
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from .audio_features import FEATURE_INDEX
+
+TEMPO_WEIGHT = 1.0
+KEY_WEIGHT = 0.7
+ENERGY_WEIGHT = 1.0
+TEMPO_SCALE = 0.25  # octaves counted as one unit (about +-19% bpm)
+MISSING_COST = 1.0  # transition cost to or from a track without features
+TWO_OPT_BUDGET = 0.5  # seconds of 2-opt improvement
+IMPROVEMENT_EPSILON = 1e-6
+MAX_TRACKS = 5000  # the n x n float32 matrix is 100 MB at this size
+ROW_BLOCK = 256  # rows of the matrix computed per broadcast
+
+
+def camelot(keys: np.ndarray, modes: np.ndarray) -> np.ndarray:
+    """Pitch class + mode -> Camelot number (0-11); a fifth up is one step"""
+    keys = keys.astype(np.int64)
+    return np.where(modes >= 0.5, (7 * keys + 8) % 12, (7 * keys + 5) % 12)
+
+
+def distance_matrix(features: np.ndarray, mask: np.ndarray) -> np.ndarray:
+    """(n, n) float32 transition costs from a FEATURE_KEYS matrix; rows without features cost MISSING_COST"""
+    n = len(features)
+    tempo = np.log2(np.maximum(features[:, FEATURE_INDEX['tempo']], 1.0)).astype(np.float32)
+    key = features[:, FEATURE_INDEX['key']]
+    mode = features[:, FEATURE_INDEX['mode']]
+    wheel = camelot(np.maximum(key, 0), mode).astype(np.int8)
+    minor = mode >= 0.5
+    unknown_key = key < 0
+    energy = features[:, FEATURE_INDEX['energy']].astype(np.float32)
+
+    distances = np.empty((n, n), dtype=np.float32)
+    for start in range(0, n, ROW_BLOCK):
+        rows = slice(start, min(start + ROW_BLOCK, n))
+        octaves = np.abs(tempo[rows, None] - tempo[None, :]) % 1.0
+        block = np.minimum(octaves, 1.0 - octaves) * np.float32(TEMPO_WEIGHT / TEMPO_SCALE)
+
+        steps = np.abs(wheel[rows, None] - wheel[None, :])
+        steps = np.minimum(steps, 12 - steps) + (minor[rows, None] != minor[None, :])
+        key_cost = steps * np.float32(KEY_WEIGHT / 6.0)
+        key_cost[unknown_key[rows], :] = KEY_WEIGHT * 0.5
+        key_cost[:, unknown_key] = KEY_WEIGHT * 0.5
+        block += key_cost
+
+        block += np.abs(energy[rows, None] - energy[None, :]) * np.float32(ENERGY_WEIGHT)
+        block[~mask[rows], :] = MISSING_COST
+        block[:, ~mask] = MISSING_COST
+        distances[rows] = block
+    np.fill_diagonal(distances, 0.0)
+    return distances
+
+
+def path_cost(distances: np.ndarray, order: np.ndarray) -> float:
+    return float(distances[order[:-1], order[1:]].sum()) if len(order) > 1 else 0.0
+
+
+def nearest_neighbour(distances: np.ndarray, start: int) -> np.ndarray:
+    n = len(distances)
+    order = np.empty(n, dtype=np.int64)
+    visited = np.zeros(n, dtype=bool)
+    current = start
+    for step in range(n):
+        order[step] = current
+        visited[current] = True
+        if step == n - 1:
+            break
+        row = np.where(visited, np.inf, distances[current])
+        current = int(np.argmin(row))
+    return order
+
+
+def two_opt(distances: np.ndarray, order: np.ndarray, budget: float = TWO_OPT_BUDGET) -> np.ndarray:
+    """
+    Improve an open path by reversing segments; the first track stays put.
+    For each edge (a, b) all reversals order[i+1..j] are scored at once.
+    """
+    order = order.copy()
+    n = len(order)
+    deadline = time.perf_counter() + budget
+    improved = True
+    while improved and time.perf_counter() < deadline:
+        improved = False
+        for i in range(n - 2):
+            a, b = order[i], order[i + 1]
+            c = order[i + 2:]  # new neighbour of a for j = i+2 .. n-1
+            d = np.append(order[i + 3:], -1)  # track after c, -1 at the end of the path
+            has_next = d >= 0
+            d_safe = np.where(has_next, d, 0)
+            delta = distances[a, c] - distances[a, b]
+            delta += np.where(has_next, distances[b, d_safe] - distances[c, d_safe], 0.0)
+            best = int(np.argmin(delta))
+            if delta[best] < -IMPROVEMENT_EPSILON:
+                j = i + 2 + best
+                order[i + 1:j + 1] = order[i + 1:j + 1][::-1]
+                improved = True
+            if time.perf_counter() >= deadline:
+                break
+    return order
+
+
+def sequence(
+    features: np.ndarray, mask: np.ndarray, start: Optional[int] = 0, budget: float = TWO_OPT_BUDGET
+) -> Tuple[np.ndarray, float, float]:
+    """
+    (order, cost of the current order, cost of the new order). With start None
+    the path opens on the lowest-energy track that has features.
+    """
+    n = len(features)
+    if n < 3:
+        return np.arange(n), 0.0, 0.0
+    distances = distance_matrix(features, mask)
+    if start is None:
+        energy = np.where(mask, features[:, FEATURE_INDEX['energy']], np.inf)
+        start = int(np.argmin(energy)) if mask.any() else 0
+    order = two_opt(distances, nearest_neighbour(distances, start), budget)
+    before = path_cost(distances, np.arange(n))
+    after = path_cost(distances, order)
+    if after >= before and start == 0:
+        return np.arange(n), before, before
+    return order, before, after
+
+
+def reorder_moves(order: List[int]) -> List[Tuple[int, int, int]]:
+    """
+    (range_start, range_length, insert_before) moves turning positions
+    0..n-1 into `order`. Each move brings the next out-of-place track to
+    the front of the unsorted part, together with the tracks that already
+    follow it in the target order.
+    """
+    current = list(range(len(order)))
+    moves = []
+    for target in range(len(order)):
+        if current[target] == order[target]:
+            continue
+        position = current.index(order[target], target)
+        length = 1
+        while (position + length < len(current) and target + length < len(order)
+               and current[position + length] == order[target + length]):
+            length += 1
+        block = current[position:position + length]
+        del current[position:position + length]
+        current[target:target] = block
+        moves.append((position, length, target))
+    return moves
+
+
+def plan(
+    features: np.ndarray, mask: np.ndarray, start: Optional[int] = 0
+) -> Tuple[List[int], float, float, List[Tuple[int, int, int]]]:
+    """sequence() and the reorder moves for its order; both are CPU-bound, run it off the event loop"""
+    order, before, after = sequence(features, mask, start)
+    order = order.tolist()
+    return order, before, after, reorder_moves(order)
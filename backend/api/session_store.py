@@ -0,0 +1,279 @@
+"""
+Pluggable key/value store for OAuth states, sessions and token info.
+
+Two backends are provided:
+- MemoryStore: per-process, expiry tracked with a min-heap
+- SQLiteStore: shared by every worker on the host, expiry via an indexed column
+
+The backend is selected with SESSION_STORE ("sqlite" or "memory"). Any
+BaseStore subclass (e.g. a Redis-backed implementation) can be installed
+with set_store().
+
+The SQLite file holds access and refresh tokens, so it is created readable
+by its owner only. With SESSION_SECRET set, values are also encrypted and
+keys (some of which are access tokens) stored as HMACs.
+"""
+import base64
+import hashlib
+import hmac
+import heapq
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+try:
+    from cryptography.fernet import Fernet, InvalidToken
+except ImportError:  # installed with python-jose[cryptography]; without it values stay plaintext
+    Fernet = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DB_PATH = Path(__file__).parent.parent / "cache" / "sessions.db"
+PURGE_INTERVAL = 30  # seconds between expiry sweeps
+DB_FILE_MODE = 0o600  # the database and its WAL/SHM files hold tokens
+DB_DIR_MODE = 0o700
+
+
+class BaseStore(ABC):
+    """Interface shared by all store backends. Values are JSON-serializable dicts."""
+
+    @abstractmethod
+    def set(self, namespace: str, key: str, value: Dict, ttl: float) -> None:
+        ...
+
+    @abstractmethod
+    def get(self, namespace: str, key: str) -> Optional[Dict]:
+        ...
+
+    @abstractmethod
+    def pop(self, namespace: str, key: str) -> Optional[Dict]:
+        """Atomically read and delete a key."""
+
+    @abstractmethod
+    def delete(self, namespace: str, key: str) -> None:
+        ...
+
+    @abstractmethod
+    def purge_expired(self) -> int:
+        ...
+
+
+class MemoryStore(BaseStore):
+    """In-process store. Only safe with a single worker."""
+
+    def __init__(self):
+        self._data: Dict[Tuple[str, str], Tuple[float, Dict]] = {}
+        self._expiry_heap: List[Tuple[float, str, str]] = []
+        self._lock = threading.Lock()
+
+    def set(self, namespace: str, key: str, value: Dict, ttl: float) -> None:
+        expires_at = time.time() + ttl
+        with self._lock:
+            self._data[(namespace, key)] = (expires_at, value)
+            heapq.heappush(self._expiry_heap, (expires_at, namespace, key))
+            self._purge_locked()
+
+    def get(self, namespace: str, key: str) -> Optional[Dict]:
+        with self._lock:
+            entry = self._data.get((namespace, key))
+            if not entry:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.time():
+                del self._data[(namespace, key)]
+                return None
+            return value
+
+    def pop(self, namespace: str, key: str) -> Optional[Dict]:
+        with self._lock:
+            entry = self._data.pop((namespace, key), None)
+            if not entry or entry[0] <= time.time():
+                return None
+            return entry[1]
+
+    def delete(self, namespace: str, key: str) -> None:
+        with self._lock:
+            self._data.pop((namespace, key), None)
+
+    def purge_expired(self) -> int:
+        with self._lock:
+            return self._purge_locked()
+
+    def _purge_locked(self) -> int:
+        """Pop expired heap entries; only O(k log n) for the k expired keys."""
+        now = time.time()
+        removed = 0
+        while self._expiry_heap and self._expiry_heap[0][0] <= now:
+            expires_at, namespace, key = heapq.heappop(self._expiry_heap)
+            entry = self._data.get((namespace, key))
+            # Skip stale heap entries left behind by overwrites
+            if entry and entry[0] == expires_at:
+                del self._data[(namespace, key)]
+                removed += 1
+        return removed
+
+
+class ValueCipher:
+    """Encrypts stored values and hashes keys with a key derived from a secret"""
+
+    def __init__(self, secret: str):
+        digest = hashlib.sha256(secret.encode("utf-8")).digest()
+        self._fernet = Fernet(base64.urlsafe_b64encode(digest))
+        self._key_secret = hashlib.sha256(b"keys:" + digest).digest()
+
+    def key(self, key: str) -> str:
+        return hmac.new(self._key_secret, key.encode("utf-8"), hashlib.sha256).hexdigest()
+
+    def encrypt(self, value: Dict) -> str:
+        return self._fernet.encrypt(json.dumps(value).encode("utf-8")).decode("ascii")
+
+    def decrypt(self, value: str) -> Optional[Dict]:
+        try:
+            return json.loads(self._fernet.decrypt(value.encode("ascii")))
+        except InvalidToken:
+            # Written under another secret (or before one was set); treat as missing
+            return None
+
+
+def restrict_permissions(db_path: Path) -> None:
+    """Owner-only access to the database and the WAL/SHM files next to it"""
+    for path in (db_path, Path(f"{db_path}-wal"), Path(f"{db_path}-shm")):
+        try:
+            if path.exists():
+                os.chmod(path, DB_FILE_MODE)
+        except OSError as e:
+            logger.warning(f"Error restricting permissions on {path}: {str(e)}")
+
+
+class SQLiteStore(BaseStore):
+    """Store backed by a SQLite file, shared by all gunicorn workers on a host."""
+
+    def __init__(self, db_path: Path, cipher: Optional[ValueCipher] = None):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(mode=DB_DIR_MODE, parents=True, exist_ok=True)
+        self.cipher = cipher
+        self._lock = threading.Lock()
+        self._last_purge = 0.0
+        # Files sqlite creates from here on (database, WAL, SHM) start owner-only
+        previous_umask = os.umask(0o077)
+        try:
+            self._conn = sqlite3.connect(str(self.db_path), timeout=10, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        finally:
+            os.umask(previous_umask)
+        restrict_permissions(self.db_path)
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS kv (
+                namespace TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                PRIMARY KEY (namespace, key)
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS kv_expires_at ON kv (expires_at)")
+
+    def _key(self, key: str) -> str:
+        return self.cipher.key(key) if self.cipher else key
+
+    def _dump(self, value: Dict) -> str:
+        return self.cipher.encrypt(value) if self.cipher else json.dumps(value)
+
+    def _load(self, value: str) -> Optional[Dict]:
+        return self.cipher.decrypt(value) if self.cipher else json.loads(value)
+
+    def set(self, namespace: str, key: str, value: Dict, ttl: float) -> None:
+        expires_at = time.time() + ttl
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO kv (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                (namespace, self._key(key), self._dump(value), expires_at),
+            )
+            self._maybe_purge_locked()
+
+    def get(self, namespace: str, key: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM kv WHERE namespace = ? AND key = ? AND expires_at > ?",
+                (namespace, self._key(key), time.time()),
+            ).fetchone()
+        return self._load(row[0]) if row else None
+
+    def pop(self, namespace: str, key: str) -> Optional[Dict]:
+        with self._lock:
+            # DELETE ... RETURNING keeps read-and-delete atomic across processes
+            row = self._conn.execute(
+                "DELETE FROM kv WHERE namespace = ? AND key = ? RETURNING value, expires_at",
+                (namespace, self._key(key)),
+            ).fetchone()
+        if not row or row[1] <= time.time():
+            return None
+        return self._load(row[0])
+
+    def delete(self, namespace: str, key: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM kv WHERE namespace = ? AND key = ?", (namespace, self._key(key)))
+
+    def purge_expired(self) -> int:
+        with self._lock:
+            return self._purge_locked()
+
+    def _maybe_purge_locked(self) -> None:
+        if time.time() - self._last_purge >= PURGE_INTERVAL:
+            self._purge_locked()
+
+    def _purge_locked(self) -> int:
+        # Range delete on the expires_at index, not a table scan
+        self._last_purge = time.time()
+        cursor = self._conn.execute("DELETE FROM kv WHERE expires_at <= ?", (self._last_purge,))
+        return cursor.rowcount
+
+
+_store: Optional[BaseStore] = None
+_store_lock = threading.Lock()
+
+
+def create_store() -> BaseStore:
+    backend = os.getenv("SESSION_STORE", "sqlite").lower()
+    if backend == "memory":
+        logger.info("Using in-memory session store")
+        return MemoryStore()
+    db_path = os.getenv("SESSION_DB_PATH", str(DEFAULT_DB_PATH))
+    secret = os.getenv("SESSION_SECRET")
+    cipher = None
+    if secret and Fernet is not None:
+        cipher = ValueCipher(secret)
+    else:
+        logger.warning(f"Session tokens in {db_path} are not encrypted; set SESSION_SECRET (needs cryptography)")
+    try:
+        store = SQLiteStore(Path(db_path), cipher)
+        logger.info(f"Using SQLite session store at {db_path}")
+        return store
+    except sqlite3.Error as e:
+        logger.error(f"Error opening SQLite session store, falling back to memory: {str(e)}")
+        return MemoryStore()
+
+
+def get_store() -> BaseStore:
+    """Return the process-wide store, creating it on first use."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = create_store()
+    return _store
+
+
+def set_store(store: BaseStore) -> None:
+    """Install a different backend, e.g. a Redis-backed store or a test double."""
+    global _store
+    _store = store
@@ -0,0 +1,149 @@
+"""
+Set algebra over playlists.
+
+An expression combines playlist IDs (or spotify:playlist: URIs, or album_
+IDs for saved albums) with | (union), & (intersection), - (difference) and
+merge(a, b, ...), which interleaves its operands round-robin. & binds
+tighter than | and -, which apply left to right, so "A | B - C" is
+everything in A or B that is not in C. Parentheses group.
+
+Every value is an insertion-ordered dict keyed by URI or ISRC, so each
+operation is one pass of hash lookups, tracks keep the order in which they
+first appear, and repeats collapse to their first occurrence.
+"""
+import re
+from itertools import zip_longest
+from typing import Callable, Dict, List, Tuple, Union
+
+from .records import TrackRecord
+
+MAX_EXPRESSION_LENGTH = 2000
+MAX_OPERANDS = 25  # distinct playlists in one expression
+DEDUPE_KEYS = ("uri", "isrc")
+
+OPERATORS = ("|", "&", "-", "(", ")", ",")
+TOKEN = re.compile(r"\s*(?:(spotify:playlist:)?([A-Za-z0-9_]+)|([|&\-(),]))")
+
+# ("playlist", id) | (op, left, right) | ("merge", operands...)
+Node = Tuple[Union[str, "Node"], ...]
+Tracks = Dict[str, TrackRecord]  # key -> first track with that key, in order
+
+
+class ExpressionError(ValueError):
+    pass
+
+
+def tokenize(expression: str) -> List[str]:
+    tokens, position = [], 0
+    expression = expression.rstrip()
+    while position < len(expression):
+        match = TOKEN.match(expression, position)
+        if not match:
+            position += len(expression[position:]) - len(expression[position:].lstrip())
+            raise ExpressionError(f"Unexpected character at position {position}: {expression[position]!r}")
+        tokens.append(match.group(2) or match.group(3))
+        position = match.end()
+    return tokens
+
+
+class Parser:
+    """expr := term (('|' | '-') term)*; term := atom ('&' atom)*; atom := ID | merge(expr, ...) | (expr)"""
+
+    def __init__(self, tokens: List[str]):
+        self.tokens = tokens
+        self.position = 0
+
+    def peek(self) -> str:
+        return self.tokens[self.position] if self.position < len(self.tokens) else ""
+
+    def take(self, expected: str = "") -> str:
+        token = self.peek()
+        if not token or (expected and token != expected):
+            raise ExpressionError(f"Expected {expected or 'a playlist'} at token {self.position + 1}, got {token or 'end'}")
+        self.position += 1
+        return token
+
+    def parse(self) -> Node:
+        node = self.expr()
+        if self.peek():
+            raise ExpressionError(f"Unexpected {self.peek()!r} at token {self.position + 1}")
+        return node
+
+    def expr(self) -> Node:
+        node = self.term()
+        while self.peek() in ("|", "-"):
+            op = "union" if self.take() == "|" else "difference"
+            node = (op, node, self.term())
+        return node
+
+    def term(self) -> Node:
+        node = self.atom()
+        while self.peek() == "&":
+            self.take()
+            node = ("intersection", node, self.atom())
+        return node
+
+    def atom(self) -> Node:
+        token = self.take()
+        if token == "(":
+            node = self.expr()
+            self.take(")")
+            return node
+        if token == "merge" and self.peek() == "(":
+            self.take("(")
+            operands = [self.expr()]
+            while self.peek() == ",":
+                self.take()
+                operands.append(self.expr())
+            self.take(")")
+            return ("merge", *operands)
+        if token in OPERATORS:
+            raise ExpressionError(f"Expected a playlist at token {self.position}, got {token!r}")
+        return ("playlist", token)
+
+
+def parse(expression: str) -> Node:
+    if len(expression) > MAX_EXPRESSION_LENGTH:
+        raise ExpressionError(f"Expression longer than {MAX_EXPRESSION_LENGTH} characters")
+    node = Parser(tokenize(expression)).parse()
+    if len(playlist_ids(node)) > MAX_OPERANDS:
+        raise ExpressionError(f"At most {MAX_OPERANDS} playlists per expression")
+    return node
+
+
+def playlist_ids(node: Node) -> List[str]:
+    """Distinct playlists referenced, in order of appearance"""
+    if node[0] == "playlist":
+        return [node[1]]
+    return list(dict.fromkeys(pid for child in node[1:] for pid in playlist_ids(child)))
+
+
+def track_key(dedupe_by: str) -> Callable[[TrackRecord], str]:
+    """URI, or ISRC so other releases of the same recording count as one (URI when there is none)"""
+    if dedupe_by == "isrc":
+        return lambda record: f"isrc:{record.isrc}" if record.isrc else record.uri
+    return lambda record: record.uri
+
+
+def evaluate(node: Node, playlists: Dict[str, List[TrackRecord]], key: Callable[[TrackRecord], str]) -> Tracks:
+    op = node[0]
+    if op == "playlist":
+        tracks: Tracks = {}
+        for record in playlists[node[1]]:
+            if record.uri:
+                tracks.setdefault(key(record), record)
+        return tracks
+    values = [evaluate(child, playlists, key) for child in node[1:]]
+    if op == "merge":
+        merged: Tracks = {}
+        for column in zip_longest(*(list(v.items()) for v in values)):
+            for pair in column:
+                if pair is not None:
+                    merged.setdefault(*pair)
+        return merged
+    left, right = values
+    if op == "union":
+        return {**left, **{k: v for k, v in right.items() if k not in left}}
+    if op == "intersection":
+        return {k: v for k, v in left.items() if k in right}
+    return {k: v for k, v in left.items() if k not in right}
@@ -0,0 +1,303 @@
+"""
+Async access to blocking spotipy calls, paced by a shared rate limiter and guarded by the Spotify circuit breaker.
+
+spotipy is synchronous, so calls run in the threadpool instead of blocking
+the event loop, and every call first takes a token from the limiter so
+concurrent work stays under the app's request budget.
+
+Tokens are handed out by a fair scheduler: interactive calls go before bulk
+crawls, which go before background jobs, and within a class users take
+turns, so one user's 300-playlist crawl can't starve everyone else. The user
+and class come from context variables set per request (`spotify_user`) and
+per operation (`runs_at` / `spotify_context`).
+"""
+import asyncio
+import functools
+import heapq
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional
+
+from starlette.concurrency import run_in_threadpool
+
+from .circuit_breaker import CircuitOpenError, get_breaker
+from .metrics import metrics
+
+# Spotify API limits
+SPOTIFY_MAX_ITEMS = 100  # max URIs per add/remove call
+SPOTIFY_RATE_LIMIT = float(os.getenv("SPOTIFY_RATE_LIMIT", "10"))  # requests per second per worker
+SPOTIFY_BURST = int(os.getenv("SPOTIFY_BURST", "20"))
+
+# Scheduling classes, most urgent first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 1
+PRIORITY_BACKGROUND = 2
+PRIORITY_NAMES = ("interactive", "bulk", "background")
+
+USER_WAIT_STATS_SIZE = 1000  # most recently active users whose wait times are kept
+TOP_USER_WAITS = 10  # users listed in /metrics by average queue wait
+
+spotify_user: ContextVar[Optional[str]] = ContextVar("spotify_user", default=None)
+spotify_priority: ContextVar[int] = ContextVar("spotify_priority", default=PRIORITY_INTERACTIVE)
+
+
+class RateLimiter:
+    """Token bucket shared by all coroutines in the worker."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def try_acquire(self) -> bool:
+        """Take a token only if one is available right now"""
+        if self._lock.locked():
+            return False
+        self._refill()
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return True
+        return False
+
+    def refund(self) -> None:
+        self._tokens = min(self.burst, self._tokens + 1)
+
+    def available(self) -> float:
+        self._refill()
+        return self._tokens
+
+
+class FairScheduler:
+    """
+    Hands out rate-limiter tokens by strict priority between classes and
+    round-robin between users within a class.
+
+    Callers that find nobody waiting and a token available go straight
+    through; everyone else queues per (class, user) and a single dispatcher
+    grants tokens as the limiter refills.
+    """
+
+    def __init__(self, limiter: RateLimiter):
+        self.limiter = limiter
+        self._queues: List["OrderedDict[str, Deque[asyncio.Future]]"] = [OrderedDict() for _ in PRIORITY_NAMES]
+        self._waiting = 0
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._user_waits: "OrderedDict[str, Dict[str, float]]" = OrderedDict()
+        self._interactive_listeners: List[Callable[[], None]] = []
+        metrics.register_gauge("spotify.scheduler.waiting", lambda: self._waiting)
+        metrics.register_gauge("spotify.scheduler.users_waiting", lambda: sum(len(q) for q in self._queues))
+        metrics.register_gauge("spotify.scheduler.worst_user_avg_wait", self._worst_user_avg_wait)
+        metrics.register_gauge("spotify.scheduler.top_user_waits", self.top_user_waits)
+
+    async def acquire(self) -> None:
+        user = spotify_user.get() or "anonymous"
+        priority = spotify_priority.get()
+        if not self._waiting and self.limiter.try_acquire():
+            self._record(user, priority, 0.0)
+            return
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._queues[priority].setdefault(user, deque()).append(waiter)
+        self._waiting += 1
+        if self._dispatcher is None:
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        if priority == PRIORITY_INTERACTIVE:
+            for listener in self._interactive_listeners:
+                listener()
+        queued_at = time.monotonic()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.limiter.refund()  # granted just as we were cancelled
+            else:
+                waiter.cancel()
+                self._waiting -= 1
+                self._discard(priority, user, waiter)
+            raise
+        self._record(user, priority, time.monotonic() - queued_at)
+
+    async def _dispatch(self) -> None:
+        try:
+            while self._waiting:
+                await self.limiter.acquire()
+                waiter = self._next_waiter()
+                if waiter is None:
+                    self.limiter.refund()
+                    break
+                self._waiting -= 1
+                waiter.set_result(None)
+        finally:
+            self._dispatcher = None
+
+    def _next_waiter(self) -> Optional[asyncio.Future]:
+        for queue in self._queues:
+            while queue:
+                user, waiters = next(iter(queue.items()))
+                waiter = None
+                while waiters and waiter is None:
+                    candidate = waiters.popleft()
+                    if not candidate.done():
+                        waiter = candidate
+                # The user goes to the back of the line for their next call
+                if waiters:
+                    queue.move_to_end(user)
+                else:
+                    del queue[user]
+                if waiter is not None:
+                    return waiter
+        return None
+
+    def has_headroom(self, reserve: float) -> bool:
+        """Nobody is queued and at least `reserve` tokens are spare"""
+        return not self._waiting and self.limiter.available() >= reserve
+
+    def on_interactive_wait(self, listener: Callable[[], None]) -> None:
+        """Call `listener` whenever an interactive call has to queue for a token"""
+        self._interactive_listeners.append(listener)
+
+    def _discard(self, priority: int, user: str, waiter: asyncio.Future) -> None:
+        queue = self._queues[priority]
+        waiters = queue.get(user)
+        if waiters is None:
+            return
+        try:
+            waiters.remove(waiter)
+        except ValueError:
+            pass
+        if not waiters:
+            del queue[user]
+
+    def _record(self, user: str, priority: int, wait: float) -> None:
+        metrics.observe(f"spotify.queue_wait.{PRIORITY_NAMES[priority]}", wait)
+        stats = self._user_waits.pop(user, None) or {"count": 0, "total": 0.0, "max": 0.0}
+        stats["count"] += 1
+        stats["total"] += wait
+        stats["max"] = max(stats["max"], wait)
+        self._user_waits[user] = stats
+        while len(self._user_waits) > USER_WAIT_STATS_SIZE:
+            self._user_waits.popitem(last=False)
+
+    def top_user_waits(self, n: int = TOP_USER_WAITS) -> List[Dict]:
+        """Queue wait stats of the n users with the longest average wait"""
+        worst = heapq.nlargest(n, self._user_waits.items(), key=lambda item: item[1]["total"] / item[1]["count"])
+        return [
+            {"user": user, "count": s["count"], "avg": s["total"] / s["count"], "max": s["max"]}
+            for user, s in worst
+        ]
+
+    def _worst_user_avg_wait(self) -> float:
+        return max((s["total"] / s["count"] for s in self._user_waits.values()), default=0.0)
+
+
+spotify_limiter = RateLimiter(SPOTIFY_RATE_LIMIT, SPOTIFY_BURST)
+spotify_scheduler = FairScheduler(spotify_limiter)
+spotify_breaker = get_breaker("spotify")
+
+
+@contextmanager
+def spotify_context(user_id: Optional[str] = None, priority: Optional[int] = None) -> Iterator[None]:
+    """Attribute the Spotify calls made inside the block to a user and/or class"""
+    user_token = spotify_user.set(user_id) if user_id is not None else None
+    # Never raise urgency: bulk work started from a background job stays background
+    priority_token = spotify_priority.set(max(priority, spotify_priority.get())) if priority is not None else None
+    try:
+        yield
+    finally:
+        if priority_token is not None:
+            spotify_priority.reset(priority_token)
+        if user_token is not None:
+            spotify_user.reset(user_token)
+
+
+def runs_at(priority: int):
+    """Decorator running an async function's Spotify calls in the given class"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            with spotify_context(priority=priority):
+                return await fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+async def call_spotify(fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """
+    Run a spotipy call in the threadpool once the rate limiter allows it.
+    Raises CircuitOpenError without calling upstream while Spotify is failing.
+    """
+    await spotify_scheduler.acquire()
+    # Claim the breaker (possibly its half-open probe slot) only once we are about to call
+    try:
+        spotify_breaker.before_call()
+    except CircuitOpenError:
+        spotify_scheduler.limiter.refund()  # nothing was sent
+        raise
+    try:
+        result = await run_in_threadpool(fn, *args, **kwargs)
+    except BaseException as e:
+        # Cancellation included, so a cancelled probe releases its slot
+        spotify_breaker.record_failure(e)
+        raise
+    spotify_breaker.record_success()
+    return result
+
+
+def chunked(items: List[Any], size: int = SPOTIFY_MAX_ITEMS) -> Iterator[List[Any]]:
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+class PlaylistWriter:
+    """
+    Writes URIs to a playlist as they become available, in order.
+
+    Producers put() lists of URIs while they are still computing the rest;
+    run() writes each in chunks as soon as it arrives. With replace=True the
+    first chunk replaces the playlist's contents and later ones append.
+    """
+
+    def __init__(self, sp, playlist_id: str, replace: bool = False):
+        self.sp = sp
+        self.playlist_id = playlist_id
+        self.replace = replace
+        self.written = 0
+        self._queue: "asyncio.Queue[Optional[List[str]]]" = asyncio.Queue()
+
+    def put(self, uris: List[str]) -> None:
+        if uris:
+            self._queue.put_nowait(list(uris))
+
+    def close(self) -> None:
+        self._queue.put_nowait(None)
+
+    async def run(self) -> int:
+        while True:
+            uris = await self._queue.get()
+            if uris is None:
+                return self.written
+            for chunk in chunked(uris):
+                if self.replace and self.written == 0:
+                    await call_spotify(self.sp.playlist_replace_items, self.playlist_id, chunk)
+                else:
+                    await call_spotify(self.sp.playlist_add_items, self.playlist_id, chunk)
+                self.written += len(chunk)
@@ -0,0 +1,147 @@
+"""
+Row formats for streaming playlist export and import (CSV and JSONL).
+
+Export encodes one page of tracks at a time; import reads rows lazily from
+the uploaded file, so neither side holds a whole playlist in memory.
+
+Headers are sent before the first page is fetched, so an export that fails
+part-way ends with an error row instead of a clean end of file; import
+checks every row, and refuses files with one, before writing anything.
+"""
+import codecs
+import csv
+import io
+import json
+from typing import BinaryIO, Dict, Iterator, List, Optional
+
+EXPORT_FIELDS = (
+    "playlist_id", "playlist_name", "position", "uri", "name", "artists",
+    "album", "isrc", "duration_ms", "added_at", "error",
+)
+EXPORT_FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "jsonl": "application/x-ndjson",
+}
+ARTIST_SEPARATOR = "; "
+
+
+class ImportRowError(ValueError):
+    pass
+
+
+def item_to_row(item: Dict, playlist_id: str, playlist_name: str, position: int) -> Dict:
+    """Flatten a playlist track item into an export row"""
+    track = item.get('track') or {}
+    return {
+        "playlist_id": playlist_id,
+        "playlist_name": playlist_name,
+        "position": position,
+        "uri": track.get('uri', ''),
+        "name": track.get('name', ''),
+        "artists": ARTIST_SEPARATOR.join(a.get('name', '') for a in track.get('artists', [])),
+        "album": (track.get('album') or {}).get('name', ''),
+        "isrc": (track.get('external_ids') or {}).get('isrc', ''),
+        "duration_ms": track.get('duration_ms', ''),
+        "added_at": item.get('added_at') or '',
+    }
+
+
+def error_row(playlist_id: str, playlist_name: str, message: str) -> Dict:
+    """Trailer for an export that stopped early"""
+    return {
+        "playlist_id": playlist_id,
+        "playlist_name": playlist_name,
+        "error": f"Export incomplete: {message}",
+    }
+
+
+class CsvEncoder:
+    """Encodes batches of rows to CSV text, writing the header once"""
+
+    def __init__(self):
+        self._buffer = io.StringIO()
+        self._writer = csv.DictWriter(self._buffer, fieldnames=EXPORT_FIELDS, extrasaction='ignore')
+        self._header_written = False
+
+    def encode(self, rows: List[Dict]) -> str:
+        if not self._header_written:
+            self._writer.writeheader()
+            self._header_written = True
+        self._writer.writerows(rows)
+        chunk = self._buffer.getvalue()
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        return chunk
+
+
+class JsonlEncoder:
+    def encode(self, rows: List[Dict]) -> str:
+        return "".join(json.dumps(row, ensure_ascii=False) + "\n" for row in rows)
+
+
+def get_encoder(fmt: str):
+    return CsvEncoder() if fmt == "csv" else JsonlEncoder()
+
+
+def detect_format(filename: Optional[str], fmt: Optional[str]) -> str:
+    if fmt:
+        return fmt.lower()
+    if filename and filename.lower().endswith((".jsonl", ".ndjson", ".json")):
+        return "jsonl"
+    return "csv"
+
+
+def iter_import_rows(file: BinaryIO, fmt: str) -> Iterator[Dict]:
+    """Lazily parse rows from an uploaded file; blank JSONL lines are skipped"""
+    text = codecs.getreader("utf-8-sig")(file)
+    if fmt == "jsonl":
+        for line in text:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+    else:
+        for row in csv.DictReader(text):
+            yield {k.strip().lower(): (v or '').strip() for k, v in row.items() if k}
+
+
+def validate_import_rows(file: BinaryIO, fmt: str) -> int:
+    """Parse the whole file once, so bad rows are refused before any write; returns the row count"""
+    count = 0
+    try:
+        for count, row in enumerate(iter_import_rows(file, fmt), 1):
+            if not isinstance(row, dict):
+                raise ImportRowError(f"Row {count} is not an object")
+            if row.get("error"):
+                raise ImportRowError(f"Row {count}: {row['error']}")
+    except ImportRowError:
+        raise
+    except (ValueError, csv.Error) as e:
+        # Decoding and JSON errors are ValueErrors too
+        raise ImportRowError(f"Row {count + 1} can't be parsed: {str(e)}")
+    file.seek(0)
+    return count
+
+
+def row_uri(row: Dict) -> Optional[str]:
+    """A usable track URI from a row, accepting URIs, open.spotify.com links or bare ids"""
+    value = str(row.get("uri") or row.get("url") or row.get("id") or "").strip()
+    if not value:
+        return None
+    if value.startswith("spotify:track:"):
+        return value
+    if "open.spotify.com/track/" in value:
+        return "spotify:track:" + value.split("/track/")[1].split("?")[0]
+    if len(value) == 22 and value.isalnum():
+        return f"spotify:track:{value}"
+    return None
+
+
+def row_query(row: Dict) -> Optional[str]:
+    """Spotify search query for rows without a URI"""
+    if row.get("isrc"):
+        return f"isrc:{row['isrc']}"
+    title = row.get("name") or row.get("track") or row.get("title")
+    artist = (row.get("artists") or row.get("artist") or "").split(ARTIST_SEPARATOR)[0]
+    if not title:
+        return None
+    return f"track:{title} artist:{artist}" if artist else f"track:{title}"
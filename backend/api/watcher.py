@@ -0,0 +1,230 @@
+"""
+Server-side change feed for playlists edited outside the app.
+
+One watcher per connected user polls the playlist listing and compares
+snapshot_ids with what is cached; only playlists whose snapshot moved are
+re-fetched and diffed, and the resulting change events are pushed to every
+WebSocket the user has open. The poll interval stays short while the user
+is active and backs off while they are idle, to save rate-limit budget.
+
+The poll itself is injected as `poll(user_id, access_token, baseline) ->
+(events, baseline)`, so this module knows nothing about how listings and
+tracks are fetched.
+"""
+import asyncio
+import logging
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from fastapi import HTTPException, WebSocket
+
+from .auth import token_manager
+from .circuit_breaker import CircuitOpenError
+from .metrics import metrics
+from .records import PlaylistRecord, TrackRecord
+from .spotify_client import PRIORITY_BACKGROUND, spotify_priority, spotify_user
+
+logger = logging.getLogger(__name__)
+
+# Poll intervals adapt to activity
+ACTIVE_INTERVAL = 15  # seconds between polls while the user is active
+IDLE_INTERVAL = 300  # ceiling the interval backs off to while idle
+ACTIVITY_WINDOW = 120  # a request or client message within this many seconds counts as active
+ERROR_INTERVAL = 60  # wait after a failed poll
+
+UNAUTHORIZED_CLOSE_CODE = 4401
+AUTH_TIMEOUT = 10  # seconds a new connection has to send its token
+
+Listing = Dict[str, PlaylistRecord]
+Poller = Callable[[str, str, Optional[Listing]], Awaitable[Tuple[List[Dict], Listing]]]
+
+
+def diff_listing(old: Listing, new: Listing) -> Tuple[List[Dict], List[str]]:
+    """Playlist-level events and the ids of playlists whose snapshot changed"""
+    events, changed = [], []
+    for playlist_id, playlist in new.items():
+        before = old.get(playlist_id)
+        if before is None:
+            events.append({"type": "playlist_added", "playlist": playlist.to_dict()})
+            continue
+        if before.name != playlist.name:
+            events.append({
+                "type": "playlist_renamed",
+                "playlist_id": playlist_id,
+                "old_name": before.name,
+                "name": playlist.name
+            })
+        if before.snapshot_id != playlist.snapshot_id:
+            changed.append(playlist_id)
+    for playlist_id in old.keys() - new.keys():
+        events.append({"type": "playlist_removed", "playlist_id": playlist_id})
+    return events, changed
+
+
+def _common_order(uris: List[str], common: Counter) -> List[str]:
+    remaining = Counter(common)
+    kept = []
+    for uri in uris:
+        if remaining[uri] > 0:
+            remaining[uri] -= 1
+            kept.append(uri)
+    return kept
+
+
+def diff_tracks(
+    playlist_id: str, snapshot_id: Optional[str], old: Iterable[TrackRecord], new: Iterable[TrackRecord]
+) -> List[Dict]:
+    """Tracks added, removed and whether the tracks present in both moved (multiset-aware, linear)"""
+    old_uris = [record.uri for record in old]
+    new_uris = [record.uri for record in new]
+    old_counts, new_counts = Counter(old_uris), Counter(new_uris)
+    base = {"playlist_id": playlist_id, "snapshot_id": snapshot_id}
+
+    events = []
+    added = list((new_counts - old_counts).elements())
+    removed = list((old_counts - new_counts).elements())
+    if added:
+        events.append({"type": "tracks_added", **base, "uris": added})
+    if removed:
+        events.append({"type": "tracks_removed", **base, "uris": removed})
+    common = old_counts & new_counts
+    if _common_order(old_uris, common) != _common_order(new_uris, common):
+        events.append({"type": "tracks_reordered", **base})
+    if not events:
+        # Snapshot moved without a visible track change (e.g. description edit)
+        events.append({"type": "playlist_updated", **base})
+    return events
+
+
+class PlaylistWatcher:
+    """Polls one user's playlists for as long as they have a socket open."""
+
+    def __init__(self, user_id: str, access_token: str, poll: Poller):
+        self.user_id = user_id
+        self.access_token = access_token
+        self.poll = poll
+        self.baseline: Optional[Listing] = None  # playlists as of the last poll
+        self.sockets: Set[WebSocket] = set()
+        self.interval = ACTIVE_INTERVAL
+        self.last_active = time.monotonic()
+        self.last_poll = time.monotonic()
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def touch(self) -> None:
+        """Mark the user active; an idle watcher shortens its wait right away"""
+        self.last_active = time.monotonic()
+        if self.interval > ACTIVE_INTERVAL:
+            self.interval = ACTIVE_INTERVAL
+            self._wake.set()
+
+    def _next_interval(self, had_events: bool) -> float:
+        if had_events or time.monotonic() - self.last_active < ACTIVITY_WINDOW:
+            return ACTIVE_INTERVAL
+        return min(self.interval * 2, IDLE_INTERVAL)
+
+    async def _run(self) -> None:
+        # The task has its own context: polls queue behind interactive and bulk calls
+        spotify_user.set(self.user_id)
+        spotify_priority.set(PRIORITY_BACKGROUND)
+        while self.sockets:
+            delay = self.last_poll + self.interval - time.monotonic()
+            if delay > 0:
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=delay)
+                    continue  # interval changed, recompute the remaining wait
+                except asyncio.TimeoutError:
+                    pass
+
+            self.last_poll = time.monotonic()
+            try:
+                session = await token_manager.ensure_valid(self.access_token)
+                self.access_token = session['access_token']
+                events, self.baseline = await self.poll(self.user_id, self.access_token, self.baseline)
+            except CircuitOpenError as e:
+                self.interval = max(self.interval, e.retry_after)
+                continue
+            except HTTPException as e:
+                if e.status_code == 401:
+                    logger.info(f"Stopping change feed for user {self.user_id}: {e.detail}")
+                    await self._close_all(UNAUTHORIZED_CLOSE_CODE)
+                    return
+                logger.warning(f"Change poll failed for user {self.user_id}: {e.detail}")
+                self.interval = max(self.interval, ERROR_INTERVAL)
+                continue
+            except Exception as e:
+                logger.warning(f"Change poll failed for user {self.user_id}: {str(e)}")
+                self.interval = max(self.interval, ERROR_INTERVAL)
+                continue
+
+            metrics.incr("watcher.polls")
+            metrics.observe("watcher.poll", time.monotonic() - self.last_poll)
+            if events:
+                metrics.incr("watcher.events", len(events))
+                await self.broadcast({"type": "changes", "events": events, "time": datetime.now().isoformat()})
+            self.interval = self._next_interval(bool(events))
+
+    async def broadcast(self, message: Dict) -> None:
+        for socket in list(self.sockets):
+            try:
+                await socket.send_json(message)
+            except Exception:
+                self.sockets.discard(socket)
+
+    async def _close_all(self, code: int) -> None:
+        for socket in list(self.sockets):
+            try:
+                await socket.close(code=code)
+            except Exception:
+                pass
+        self.sockets.clear()
+
+
+class WatchHub:
+    """Per-worker registry of watchers, one per user with open sockets."""
+
+    def __init__(self):
+        self.watchers: Dict[str, PlaylistWatcher] = {}
+        metrics.register_gauge("watcher.users", lambda: len(self.watchers))
+        metrics.register_gauge("watcher.sockets", lambda: sum(len(w.sockets) for w in self.watchers.values()))
+
+    def attach(self, user_id: str, access_token: str, socket: WebSocket, poll: Poller) -> PlaylistWatcher:
+        watcher = self.watchers.get(user_id)
+        if watcher is None:
+            watcher = self.watchers[user_id] = PlaylistWatcher(user_id, access_token, poll)
+        else:
+            watcher.access_token = access_token
+        watcher.sockets.add(socket)
+        watcher.touch()
+        watcher.start()
+        return watcher
+
+    def detach(self, user_id: str, socket: WebSocket) -> None:
+        watcher = self.watchers.get(user_id)
+        if watcher is None:
+            return
+        watcher.sockets.discard(socket)
+        if not watcher.sockets:
+            watcher.stop()
+            del self.watchers[user_id]
+
+    def touch(self, user_id: str) -> None:
+        """Called on every authenticated request; a no-op for users without a feed"""
+        watcher = self.watchers.get(user_id)
+        if watcher is not None:
+            watcher.touch()
+
+
+hub = WatchHub()
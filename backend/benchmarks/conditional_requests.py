@@ -0,0 +1,41 @@
+"""
+Conditional request benchmark: a full /playlist/{id}/tracks response
+(build, serialize) against a revalidation answered with a 304.
+
+    cd backend && python -m benchmarks.conditional_requests [sizes...]
+"""
+import sys
+import time
+
+from api.conditional import ConditionalResponses, tracks_etag
+from api.records import TrackRecord
+from benchmarks.memory_records import synthetic_items
+
+DEFAULT_SIZES = (100, 1000, 10_000)
+ROUNDS = 20
+
+
+def main(sizes) -> None:
+    responses = ConditionalResponses()
+    print(f"{'tracks':>7} {'body':>10} {'full':>9} {'304':>9} {'304 bytes':>10}")
+    for n in sizes:
+        tracks = [TrackRecord.from_item(item) for item in synthetic_items(n)]
+        etag = tracks_etag("playlist", "snapshot")
+
+        started = time.perf_counter()
+        for _ in range(ROUNDS):
+            body = {"tracks": [record.to_item() for record in tracks], "total": n, "fetch_time": "", "stale": False}
+            full = responses.full(body, etag, "bench")
+        full_time = (time.perf_counter() - started) / ROUNDS
+
+        started = time.perf_counter()
+        for _ in range(ROUNDS):
+            not_modified = responses.not_modified(etag, tracks_etag("playlist", "snapshot"), "bench")
+        revalidate_time = (time.perf_counter() - started) / ROUNDS
+
+        print(f"{n:>7} {len(full.body) / 1024:>8.0f}KB {full_time * 1000:>7.1f}ms "
+              f"{revalidate_time * 1e6:>7.0f}us {len(not_modified.body):>10}")
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES)
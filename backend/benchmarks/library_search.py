@@ -0,0 +1,92 @@
+"""
+Library search benchmark: index build time and query latency at scale.
+
+Builds an index over synthetic tracks spread across playlists of 100-500
+tracks, then times a mix of whole-word, prefix and multi-term queries.
+Title and album words follow a skewed distribution over a vocabulary that
+grows with the library (a few common words, a long tail of rare ones, about
+VOCAB_PER_TRACK distinct tokens per track), like real libraries in many
+languages; a fixed small word list would hide vocabulary maintenance costs.
+
+    cd backend && python -m benchmarks.library_search [sizes...]
+"""
+import random
+import statistics
+import sys
+import time
+from typing import List
+
+from api.library_index import LibraryIndex
+from api.records import InternPool, TrackRecord
+
+DEFAULT_SIZES = (10_000, 100_000)
+VOCAB_PER_TRACK = 8
+SKEW = 1.2  # higher puts more weight on the common words
+SYLLABLES = ["ka", "lo", "mi", "ra", "ne", "so", "tu", "vel", "dor", "an", "ri", "sha", "mon", "ze", "qu", "el"]
+WORDS = [
+    "love", "night", "heart", "dance", "fire", "dream", "light", "rain", "summer", "blue", "gold", "river",
+    "shadow", "city", "home", "wild", "young", "electric", "midnight", "forever", "ocean", "star", "runaway",
+    "paradise", "echo", "silver", "storm", "honey", "velvet", "neon", "ghost", "highway", "sunset", "crystal",
+    "thunder", "angel", "wonder", "magic", "secret", "desire", "freedom", "garden", "mirror", "winter", "fever",
+]
+QUERIES = ["love", "mid", "neon ghost", "dan", "artist 17", "su ri", "electric dream", "velvet thunder album"]
+
+
+def vocabulary(size: int, rng: random.Random) -> List[str]:
+    """WORDS first (the common end), then distinct made-up words"""
+    words = dict.fromkeys(WORDS)
+    while len(words) < size:
+        words.setdefault("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 5))))
+    return list(words)
+
+
+def synthetic_records(n: int, seed: int = 0) -> List[TrackRecord]:
+    rng = random.Random(seed)
+    pool = InternPool()
+    words = vocabulary(n * VOCAB_PER_TRACK, rng)
+
+    def word() -> str:
+        return words[int(len(words) * rng.random() ** SKEW)]
+
+    records = []
+    for i in range(n):
+        title = " ".join(word() for _ in range(rng.randint(1, 4))).title()
+        artist_no = rng.randrange(max(1, n // 20))
+        records.append(TrackRecord.from_item({
+            "added_at": None,
+            "track": {
+                "id": f"track{i}", "uri": f"spotify:track:track{i}", "name": f"{title} {i % 97}",
+                "artists": [{"id": f"artist{artist_no}", "name": f"Artist {artist_no}"}],
+                "album": {"id": f"album{artist_no}", "name": f"{word().title()} Album"},
+                "duration_ms": 200_000,
+            },
+        }, pool))
+    return records
+
+
+def main(sizes) -> None:
+    print(f"{'tracks':>8} {'tokens':>8} {'build':>9} {'p50 query':>10} {'max query':>10}")
+    for n in sizes:
+        records = synthetic_records(n)
+        index = LibraryIndex()
+        started = time.perf_counter()
+        offset, playlist_no = 0, 0
+        rng = random.Random(1)
+        while offset < n:
+            size = rng.randint(100, 500)
+            index.index_playlist(f"playlist{playlist_no}", records[offset:offset + size])
+            offset += size
+            playlist_no += 1
+        build = time.perf_counter() - started
+
+        timings = []
+        for _ in range(20):
+            for query in QUERIES:
+                started = time.perf_counter()
+                index.search(query, 20)
+                timings.append(time.perf_counter() - started)
+        print(f"{n:>8} {len(index._token_fields):>8} {build:>8.2f}s {statistics.median(timings) * 1000:>8.2f}ms {max(timings) * 1000:>8.2f}ms")
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES)
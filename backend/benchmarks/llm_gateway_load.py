@@ -0,0 +1,65 @@
+"""
+Offline load test of the brand suggestion flow through the LLM gateway.
+
+Runs the app in-process with the fake LLM provider and fires concurrent
+/brands/suggest-music requests, half of them as background refreshes, then
+prints latency percentiles per priority and the gateway metrics.
+
+    cd backend && python -m benchmarks.llm_gateway_load [requests] [concurrency]
+"""
+import asyncio
+import logging
+import os
+import sys
+import time
+
+os.environ.setdefault("LLM_PROVIDER", "fake")
+os.environ.setdefault("LLM_FAKE_LATENCY", "0.5")
+os.environ.setdefault("LLM_FAKE_FAILURE_RATE", "0.05")
+os.environ.setdefault("SESSION_STORE", "memory")
+
+import httpx
+import numpy as np
+
+from main import app
+from api.metrics import metrics
+
+DEFAULT_REQUESTS = 200
+DEFAULT_CONCURRENCY = 50
+
+
+async def run(total: int, concurrency: int) -> None:
+    logging.getLogger().setLevel(logging.WARNING)
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = {"interactive": [], "background": []}
+    statuses = {}
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        async def one(i: int) -> None:
+            kind = "background" if i % 2 else "interactive"
+            profile = {"brand": f"Brand {i % 20}", "brand_essence": {"core_identity": f"identity {i}"}}
+            async with semaphore:
+                started = time.monotonic()
+                response = await client.post(
+                    "/brands/suggest-music", params={"background": kind == "background"}, json=profile, timeout=120
+                )
+                latencies[kind].append(time.monotonic() - started)
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+        started = time.monotonic()
+        await asyncio.gather(*(one(i) for i in range(total)))
+        elapsed = time.monotonic() - started
+
+    print(f"{total} requests, concurrency {concurrency}, {elapsed:.1f}s, statuses {statuses}")
+    for kind, samples in latencies.items():
+        if samples:
+            p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+            print(f"  {kind:<12} p50 {p50:.2f}s  p95 {p95:.2f}s  p99 {p99:.2f}s")
+    snapshot = metrics.snapshot()
+    print({k: v for k, v in snapshot["counters"].items() if k.startswith("llm.")})
+    print({k: v for k, v in snapshot["timings"].items() if k.startswith("llm.")})
+
+
+if __name__ == "__main__":
+    args = [int(a) for a in sys.argv[1:]]
+    asyncio.run(run(*(args + [DEFAULT_REQUESTS, DEFAULT_CONCURRENCY][len(args):])))
@@ -0,0 +1,102 @@
+"""
+Memory benchmark: raw Spotify track items vs compact TrackRecords.
+
+Builds synthetic Spotify-shaped playlist items (decoded from JSON so no
+strings are shared by accident, as with real responses) and measures the
+memory retained by each representation with tracemalloc.
+
+    cd backend && python -m benchmarks.memory_records [sizes...]
+"""
+import gc
+import json
+import random
+import sys
+import tracemalloc
+from typing import Dict, List
+
+from api.records import InternPool, TrackRecord
+
+DEFAULT_SIZES = (10_000, 100_000)
+ARTISTS = 2_000
+ALBUMS = 5_000
+MARKETS = ["AD", "AE", "AR", "AT", "AU", "BE", "BG", "BR", "CA", "CH", "CL", "CO", "DE", "DK", "ES",
+           "FI", "FR", "GB", "GR", "HK", "IE", "IL", "IN", "IT", "JP", "MX", "NL", "NO", "NZ", "PL",
+           "PT", "SE", "SG", "TR", "TW", "US", "ZA"]
+
+
+def artist(i: int) -> Dict:
+    return {
+        "external_urls": {"spotify": f"https://open.spotify.com/artist/artist{i:016d}"},
+        "href": f"https://api.spotify.com/v1/artists/artist{i:016d}",
+        "id": f"artist{i:016d}", "name": f"Artist {i}", "type": "artist", "uri": f"spotify:artist:artist{i:016d}",
+    }
+
+
+def album(i: int) -> Dict:
+    return {
+        "album_type": "album", "total_tracks": 12, "available_markets": MARKETS,
+        "external_urls": {"spotify": f"https://open.spotify.com/album/album{i:017d}"},
+        "href": f"https://api.spotify.com/v1/albums/album{i:017d}",
+        "id": f"album{i:017d}", "name": f"Album {i}", "release_date": "2021-05-14",
+        "release_date_precision": "day", "type": "album", "uri": f"spotify:album:album{i:017d}",
+        "images": [
+            {"url": f"https://i.scdn.co/image/{size}{i:032d}", "height": size, "width": size}
+            for size in (640, 300, 64)
+        ],
+        "artists": [artist(i % ARTISTS)],
+    }
+
+
+def synthetic_items(n: int, seed: int = 0) -> List[Dict]:
+    rng = random.Random(seed)
+    items = []
+    for i in range(n):
+        album_no = rng.randrange(ALBUMS)
+        track = {
+            "album": album(album_no),
+            "artists": [artist(album_no % ARTISTS)] + ([artist(rng.randrange(ARTISTS))] if rng.random() < 0.3 else []),
+            "available_markets": MARKETS, "disc_number": 1, "duration_ms": rng.randint(90_000, 420_000),
+            "explicit": rng.random() < 0.2, "external_ids": {"isrc": f"USRC1{i:07d}"},
+            "external_urls": {"spotify": f"https://open.spotify.com/track/track{i:017d}"},
+            "href": f"https://api.spotify.com/v1/tracks/track{i:017d}",
+            "id": f"track{i:017d}", "is_local": False, "name": f"Track {i}",
+            "popularity": rng.randint(0, 100), "preview_url": None, "track_number": rng.randint(1, 12),
+            "type": "track", "uri": f"spotify:track:track{i:017d}",
+        }
+        items.append({"added_at": "2024-01-01T00:00:00Z", "track": track})
+    # Round-trip through JSON so every item owns its strings, like decoded API responses
+    return json.loads(json.dumps(items))
+
+
+def measure(build) -> int:
+    """Bytes still allocated after build() returns, while its result is alive"""
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    gc.collect()
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return retained
+
+
+def main(sizes) -> None:
+    print(f"{'tracks':>8} {'dict items':>12} {'records':>12} {'ratio':>7}")
+    for n in sizes:
+        payload = json.dumps(synthetic_items(n))
+        as_dicts = measure(lambda: json.loads(payload))
+        as_records = measure(lambda: records_from(payload))
+        print(f"{n:>8} {as_dicts / 2**20:>10.1f}MB {as_records / 2**20:>10.1f}MB {as_dicts / as_records:>6.1f}x")
+
+
+def records_from(payload: str):
+    """Decode then convert, dropping the dicts as the fetch path does; strings the records keep still count"""
+    pool = InternPool()  # holds weak references only, so it is returned alongside the records
+    items = json.loads(payload)
+    records = [TrackRecord.from_item(item, pool) for item in items]
+    del items
+    return pool, records
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES)
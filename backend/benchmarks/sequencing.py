@@ -0,0 +1,47 @@
+"""
+Sequencing benchmark: distance matrix, nearest neighbour + 2-opt and the
+resulting reorder moves for playlists of synthetic audio features, up to
+the MAX_TRACKS sequencing accepts.
+
+    cd backend && python -m benchmarks.sequencing [sizes...]
+"""
+import sys
+import time
+
+import numpy as np
+
+from api.audio_features import FEATURE_INDEX, FEATURE_KEYS
+from api.sequencing import MAX_TRACKS, TWO_OPT_BUDGET, distance_matrix, nearest_neighbour, path_cost, reorder_moves, two_opt
+
+DEFAULT_SIZES = (100, 500, 1000, MAX_TRACKS)
+
+
+def synthetic_features(n: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    features = rng.random((n, len(FEATURE_KEYS)), dtype=np.float32)
+    features[:, FEATURE_INDEX['tempo']] = rng.uniform(70, 180, n)
+    features[:, FEATURE_INDEX['key']] = rng.integers(0, 12, n)
+    features[:, FEATURE_INDEX['mode']] = rng.integers(0, 2, n)
+    return features
+
+
+def main(sizes) -> None:
+    print(f"{'tracks':>7} {'matrix':>8} {'nn':>8} {'2-opt':>8} {'plan':>8} {'cost':>22} {'moves':>6}")
+    for n in sizes:
+        features, mask = synthetic_features(n), np.ones(n, dtype=bool)
+        started = time.perf_counter()
+        distances = distance_matrix(features, mask)
+        built = time.perf_counter()
+        greedy = nearest_neighbour(distances, 0)
+        nn_done = time.perf_counter()
+        order = two_opt(distances, greedy, TWO_OPT_BUDGET)
+        finished = time.perf_counter()
+        moves = reorder_moves(order.tolist())
+        planned = time.perf_counter()
+        costs = f"{path_cost(distances, np.arange(n)):.0f} > {path_cost(distances, greedy):.0f} > {path_cost(distances, order):.0f}"
+        print(f"{n:>7} {(built - started) * 1000:>6.0f}ms {(nn_done - built) * 1000:>6.0f}ms "
+              f"{(finished - nn_done) * 1000:>6.0f}ms {(planned - finished) * 1000:>6.0f}ms {costs:>22} {len(moves):>6}")
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES)
@@ -1,19 +1,20 @@
 # backend/main.py
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, RedirectResponse
+from fastapi.responses import RedirectResponse
 import logging
 import os
 import shutil
 from pathlib import Path
 from dotenv import load_dotenv
+from static_assets import StaticAssetStore, SPAStaticFiles
+from structured_logging import DroppingQueueHandler, RequestIdMiddleware, configure_logging
 
 # Load environment variables from .env file
 load_dotenv()
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+# Configure logging: JSON records through a background writer thread
+configure_logging()
 logger = logging.getLogger(__name__)
 
 # Create FastAPI app
@@ -68,18 +69,23 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Request-ID", "ETag"],
 )
+app.add_middleware(RequestIdMiddleware)
 
 # Import and include routers with error handling
 try:
-    from api import auth, playlist, search, brands
+    from api import auth, playlist, search, brands, catalog
+    from api.metrics import metrics
+    metrics.register_gauge("logging.dropped", lambda: DroppingQueueHandler.dropped)
     
     # Include routers with basic error handling
     for router_info in [
         (auth, "/auth", "auth"),
         (playlist, "/playlist", "playlist"),
         (search, "/search", "search"),
-        (brands, "/brands", "brands")
+        (brands, "/brands", "brands"),
+        (catalog, "/catalog", "catalog")
     ]:
         try:
             router, prefix, tag = router_info
@@ -92,10 +98,12 @@ except ImportError as e:
     logger.warning(f"Some API modules could not be imported: {str(e)}")
     logger.info("Continuing with limited functionality")
 
+# Prefixes that must never fall back to the SPA
+API_PREFIXES = ("/api/", "/auth/", "/playlist/", "/search/", "/brands/", "/catalog/", "/health", "/metrics", "/debug-static")
+
 # Function to check if path is an API route
 def is_api_route(path: str) -> bool:
-    api_prefixes = ("/api/", "/auth/", "/playlist/", "/search/", "/brands/", "/health", "/debug-static")
-    return path.startswith(api_prefixes)
+    return path.startswith(API_PREFIXES)
 
 @app.get("/health")
 async def health_check():
@@ -118,25 +126,21 @@ async def health_check():
         "environment": os.getenv("ENVIRONMENT", "development")
     }
 
+@app.get("/metrics")
+async def get_metrics():
+    """Per-worker counters, gauges and timings"""
+    from api.metrics import metrics
+    return metrics.snapshot()
+
 # Handle Spotify callback at root level
 @app.get("/callback")
 async def spotify_callback(code: str, state: str = None):
     """Redirect Spotify callback to auth router"""
     return RedirectResponse(url=f"/auth/callback?code={code}&state={state}")
 
-# Serve static files from the root directory
-app.mount("/", StaticFiles(directory=str(static_path), html=True), name="root")
-
-# Catch-all route for SPA - this should be the last route
-@app.get("/{full_path:path}")
-async def serve_spa(full_path: str, request: Request):
-    """Serve the SPA for all other routes"""
-    if is_api_route(request.url.path):
-        raise HTTPException(status_code=404, detail="API route not found")
-        
-    index_path = static_path / "index.html"
-    if not index_path.exists():
-        logger.error(f"index.html not found at {index_path}")
-        raise HTTPException(status_code=500, detail="Frontend assets not found")
-        
-    return FileResponse(str(index_path))
\ No newline at end of file
+# Load the frontend build into memory once, with precompressed variants
+static_store = StaticAssetStore(static_path)
+static_store.load()
+
+# Serve static files and the SPA fallback from memory - this must be mounted last
+app.mount("/", SPAStaticFiles(static_store, api_prefixes=API_PREFIXES), name="root")
@@ -0,0 +1,233 @@
+"""
+In-memory static asset serving for the frontend build.
+
+Assets are read once at startup, gzip/brotli variants are precomputed for
+compressible types and responses are negotiated on Accept-Encoding with
+ETags and cache headers suited to the CRA build layout.
+"""
+import gzip
+import hashlib
+import logging
+import mimetypes
+import re
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from starlette.requests import Request
+from starlette.responses import FileResponse, Response
+from starlette.types import Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always available
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/javascript",
+    "application/json",
+    "application/manifest+json",
+    "application/xml",
+    "image/svg+xml",
+)
+MIN_COMPRESS_SIZE = 512  # bytes, smaller bodies are not worth the extra headers
+MAX_INMEMORY_SIZE = 8 * 1024 * 1024  # larger files are streamed from disk
+
+# CRA emits content-hashed names such as static/js/main.3f2a91c4.js
+HASHED_ASSET_RE = re.compile(r"^static/(js|css|media)/.+\.[0-9a-f]{8,}(\.chunk)?\.[a-z0-9]+$")
+
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+DEFAULT_CACHE = "public, max-age=3600"
+NO_CACHE = "no-cache"
+
+# Preferred order when the client accepts several encodings equally
+ENCODING_PREFERENCE = ("br", "gzip", "identity")
+
+
+class StaticAsset:
+    """A single file with its precomputed encodings."""
+
+    __slots__ = ("path", "media_type", "cache_control", "variants", "etags", "file_path")
+
+    def __init__(self, path: str, media_type: str, cache_control: str):
+        self.path = path
+        self.media_type = media_type
+        self.cache_control = cache_control
+        self.variants: Dict[str, bytes] = {}
+        self.etags: Dict[str, str] = {}
+        self.file_path: Optional[Path] = None
+
+
+def parse_accept_encoding(header: Optional[str]) -> Dict[str, float]:
+    """Parse an Accept-Encoding header into {encoding: q}."""
+    accepted: Dict[str, float] = {}
+    if not header:
+        return accepted
+    for part in header.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        name, _, params = part.partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip().lower()] = q
+    return accepted
+
+
+def choose_encoding(header: Optional[str], available: List[str]) -> str:
+    """Pick the best available encoding for the client, falling back to identity."""
+    accepted = parse_accept_encoding(header)
+    wildcard = accepted.get("*")
+    best, best_q = "identity", 0.0
+    for encoding in ENCODING_PREFERENCE:
+        if encoding not in available or encoding == "identity":
+            continue
+        q = accepted.get(encoding, wildcard if wildcard is not None else 0.0)
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def cache_control_for(path: str) -> str:
+    if path == "index.html":
+        return NO_CACHE
+    if HASHED_ASSET_RE.match(path):
+        return IMMUTABLE_CACHE
+    return DEFAULT_CACHE
+
+
+class StaticAssetStore:
+    """Loads a static directory into memory and precomputes compressed variants."""
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        self.assets: Dict[str, StaticAsset] = {}
+        self.index: Optional[StaticAsset] = None
+
+    def load(self) -> None:
+        assets: Dict[str, StaticAsset] = {}
+        raw_bytes = compressed_bytes = 0
+        if self.directory.exists():
+            for file_path in sorted(self.directory.rglob("*")):
+                if not file_path.is_file():
+                    continue
+                rel_path = file_path.relative_to(self.directory).as_posix()
+                try:
+                    asset = self._load_asset(rel_path, file_path)
+                except OSError as e:
+                    logger.error(f"Error loading static asset {rel_path}: {str(e)}")
+                    continue
+                assets[rel_path] = asset
+                if "identity" in asset.variants:
+                    raw_bytes += len(asset.variants["identity"])
+                    compressed_bytes += min(len(v) for v in asset.variants.values())
+
+        self.assets = assets
+        self.index = assets.get("index.html")
+        logger.info(
+            f"Loaded {len(assets)} static assets ({raw_bytes} bytes, "
+            f"{compressed_bytes} bytes smallest encodings, brotli={'on' if brotli else 'off'})"
+        )
+
+    def _load_asset(self, rel_path: str, file_path: Path) -> StaticAsset:
+        media_type = mimetypes.guess_type(rel_path)[0] or "application/octet-stream"
+        asset = StaticAsset(rel_path, media_type, cache_control_for(rel_path))
+
+        if file_path.stat().st_size > MAX_INMEMORY_SIZE:
+            asset.file_path = file_path
+            stat = file_path.stat()
+            asset.etags["identity"] = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+            return asset
+
+        body = file_path.read_bytes()
+        digest = hashlib.sha1(body).hexdigest()[:20]
+        asset.variants["identity"] = body
+        asset.etags["identity"] = f'"{digest}"'
+
+        if len(body) >= MIN_COMPRESS_SIZE and media_type.startswith(COMPRESSIBLE_TYPES):
+            gz = gzip.compress(body, compresslevel=9, mtime=0)
+            if len(gz) < len(body):
+                asset.variants["gzip"] = gz
+                asset.etags["gzip"] = f'"{digest}-gz"'
+            if brotli is not None:
+                br = brotli.compress(body, quality=11)
+                if len(br) < len(body):
+                    asset.variants["br"] = br
+                    asset.etags["br"] = f'"{digest}-br"'
+        return asset
+
+    def get(self, path: str) -> Optional[StaticAsset]:
+        return self.assets.get(path.lstrip("/"))
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    # Weak comparison, as recommended for If-None-Match
+    return etag in candidates or f"W/{etag}" in candidates
+
+
+def asset_response(asset: StaticAsset, request: Request) -> Response:
+    """Build a negotiated response for an asset, honouring If-None-Match."""
+    if asset.file_path is not None:
+        return FileResponse(
+            str(asset.file_path),
+            media_type=asset.media_type,
+            headers={"Cache-Control": asset.cache_control, "ETag": asset.etags["identity"]},
+        )
+
+    encoding = choose_encoding(request.headers.get("accept-encoding"), list(asset.variants))
+    etag = asset.etags[encoding]
+    headers = {
+        "Cache-Control": asset.cache_control,
+        "ETag": etag,
+        "Vary": "Accept-Encoding",
+    }
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    return Response(content=asset.variants[encoding], media_type=asset.media_type, headers=headers)
+
+
+class SPAStaticFiles:
+    """
+    ASGI app serving the in-memory build, falling back to index.html for
+    client-side routes and 404 for unknown API paths.
+    """
+
+    def __init__(self, store: StaticAssetStore, api_prefixes: Tuple[str, ...] = ()):
+        self.store = store
+        self.api_prefixes = api_prefixes
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            return
+        request = Request(scope, receive)
+        path = scope["path"]
+
+        if request.method not in ("GET", "HEAD"):
+            response = Response(status_code=405, headers={"Allow": "GET, HEAD"})
+        elif path.startswith(self.api_prefixes):
+            response = Response('{"detail":"API route not found"}', status_code=404, media_type="application/json")
+        else:
+            asset = self.store.get(path)
+            if asset is None:
+                asset = self.store.index
+            if asset is None:
+                logger.error(f"index.html not found in {self.store.directory}")
+                response = Response('{"detail":"Frontend assets not found"}', status_code=500, media_type="application/json")
+            else:
+                response = asset_response(asset, request)
+
+        await response(scope, receive, send)
@@ -0,0 +1,202 @@
+"""
+Non-blocking structured logging.
+
+Request handlers only put records on a bounded in-memory queue; a
+QueueListener thread formats them as one JSON object per line and writes
+them out, so a slow log drain never adds latency to a request. When the
+queue is full, records are dropped and counted instead of blocking.
+
+Every record carries the request ID (taken from X-Request-ID or generated,
+and echoed in the response) and a normalized route. Below WARNING, records
+are rate-limited per route and logger, and can opt into sampling with
+`extra={"sample": 0.1}`. Long messages and payload fields are truncated.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional, Tuple
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()  # json or text
+LOG_QUEUE_SIZE = 10000  # records waiting for the writer thread
+ROUTE_LOG_RATE = float(os.getenv("ROUTE_LOG_RATE", "20"))  # records per second per route and logger below WARNING
+ROUTE_LOG_BURST = 50
+MAX_MESSAGE_CHARS = 1000
+MAX_ERROR_CHARS = 8000  # errors keep more, for tracebacks
+MAX_FIELD_CHARS = 300
+REQUEST_ID_HEADER = "x-request-id"
+
+request_id: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+request_route: ContextVar[Optional[str]] = ContextVar("request_route", default=None)
+
+# Standard LogRecord attributes; anything else on a record came from `extra`
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+_ID_SEGMENT = re.compile(r"^(?=.*\d)[A-Za-z0-9_-]{6,}$|^[A-Za-z0-9]{20,}$")
+
+
+def normalize_route(path: str) -> str:
+    """'/playlist/37i9dQZF1DXcBWIGoYBM5M/tracks' -> '/playlist/{id}/tracks'"""
+    return "/".join("{id}" if _ID_SEGMENT.match(part) else part for part in path.split("/"))
+
+
+def truncate(value: Any, limit: int = MAX_FIELD_CHARS) -> Any:
+    if isinstance(value, str):
+        return value if len(value) <= limit else f"{value[:limit]}... ({len(value)} chars)"
+    if isinstance(value, (int, float, bool)) or value is None:
+        return value
+    if isinstance(value, dict):
+        return {str(k): truncate(v, limit) for k, v in list(value.items())[:20]}
+    if isinstance(value, (list, tuple, set)):
+        items = list(value)
+        kept = [truncate(v, limit) for v in items[:10]]
+        return kept + [f"... ({len(items)} items)"] if len(items) > 10 else kept
+    return truncate(str(value), limit)
+
+
+class ContextFilter(logging.Filter):
+    """Stamps records with the request context; runs on the caller's side of the queue"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id.get()
+        record.route = request_route.get()
+        return True
+
+
+class RateLimitFilter(logging.Filter):
+    """Token bucket per (route, logger) for records below WARNING, plus opt-in sampling"""
+
+    def __init__(self, rate: float = ROUTE_LOG_RATE, burst: int = ROUTE_LOG_BURST):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        self._buckets: Dict[Tuple[Optional[str], str], list] = {}  # key -> [tokens, updated, suppressed]
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        sample = getattr(record, "sample", None)
+        if sample is not None and random.random() >= sample:
+            return False
+        key = (getattr(record, "route", None), record.name)
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if len(self._buckets) > 1000:
+                    self._buckets.clear()
+                bucket = self._buckets[key] = [float(self.burst), now, 0]
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if bucket[0] < 1:
+                bucket[2] += 1
+                return False
+            bucket[0] -= 1
+            if bucket[2]:
+                record.suppressed = bucket[2]
+                bucket[2] = 0
+        return True
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Never blocks the caller: a full queue drops the record"""
+
+    dropped = 0
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            DroppingQueueHandler.dropped += 1
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = super().prepare(record)
+        limit = MAX_ERROR_CHARS if record.levelno >= logging.ERROR else MAX_MESSAGE_CHARS
+        record.msg = truncate(record.msg, limit)
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and key != "sample" and value is not None:
+                entry[key] = truncate(value)
+        return json.dumps(entry, default=str)
+
+
+class RequestIdMiddleware:
+    """Binds a request ID and route for the request's log records and returns the ID as X-Request-ID"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope.get("headers") or [])
+        incoming = headers.get(REQUEST_ID_HEADER.encode(), b"").decode("latin-1")[:64]
+        rid = incoming or uuid.uuid4().hex[:16]
+        id_token = request_id.set(rid)
+        route_token = request_route.set(normalize_route(scope.get("path", "")))
+
+        async def send_with_id(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(REQUEST_ID_HEADER.encode(), rid.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            request_route.reset(route_token)
+            request_id.reset(id_token)
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def configure_logging() -> None:
+    """Route the root logger through the queue; safe to call more than once"""
+    global _listener
+    if _listener is not None:
+        return
+    output = logging.StreamHandler(sys.stdout)
+    if LOG_FORMAT == "json":
+        output.setFormatter(JsonFormatter())
+    else:
+        output.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s"))
+
+    log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    handler = DroppingQueueHandler(log_queue)
+    handler.addFilter(ContextFilter())
+    handler.addFilter(RateLimitFilter())
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(LOG_LEVEL)
+
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
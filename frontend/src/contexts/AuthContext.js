@@ -59,9 +59,11 @@ export function AuthProvider({ children }) {
       lastValidationRef.current = now;
 
       if (data.token_info) {
-        localStorage.setItem('spotify_token', JSON.stringify(data.token_info));
-        setTokenInfo(data.token_info);
-        setToken(data.token_info.access_token);
+        // The refresh token is only sent back to callers that presented it
+        const merged = { ...tokenInfoToValidate, ...data.token_info };
+        localStorage.setItem('spotify_token', JSON.stringify(merged));
+        setTokenInfo(merged);
+        setToken(merged.access_token);
       }
 
       return data.valid;
@@ -99,7 +101,7 @@ export function AuthProvider({ children }) {
         throw new Error('Failed to refresh token');
       }
 
-      const newTokenInfo = await response.json();
+      const newTokenInfo = { ...tokenInfo, ...(await response.json()) };
       localStorage.setItem('spotify_token', JSON.stringify(newTokenInfo));
       setTokenInfo(newTokenInfo);
       setToken(newTokenInfo.access_token);
@@ -108,7 +110,7 @@ export function AuthProvider({ children }) {
       console.error('Token refresh error:', e);
       return false;
     }
-  }, [token, tokenInfo?.refresh_token]);
+  }, [token, tokenInfo]);
 
   const logout = useCallback(() => {
     localStorage.removeItem('spotify_token');